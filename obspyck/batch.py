@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------
+# Filename: batch.py
+#  Purpose: Automatic event processing without GUI
+#   Author: agent
+#    Email: agent@local
+#  License: GPLv2
+#
+# Copyright (C) 2026 agent
+# -------------------------------------------------------------------
+"""
+Automatic processing of events without GUI (``obspyck batch``), e.g. to
+pre-process events on a server and only review them in the GUI afterwards.
+
+For every event time, waveforms and metadata are fetched same as for the GUI,
+picks are set with the AR picker, the event is located, amplitudes are
+measured and magnitudes calculated and the event is saved as QuakeML.
+Events are processed in parallel in several processes.
+"""
+import copy
+import itertools
+import multiprocessing
+import optparse
+import os
+import signal
+import sys
+
+from obspy import UTCDateTime, read_events
+
+from .core import ObsPyckCore
+from .util import (
+    fetch_waveforms_with_metadata, read_config, adjacent_peaks, DiskCache,
+    gse2_calibrated_amplitude, COMMANDLINE_OPTIONS,
+    BATCH_COMMANDLINE_OPTIONS)
+
+# file in output directory that lists times of all processed events
+CHECKPOINT_FILENAME = "obspyck_batch_done.txt"
+
+
+class BatchProcessor(ObsPyckCore):
+    """
+    Automatic processing of the waveforms of one event time window.
+
+    Settings are read from config section ``[batch]`` (see example config).
+    """
+    def __init__(self, clients, streams, options, config, inventories):
+        ObsPyckCore.__init__(self, clients, streams, options, config)
+        # events are already processed in parallel processes
+        if (options.processes or 1) > 1:
+            self.arpicker_workers = 1
+        self._setup_external_programs()
+        try:
+            self.info('Using temporary directory: ' + self.tmp_dir)
+            # the temporary directory is removed after processing, input
+            # data is kept in the waveform cache instead (if requested)
+            warn_msg = self._prepare_streams(inventories,
+                                             save_input_data=False)
+            if warn_msg:
+                self.error(warn_msg)
+        except:
+            self.cleanup()
+            raise
+
+    def cleanup(self):
+        """
+        Remove temporary directory and all contents.
+        """
+        self._remove_tmp_dir()
+
+    def process(self):
+        """
+        Sets picks with the AR picker, locates the event, measures amplitudes
+        and calculates magnitudes (if the event could be located).
+
+        :returns: True if the event could be located.
+        """
+        self._arpicker()
+        try:
+            located = self._locate()
+            if located:
+                self.calculateEpiHypoDists()
+            # amplitudes only depend on picks
+            self.setAutomaticAmplitudes()
+            if located:
+                self.updateMagnitude()
+        finally:
+            # same event ID when processing the same event again
+            event = self.catalog[0]
+            if event.origins:
+                time = event.origins[0].time
+            else:
+                time = self.TREF
+            self.setXMLEventID(time.strftime('%Y%m%d%H%M%S'))
+        return located
+
+    def _locate(self):
+        """
+        Locates the event with the locator set in the config.
+
+        :returns: True if a new origin was set.
+        """
+        if not self.catalog[0].picks:
+            self.error("No picks set, can not locate event.")
+            return False
+        locator = self._get_config_value(
+            "batch", "locator", default="nlloc",
+            no_option_error_message=False)
+        if locator == "nlloc":
+            model = self._get_config_value(
+                "batch", "nlloc_model", default="BY",
+                no_option_error_message=False)
+            return self.locateNLLoc(model)
+        elif locator == "hyp2000":
+            return self.locateHyp2000()
+        elif locator:
+            msg = ("Unknown locator '%s' in config section [batch], not "
+                   "locating event.") % locator
+            self.error(msg)
+        return False
+
+    def setAutomaticAmplitudes(self):
+        """
+        Sets amplitudes for magnitude calculation on horizontal components of
+        all stations with picks. The largest peak-to-peak amplitude of two
+        adjacent half cycles (see adjacent_peaks()) is measured on the raw
+        data in a window from the first to the last pick of the station,
+        extended by the time set in the config.
+        """
+        window = self._get_config_value(
+            "batch", "amplitude_window", default=5.0,
+            no_option_error_message=False, type=float)
+        for st in self.streams_bkp:
+            net = st[0].stats.network
+            sta = st[0].stats.station
+            picks = [p for p in self.getPicks(net, sta) if p.time]
+            if not picks:
+                continue
+            starttime = min(p.time for p in picks)
+            endtime = max(p.time for p in picks) + window
+            for tr in st.select(component="[NE]"):
+                tr_ = tr.slice(starttime, endtime)
+                if tr_.stats.npts < 3:
+                    continue
+                data = tr_.data - tr_.data.mean()
+                peaks = adjacent_peaks(data)
+                if peaks is None:
+                    continue
+                values = [(tr_.stats.starttime + i * tr_.stats.delta,
+                           gse2_calibrated_amplitude(tr, float(data[i])))
+                          for i in peaks]
+                ampl = self.getAmplitude(seed_string=tr.id, setdefault=True)
+                ampl.set_general_info()
+                ampl.setLow(*values[0])
+                ampl.setHigh(*values[1])
+                self.info("Amplitude set on %s: %s" % (
+                    tr.id, ampl.get_p2p()))
+        self._catalog_changed()
+
+    def save_event(self, directory):
+        """
+        Saves the event as QuakeML file in the given directory.
+
+        :returns: Filename of the QuakeML file.
+        """
+        name = str(self.catalog[0].resource_id).split("/")[-1]
+        filename = os.path.join(directory, "obspyck_%s.xml" % name)
+        data = self.get_QUAKEML_string()
+        self.critical("writing xml as %s" % filename)
+        with open(filename, "wt") as fh:
+            fh.write(data)
+        return filename
+
+
+def _waveform_cache_key(time, options, args, config):
+    """
+    Key of the waveforms and metadata of one event time window in the
+    waveform cache, depending on everything that determines which data gets
+    fetched.
+    """
+    if options.starttime_offset is None:
+        starttime_offset = config.getfloat("base", "starttime_offset")
+    else:
+        starttime_offset = options.starttime_offset
+    if options.duration is None:
+        duration = config.getfloat("base", "duration")
+    else:
+        duration = options.duration
+    return repr((str(UTCDateTime(time)), starttime_offset, duration,
+                 sorted(options.station_combinations),
+                 sorted(options.seed_ids), sorted(args),
+                 config.getboolean("base", "no_metadata")))
+
+
+def process_event(time, options, args, config, clients=None,
+                  waveform_cache=None):
+    """
+    Fetches waveforms and metadata for one event time (see
+    fetch_waveforms_with_metadata()), processes the event and saves it in
+    the output directory given in options.
+
+    :type clients: dict
+    :param clients: Already connected clients to reuse (see
+        connect_to_server()).
+    :type waveform_cache: :class:`~obspyck.util.DiskCache`
+    :param waveform_cache: Cache of fetched waveforms and metadata.
+    :returns: Filename of the QuakeML file and whether the event could be
+        located.
+    """
+    options = copy.copy(options)
+    options.time = str(time)
+    if clients is None:
+        clients = {}
+    data = None
+    if waveform_cache is not None:
+        key = _waveform_cache_key(time, options, args, config)
+        data = waveform_cache.get(key)
+    if data is None:
+        (clients, streams, inventories) = \
+            fetch_waveforms_with_metadata(options, args, config, clients)
+        if waveform_cache is not None:
+            waveform_cache.put(key, (streams, inventories))
+    else:
+        print "using cached waveforms and metadata for event at {}".format(
+            time)
+        (streams, inventories) = data
+    processor = BatchProcessor(clients, streams, options, config, inventories)
+    try:
+        located = processor.process()
+        filename = processor.save_event(options.output_dir)
+    finally:
+        processor.cleanup()
+    return filename, located
+
+
+# state of a worker process (see _init_worker())
+_WORKER = {}
+
+
+def _init_worker(options, args, config):
+    """
+    Sets up a worker process for processing events. Connections to servers
+    are reused for all events processed in the same worker process.
+    Every event is processed in its own temporary directory, so external
+    programs of different events never share a working directory.
+    """
+    _WORKER['options'] = options
+    _WORKER['args'] = args
+    _WORKER['config'] = config
+    _WORKER['clients'] = {}
+    if options.waveform_cache:
+        _WORKER['waveform_cache'] = DiskCache(options.waveform_cache)
+    else:
+        _WORKER['waveform_cache'] = None
+
+
+def _init_worker_process(options, args, config):
+    """
+    Initializer of pool worker processes (see _init_worker()).
+    """
+    # interrupts are handled in the main process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_worker(options, args, config)
+
+
+def _process_event_in_worker(time):
+    """
+    Processes one event in a worker process (see _init_worker()).
+
+    :returns: Event time, filename of the QuakeML file (or None if processing
+        failed), whether the event could be located and the error message
+        if processing failed.
+    """
+    try:
+        filename, located = process_event(
+            time, _WORKER['options'], _WORKER['args'], _WORKER['config'],
+            clients=_WORKER['clients'],
+            waveform_cache=_WORKER['waveform_cache'])
+    except Exception as e:
+        return time, None, False, "{}: {}".format(e.__class__.__name__, e)
+    return time, filename, located, None
+
+
+def read_checkpoint(filename):
+    """
+    Reads times of already processed events from the checkpoint file.
+
+    :returns: set of event times (as strings)
+    """
+    if not os.path.isfile(filename):
+        return set()
+    with open(filename, "rt") as fh:
+        return set(line.strip() for line in fh if line.strip())
+
+
+def main(argv=None, prog=None):
+    """
+    Automatic processing of events without GUI.
+
+    Events are processed in parallel in a pool of worker processes. Every
+    processed event is recorded in a checkpoint file in the output directory,
+    so that an interrupted run can simply be started again.
+    """
+    usage = (
+        "\n %prog -t 2010-08-01T12:00:00 [-t ...] -d 30 "
+        "[local waveform or station metadata files]"
+        "\n %prog --catalog events.xml -o -30 -d 60 "
+        "[local waveform or station metadata files]"
+        "\n\nGet all available options with: %prog -h")
+    parser = optparse.OptionParser(usage, prog=prog)
+    for opt_args, opt_kwargs in COMMANDLINE_OPTIONS:
+        if "--time" in opt_args or "--event" in opt_args:
+            continue
+        parser.add_option(*opt_args, **opt_kwargs)
+    for opt_args, opt_kwargs in BATCH_COMMANDLINE_OPTIONS:
+        parser.add_option(*opt_args, **opt_kwargs)
+    (options, args) = parser.parse_args(argv)
+
+    times = [UTCDateTime(time) for time in options.times]
+    if options.catalog:
+        for event in read_events(options.catalog):
+            origin = event.preferred_origin() or (
+                event.origins and event.origins[0] or None)
+            if origin is None:
+                print >> sys.stderr, \
+                    "Skipping event without origin: %s" % event.resource_id
+                continue
+            times.append(origin.time)
+    if not times:
+        parser.error('No events to process, use "-t" or "--catalog".')
+    if options.processes is not None and options.processes < 1:
+        parser.error('Number of processes must be at least 1.')
+
+    config_file, config = read_config(options.config_file)
+    print "using config file: {}".format(config_file)
+    if not os.path.isdir(options.output_dir):
+        os.makedirs(options.output_dir)
+
+    checkpoint_file = os.path.join(options.output_dir, CHECKPOINT_FILENAME)
+    done = read_checkpoint(checkpoint_file)
+    todo = [time for time in times if str(time) not in done]
+    if len(todo) < len(times):
+        print "skipping {} already processed events (see {})".format(
+            len(times) - len(todo), checkpoint_file)
+
+    processes = options.processes or multiprocessing.cpu_count()
+    processes = min(processes, len(todo)) or 1
+    options.processes = processes
+    if processes == 1:
+        # no need for worker processes
+        _init_worker(options, args, config)
+        results = itertools.imap(_process_event_in_worker, todo)
+        pool = None
+    else:
+        print "processing {} events in {} processes".format(
+            len(todo), processes)
+        pool = multiprocessing.Pool(processes, _init_worker_process,
+                                    (options, args, config))
+        results = pool.imap_unordered(_process_event_in_worker, todo)
+
+    failed = []
+    try:
+        with open(checkpoint_file, "at") as checkpoint:
+            for time, filename, located, error in results:
+                if error is not None:
+                    print >> sys.stderr, \
+                        "Error processing event at {}: {}".format(time, error)
+                    failed.append(time)
+                    continue
+                if not located:
+                    print >> sys.stderr, \
+                        "Event at {} could not be located.".format(time)
+                print "saved event at {} as {}".format(time, filename)
+                checkpoint.write(str(time) + "\n")
+                checkpoint.flush()
+    except KeyboardInterrupt:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        raise
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if failed:
+        print >> sys.stderr, "Processing failed for {} of {} events.".format(
+            len(failed), len(todo))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
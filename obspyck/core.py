@@ -0,0 +1,2300 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------
+# Filename: core.py
+#  Purpose: Event processing of ObsPyck without GUI
+#   Author: agent (based on obspyck.py by Tobias Megies, Lion Krischer)
+#    Email: agent@local
+#  License: GPLv2
+#
+# Copyright (C) 2010 Tobias Megies, Lion Krischer
+# Copyright (C) 2026 agent
+# -------------------------------------------------------------------
+"""
+Event processing (picking, location, magnitudes, QuakeML output) on the
+waveforms of one event time window.
+
+Does not depend on any GUI components, the GUI (:class:`obspyck.obspyck.ObsPyck`)
+and batch processing (:mod:`obspyck.batch`) are built on top of
+:class:`ObsPyckCore`.
+"""
+import hashlib
+import logging
+import os
+import re
+import shutil
+import sys
+import warnings
+from collections import OrderedDict
+from ConfigParser import NoOptionError, NoSectionError
+from StringIO import StringIO
+
+import numpy as np
+
+from obspy import UTCDateTime, Stream, Trace
+from obspy.core.event import CreationInfo, WaveformStreamID, \
+    OriginUncertainty, OriginQuality
+from obspy.core.util import AttribDict
+from obspy.geodetics.base import kilometer2degrees
+from obspy.signal.rotate import rotate_zne_lqt, rotate_ne_rt
+
+from .util import (
+    _save_input_data, LOGLEVELS, setup_external_programs,
+    merge_check_and_cleanup_streams, cleanup_streams_without_metadata,
+    coords2azbazinc, map_rotated_channel_code, PROGRAMS, gk2lonlat,
+    errorEllipsoid2CartesianErrors, readNLLocScatter, ONE_SIGMA, VERSION_INFO,
+    getPickForArrival, LRUCache, response_amplitude, local_magnitudes,
+    BackgroundJobQueue,
+    StationGeometry, ParallelMap, ar_pick_prepare, ar_pick_prepared,
+    coincidence_windows)
+from .nlloc import read_nlloc_hyp, read_nlloc_model
+from .hyp2000 import read_hyp2000_prt
+from .event_helper import Catalog, Event, Origin, Pick, Arrival, \
+    Magnitude, StationMagnitude, StationMagnitudeContribution, ID_ROOT, \
+    Amplitude
+
+NAMESPACE = "http://erdbeben-in-bayern.de/xmlns/0.1"
+NSMAP = {"edb": NAMESPACE}
+
+
+class ObsPyckCore(object):
+    """
+    Event processing on the waveforms of one event time window, without any
+    GUI.
+
+    Parameters that are set in the GUI (filter, water level, ...) are taken
+    from the config file (section ``[gui_defaults]``) by default, the GUI
+    overrides the respective ``_get_*`` methods.
+    """
+    def __init__(self, clients, streams, options, config):
+        """
+        Sets up logging, reference times and an empty event.
+        Streams are not checked/cleaned up yet (see _prepare_streams()).
+        """
+        self.clients = clients
+        self.streams = streams
+        self.options = options
+        self.config = config
+
+        # TREF is the global reference time (zero in relative time scales)
+        if options.time is not None:
+            self.TREF = UTCDateTime(options.time)
+        else:
+            self.TREF = UTCDateTime(config.get("base", "time"))
+        if options.starttime_offset is not None:
+            self.T0 = self.TREF + options.starttime_offset
+        else:
+            self.T0 = self.TREF + config.getfloat("base", "starttime_offset")
+        # T1 is the end time specified by user
+        if options.duration is not None:
+            self.T1 = self.T0 + options.duration
+        else:
+            self.T1 = self.T0 + config.getfloat("base", "duration")
+
+        # save username of current user
+        try:
+            self.username = os.getlogin()
+        except:
+            try:
+                self.username = os.environ['USER']
+            except:
+                self.username = "unknown"
+
+        self._setup_logging()
+
+        # distances/azimuths of all stations for the current origin
+        # (see get_station_geometry())
+        self._station_geometry = None
+        self._station_coordinates = None
+        # network magnitude and running sums over its station magnitudes
+        # (see updateNetworkMag())
+        self._network_mag = None
+        # saves raw input data in the background (see _prepare_streams())
+        self.input_data_queue = None
+        # number of threads for the AR picker, None to use config setting
+        # (see _start_arpicker())
+        self.arpicker_workers = None
+        # instrument response amplitudes used in magnitude calculation,
+        # per channel and frequency
+        self.response_amplitude_cache = LRUCache(size=1000)
+        # parsed locator results keyed by a hash of the program input, so
+        # that locating again with unchanged picks does not rerun anything
+        self.locator_cache = LRUCache(size=self._get_config_value(
+            "base", "locator_cache_size", default=10,
+            no_option_error_message=False, type=int))
+        self.external_program_timeout = self._get_config_value(
+            "base", "external_program_timeout", default=300.0,
+            no_option_error_message=False, type=float)
+
+        # QuakeML serialization of the catalog is cached and only redone
+        # when the catalog version counter changed
+        self._catalog_version = 0
+        self._quakeml_cache = (None, None)
+        self.catalog = Catalog()
+        event = Event()
+        event.set_creation_info_username(self.username)
+        self.catalog.events = [event]
+        self.setXMLEventID()
+
+    def _setup_logging(self):
+        """
+        Logging of normal messages (depending on verbosity set in config) to
+        stdout and of errors to stderr.
+        """
+        log1 = logging.getLogger("log1")
+        # only ever log once per message, even if set up repeatedly
+        log1.handlers = []
+        sh = logging.StreamHandler(sys.stdout)
+        sh.setFormatter(logging.Formatter('%(message)s'))
+        log1.addHandler(sh)
+        log2 = logging.getLogger("log2")
+        log2.handlers = []
+        sh = logging.StreamHandler(sys.stderr)
+        sh.setFormatter(logging.Formatter('%(message)s'))
+        log2.addHandler(sh)
+        log2.setLevel("DEBUG")
+        self.log2 = log2
+        self.error = self.log2.error
+        # XXX TODO: parse verbose flag from command line
+        loglevel = LOGLEVELS.get(self.config.get("base", "verbosity"), None)
+        if loglevel is None:
+            loglevel = "CRITICAL"
+            self.error("unknown loglevel ('%s'), using loglevel 'normal'." % (
+                self.config.get("base", "verbosity")))
+        log1.setLevel(loglevel)
+        self.log1 = log1
+        self.info = self.log1.info
+        self.critical = self.log1.critical
+        self.debug = self.log1.debug
+        logging.getLogger().handlers = []
+
+    def _setup_external_programs(self):
+        """
+        Sets up the temporary directory with working directories of external
+        programs (see setup_external_programs()).
+        """
+        try:
+            self.tmp_dir = setup_external_programs(self.options, self.config)
+        except IOError:
+            msg = "Cannot find external programs dir, localization " + \
+                  "methods/functions are deactivated"
+            warnings.warn(msg)
+
+    def _prepare_streams(self, inventories, save_input_data=True):
+        """
+        Saves input data to the temporary directory (in the background, see
+        _start_saving_input_data()) and checks/cleans up streams (in place)
+        so that they conform with what ObsPyck expects.
+
+        :type save_input_data: bool
+        :param save_input_data: Whether to save input data at all (e.g. not
+            needed if the data was read from a local cache).
+        :returns: Warning message of stream checks (see
+            merge_check_and_cleanup_streams()).
+        """
+        streams = self.streams
+        if save_input_data:
+            self._start_saving_input_data(streams, inventories)
+
+        (warn_msg, merge_msg, streams) = \
+                merge_check_and_cleanup_streams(streams, self.options,
+                                                self.config)
+
+        # if it's not empty show the merge info message now
+        if merge_msg:
+            self.info(merge_msg)
+        # exit if no streams are left after removing everything not suited.
+        if not streams:
+            err = "No streams left to work with after removing bad streams."
+            raise Exception(err)
+
+        # sort streams by station name
+        streams.sort(key=lambda st: st[0].stats['station'])
+        if not self.config.get("base", "no_metadata"):
+            streams = cleanup_streams_without_metadata(streams)
+        # original data is only held once, self.streams are views on the same
+        # stream objects unless processing modifies data (see _stream_view())
+        self.streams_bkp = list(streams)
+        # station coordinates and geometry are collected from new streams
+        self._station_coordinates = None
+        self._station_geometry = None
+        self._setup_4_letter_station_map()
+        return warn_msg
+
+    def _start_saving_input_data(self, streams, inventories):
+        """
+        Saves input raw data and metadata for eventual reuse in the temporary
+        directory (see _save_input_data()) in a background thread, unless
+        switched off in config. Only references to the data are handed to
+        the background thread, checking/cleaning up streams afterwards does
+        not modify input data arrays in place (see
+        merge_check_and_cleanup_streams()).
+        """
+        if not self._get_config_value(
+                "base", "save_input_data", default=True,
+                no_option_error_message=False, type=bool):
+            return
+        compression = self._get_config_value(
+            "base", "save_input_data_compression", default=None,
+            no_option_error_message=False) or None
+        streams = [Stream(traces=list(st.traces)) for st in streams]
+        self.input_data_queue = BackgroundJobQueue()
+        self.input_data_queue.submit(
+            "saving input data", _save_input_data,
+            args=(streams, list(inventories), self.tmp_dir),
+            kwargs={"compression": compression})
+
+    def _poll_input_data_queue(self):
+        """
+        Report when saving input data in the background finished or failed.
+        """
+        if self.input_data_queue is None:
+            return
+        for description, _, _, error in self.input_data_queue.poll():
+            if error is not None:
+                self.error("Error: %s failed: %s" % (description, error))
+            else:
+                self.info("Input data saved in %s" % self.tmp_dir)
+
+    def _stream_view(self, i, modify=False):
+        """
+        Returns stream i for processing/display and sets it in self.streams.
+        Original data in self.streams_bkp is never changed, it only gets
+        copied if processing is going to modify the data (modify=True).
+        Copies of all other streams are dropped again, so at most the data of
+        one station is held twice.
+
+        :type modify: bool
+        :param modify: Whether data of the returned stream will be modified
+            (e.g. filtered, rotated).
+        """
+        for j, st in enumerate(self.streams):
+            if j != i and st is not self.streams_bkp[j]:
+                self.streams[j] = self.streams_bkp[j]
+        st = self.streams_bkp[i]
+        if modify:
+            st = st.copy()
+        self.streams[i] = st
+        return st
+
+    def _remove_tmp_dir(self):
+        # do not remove files that are still being written
+        if self.input_data_queue is not None:
+            self.input_data_queue.join()
+            self._poll_input_data_queue()
+        try:
+            shutil.rmtree(self.tmp_dir)
+        except:
+            pass
+
+    def _get_config_value(self, section, key, default=None,
+                          no_option_error_message=True, type=str):
+        """
+        Get a config key value, optionally with default value if key is missing
+        showing a warning about it by default.
+
+        :param type: str, int, float or bool
+        """
+        if type is bool:
+            config_getter = self.config.getboolean
+        elif type is int:
+            config_getter = self.config.getint
+        elif type is float:
+            config_getter = self.config.getfloat
+        elif type is str:
+            config_getter = self.config.get
+        else:
+            raise ValueError()
+        try:
+            return config_getter(section, key)
+        except (NoOptionError, NoSectionError):
+            if no_option_error_message:
+                msg = ("No configuration option '{key}' in section "
+                       "'{section}'. Defaulting to '{default}'").format(
+                           key=key, section=section, default=str(default))
+                self.error(msg)
+            return default
+
+    def time_abs2rel(self, abstime):
+        """
+        Converts an absolute UTCDateTime to the time in ObsPyck's relative time
+        frame.
+
+        :type abstime: :class:`obspy.core.utcdatetime.UTCDateTime`
+        :param abstime: Absolute time in UTC.
+        :returns: time in ObsPyck's relative time as a float
+        """
+        return abstime - self.TREF
+
+    def time_rel2abs(self, reltime):
+        """
+        Converts a relative time in global relative time system to the absolute
+        UTCDateTime.
+
+        :type reltime: float
+        :param reltime: Relative time in ObsPyck's realtive time frame
+        :returns: absolute UTCDateTime
+        """
+        return self.TREF + reltime
+
+    def _get_filter_settings(self):
+        """
+        Returns filter type, filter options (as used in
+        :meth:`obspy.core.stream.Stream.filter`) and whether to apply a 50Hz
+        bandstop, as set in config section ``[gui_defaults]``.
+        """
+        type = self._get_config_value(
+            "gui_defaults", "filter_type", default="bandpass").lower()
+        highpass = self._get_config_value(
+            "gui_defaults", "filter_highpass", type=float)
+        lowpass = self._get_config_value(
+            "gui_defaults", "filter_lowpass", type=float)
+        options = {}
+        options['corners'] = self._get_config_value(
+            "gui_defaults", "filter_corners", default=4, type=int)
+        options['zerophase'] = self._get_config_value(
+            "gui_defaults", "filter_zerophase", default=False,
+            no_option_error_message=False, type=bool)
+        if type in ("bandpass", "bandstop"):
+            options['freqmin'] = highpass
+            options['freqmax'] = lowpass
+        elif type == "lowpass":
+            options['freq'] = lowpass
+        elif type == "highpass":
+            options['freq'] = highpass
+        bandstop_50hz = self._get_config_value(
+            "gui_defaults", "filter_50hz", default=False,
+            no_option_error_message=False, type=bool)
+        return type, options, bandstop_50hz
+
+    def _filter(self, stream):
+        """
+        Applies filter (see _get_filter_settings()) to Trace or Stream object.
+        Also displays a message.
+        """
+        # get taper settings from config
+        taper_max_length = self._get_config_value(
+            'base', 'taper_max_length', default=5, type=float)
+        taper_max_percentage = self._get_config_value(
+            'base', 'taper_max_percentage', default=0.05, type=float)
+        taper_type = self._get_config_value(
+            'base', 'taper_type', default='cosine', type=str)
+
+        type, options, bandstop_50hz = self._get_filter_settings()
+        msg = ""
+        if type in ("bandpass", "bandstop"):
+            msg = "%s (zerophase=%s): %.2f-%.2f Hz" % \
+                    (type, options['zerophase'],
+                     options['freqmin'], options['freqmax'])
+        elif type in ("lowpass", "highpass"):
+            msg = "%s (zerophase=%s): %.2f Hz" % \
+                    (type, options['zerophase'], options['freq'])
+        try:
+            stream.detrend("linear")
+            try:
+                stream.taper(max_percentage=taper_max_percentage,
+                             max_length=taper_max_length, type=taper_type)
+            except:
+                stream.taper()
+                msg = ('Error in stream tapering (old obspy version?). '
+                       'Tapering will be performed with Trace.taper() '
+                       'defaults.')
+                self.error(msg)
+            if bandstop_50hz:
+                for i_ in xrange(2):
+                    stream.filter("bandstop", freqmin=46, freqmax=54,
+                                  corners=2, zerophase=options['zerophase'])
+                msg2 = "50Hz Bandstop"
+                self.info(msg2)
+            stream.filter(type, **options)
+            self.info(msg)
+        except:
+            err = "Error during filtering. Showing unfiltered data."
+            self.error(err)
+
+    def _get_water_level(self):
+        """
+        Water level used in instrument correction, as set in config section
+        ``[gui_defaults]``.
+        """
+        return self._get_config_value(
+            "gui_defaults", "water_level", default=20.0,
+            no_option_error_message=False, type=float)
+
+    def _physical_units(self, stream):
+        """
+        Corrects to physical units (m/s or m or m/s**2), as specified by
+        configuration file.
+
+        :returns: Label of the physical units.
+        """
+        if isinstance(stream, Trace):
+            stream = Stream(traces=[stream])
+
+        water_level = self._get_water_level()
+        output_units = self._get_config_value('base', 'physical_units',
+                                              default='velocity')
+        if output_units == 'velocity':
+            output_units = 'VEL'
+            label = '[m/s]'
+        elif output_units == 'displacement':
+            output_units = 'DISP'
+            label = '[m]'
+        elif output_units == 'acceleration':
+            output_units = 'ACC'
+            label = '[m/s**2]'
+        else:
+            msg = ('Unrecognized physical units in configuration option '
+                   '"physical_units" in section "base": "{}". Defaulting '
+                   'to m/s for physical units switch.').format(output_units)
+            self.error(msg)
+            output_units = 'VEL'
+            label = '[m/s]'
+        msg = "Correcting to {} (water_level={:.1f}).".format(label,
+                                                              water_level)
+
+        try:
+            if 'parser' in stream[0].stats:
+                # metadata from SEED
+                for tr in stream:
+                    tr.simulate(seedresp={'filename': tr.stats.parser,
+                                          'units': output_units},
+                                remove_sensitivity=True,
+                                water_level=water_level)
+            elif 'response' in stream[0].stats:
+                # metadata from StationXML
+                stream.remove_response(output=output_units,
+                                       water_level=water_level)
+            else:
+                msg = ('No Response object attached to trace, '
+                       'can not convert to physical units:\n')
+                self.error(msg + str(stream[0].stats))
+            self.info(msg)
+        except Exception as e:
+            err = ("Error during instrument correction. Showing uncorrected "
+                   "data.\n" + str(e))
+            self.error(err)
+        return label
+
+    def _azbazinc(self, stream, origin):
+        """
+        Returns azimuth, backazimuth and incidence angle for the station of
+        the stream, from the station geometry table if origin is the current
+        origin (see coords2azbazinc()).
+        """
+        geometry = self.get_station_geometry()
+        stats = stream[0].stats
+        i = None
+        if geometry is not None and origin is self.catalog[0].origins[0]:
+            i = geometry.get((stats.network, stats.station, stats.location))
+        if i is None:
+            return coords2azbazinc(stream, origin)
+        return (geometry.azimuth[i], geometry.backazimuth[i],
+                geometry.incidence[i])
+
+    def _rotateLQT(self, stream, origin):
+        """
+        Rotates stream to LQT with respect to station location in first trace
+        of stream and origin information.
+        Exception handling should be done outside this function.
+        Also displays a message.
+        """
+        # calculate backazimuth and incidence from station/event geometry
+        azim, bazim, inci = self._azbazinc(stream, origin)
+        # replace ZNE data with rotated data
+        z = stream.select(component="Z")[0].data
+        n = stream.select(component="N")[0].data
+        e = stream.select(component="E")[0].data
+        self.info("using baz, takeoff: %s, %s" % (bazim, inci))
+        l, q, t = rotate_zne_lqt(z, n, e, bazim, inci)
+        for comp, data in zip("ZNE", (l, q, t)):
+            tr = stream.select(component=comp)[0]
+            tr.data = data
+            tr.stats.channel = map_rotated_channel_code(tr.stats.channel,
+                                                        "LQT")
+        self.info("Showing traces rotated to LQT.")
+
+    def _rotateZRT(self, stream, origin):
+        """
+        Rotates stream to ZRT with respect to station location in first trace
+        of stream and origin information.
+        Exception handling should be done outside this function.
+        Also displays a message.
+        """
+        # calculate backazimuth from station/event geometry
+        azim, bazim, inci = self._azbazinc(stream, origin)
+        # replace NE data with rotated data
+        n = stream.select(component="N")[0].data
+        e = stream.select(component="E")[0].data
+        self.info("using baz: %s" % bazim)
+        r, t = rotate_ne_rt(n, e, bazim)
+        stream.select(component="N")[0].data = r
+        stream.select(component="E")[0].data = t
+        for comp, data in zip("NE", (r, t)):
+            tr = stream.select(component=comp)[0]
+            tr.data = data
+            tr.stats.channel = map_rotated_channel_code(tr.stats.channel,
+                                                        "ZRT")
+        self.info("Showing traces rotated to ZRT.")
+
+    def _get_arpicker_parameters(self):
+        """
+        AR picker parameters from config section ``[ar_picker]`` as keyword
+        arguments for :func:`~obspyck.util.ar_pick_prepared` (without
+        sampling rate) or None if missing.
+        """
+        try:
+            params = {}
+            for key in ("f1", "f2", "sta_p", "lta_p", "sta_s", "lta_s",
+                        "l_p", "l_s"):
+                params[key] = self.config.getfloat("ar_picker", key)
+            for key in ("m_p", "m_s"):
+                params[key] = self.config.getint("ar_picker", key)
+        except (NoOptionError, NoSectionError) as e:
+            msg = ('To use AR Picker, you need to have a section [ar_picker] '
+                   'in your .obspyckrc with the following keys set: "f1", '
+                   '"f2", "lta_p", "sta_p", "lta_s", "sta_s", "m_p", "m_s", '
+                   '"l_p", "l_s" (compare documentation for '
+                   'obspy.signal.trigger.ar_pick\n%s') % str(e)
+            self.error(msg)
+            return None
+        return params
+
+    def _start_arpicker(self):
+        """
+        Start AR picker on all streams in the background, one station per
+        task in a thread pool (see config option ``workers`` in section
+        ``[ar_picker]``). Input data of stations with the same sampling rate
+        and number of samples is preprocessed together (see
+        :func:`~obspyck.util.ar_pick_prepare`).
+
+        :returns: :class:`~obspyck.util.ParallelMap` with results
+            (Z trace, N trace, P time, S time, error message) or None.
+        """
+        params = self._get_arpicker_parameters()
+        if params is None:
+            return None
+        self.info("Setting automatic picks using AR picker:")
+        groups = OrderedDict()
+        for st in self.streams:
+            components = dict((tr.stats.channel[-1], tr) for tr in st)
+            try:
+                z, n, e = [components[cha] for cha in "ZNE"]
+            except KeyError:
+                msg = ('AR picker currently only implemented for Z/N/E data, '
+                       'but provided stream was:\n%s') % st
+                self.error(msg)
+                continue
+            if not z.stats.sampling_rate == n.stats.sampling_rate == \
+                    e.stats.sampling_rate:
+                msg = ('AR picker needs same sampling rate on all traces '
+                       'but provided stream was:\n%s') % st
+                self.error(msg)
+                continue
+            if not len(z) == len(n) == len(e):
+                msg = ('AR picker needs same number of samples on all traces '
+                       'but provided stream was:\n%s') % st
+                self.error(msg)
+                continue
+            key = (z.stats.sampling_rate, len(z))
+            groups.setdefault(key, []).append((z, n, e))
+        tasks = []
+        for (spr, npts), stations in groups.iteritems():
+            data = ar_pick_prepare(*[
+                np.vstack([traces[i].data for traces in stations])
+                for i in range(3)])
+            for i, (z, n, e) in enumerate(stations):
+                tasks.append((z, n, spr, data[0][i], data[1][i],
+                              data[2][i]))
+
+        def ar_pick_station(task):
+            z, n, spr, a, b, c = task
+            try:
+                p, s = ar_pick_prepared(a, b, c, spr, **params)
+            except Exception as e:
+                return z, n, None, None, str(e)
+            return z, n, p, s, None
+
+        workers = self._get_config_value(
+            "ar_picker", "workers", default=0, no_option_error_message=False,
+            type=int)
+        if self.arpicker_workers is not None:
+            workers = self.arpicker_workers
+        return ParallelMap(ar_pick_station, tasks, workers=workers or None)
+
+    def _set_arpicker_picks(self, results):
+        """
+        Set P/S picks from AR picker results (see _start_arpicker()).
+        """
+        for z, n, p, s, error in sorted(results, key=lambda x: x[0].id):
+            if error is not None:
+                self.error("AR picker failed for %s: %s" % (z.id, error))
+                continue
+            for t, phase_hint, tr in zip((p, s), 'PS', (z, n)):
+                pick = self.getPick(phase_hint=phase_hint, setdefault=True,
+                                    seed_string=tr.id)
+                pick.setTime(z.stats.starttime + t)
+                self.info(str(pick))
+                self.info("%s pick set at %.3f (%s)" % (
+                    phase_hint, self.time_abs2rel(pick.time),
+                    pick.time.isoformat()))
+        self._catalog_changed()
+
+    def _arpicker(self):
+        """
+        Run AR picker on all streams and set P/S picks accordingly.
+        Also displays a message.
+        """
+        job = self._start_arpicker()
+        if job is None:
+            return
+        self._set_arpicker_picks(job.wait())
+
+    def _get_sta_lta(self):
+        """
+        STA and LTA window lengths (in seconds) for recursive STA/LTA, as set
+        in config section ``[gui_defaults]``.
+        """
+        sta = self._get_config_value(
+            "gui_defaults", "sta", default=0.5, type=float)
+        lta = self._get_config_value(
+            "gui_defaults", "lta", default=10.0, type=float)
+        return sta, lta
+
+    def coincidence_trigger(self, filter=False):
+        """
+        Network coincidence trigger on all stations, e.g. to find events in
+        long continuous recordings. Recursive STA/LTA (see _get_sta_lta())
+        is run on one trace per station (vertical component if available),
+        stations are processed in parallel threads.
+        Trigger thresholds and minimum number of coincident stations are set
+        in config section ``[coincidence_trigger]``.
+
+        :type filter: bool
+        :param filter: Whether to filter data before triggering (see
+            _filter()).
+        :returns: Coincidence windows (see
+            :func:`~obspyck.util.coincidence_windows`).
+        """
+        from obspy.signal.trigger import recursive_sta_lta, trigger_onset
+        sta, lta = self._get_sta_lta()
+        thr_on = self._get_config_value(
+            "coincidence_trigger", "thr_on", default=3.5,
+            no_option_error_message=False, type=float)
+        thr_off = self._get_config_value(
+            "coincidence_trigger", "thr_off", default=1.0,
+            no_option_error_message=False, type=float)
+        thr_coincidence_sum = self._get_config_value(
+            "coincidence_trigger", "coincidence_sum", default=3,
+            no_option_error_message=False, type=int)
+        stream = Stream()
+        for st in self.streams_bkp:
+            stream.append((st.select(component="Z") or st)[0])
+        # characteristic functions are computed on new arrays, original data
+        # only needs to be copied for filtering
+        if filter:
+            stream = stream.copy()
+            self._filter(stream)
+
+        def trigger_station(tr):
+            spr = tr.stats.sampling_rate
+            cft = recursive_sta_lta(tr.data, int(sta * spr), int(lta * spr))
+            windows = [(tr.stats.starttime + on / spr,
+                        tr.stats.starttime + off / spr)
+                       for on, off in trigger_onset(cft, thr_on, thr_off)]
+            return "%s.%s" % (tr.stats.network, tr.stats.station), windows
+
+        triggers = {}
+        for station, windows in ParallelMap(trigger_station,
+                                            stream.traces).wait():
+            triggers.setdefault(station, []).extend(windows)
+        windows = coincidence_windows(triggers, thr_coincidence_sum)
+        self.info("Network coincidence trigger (recSTALTA %.1f/%.1fs, "
+                  "thresholds %.1f/%.1f, %i stations): %i windows" % (
+                      sta, lta, thr_on, thr_off, thr_coincidence_sum,
+                      len(windows)))
+        return windows
+
+    def _setup_4_letter_station_map(self):
+        # make sure the 4-letter station codes are unique
+        sta_map_tmp = {}
+        for sta in [st[0].stats.station for st in self.streams_bkp]:
+            sta_map_tmp.setdefault(sta[:4], set()).add(sta)
+        sta_map = {}
+        sta_map_reverse = {}
+        for sta_short, stations in sta_map_tmp.iteritems():
+            stations = list(stations)
+            if len(stations) == 1:
+                sta_map[stations[0]] = sta_short
+                sta_map_reverse[sta_short] = stations[0]
+            else:
+                if len(stations) <= 10:
+                    for i, sta in enumerate(stations):
+                        short_name = sta[:2] + "_%i" % i
+                        sta_map[sta] = short_name
+                        sta_map_reverse[short_name] = sta
+                else:
+                    for i, sta in enumerate(stations):
+                        short_name = sta[0] + "_%02i" % i
+                        sta_map[sta] = short_name
+                        sta_map_reverse[short_name] = sta
+        self._4_letter_sta_map = sta_map
+        self._4_letter_sta_map_reverse = sta_map_reverse
+
+    def _locator_cache_key(self, *inputs):
+        """
+        Key for the locator cache, built from all the input given to a
+        location program.
+        """
+        sha1 = hashlib.sha1()
+        for input in inputs:
+            sha1.update(input)
+            sha1.update("\0")
+        return sha1.hexdigest()
+
+    def _nlloc_cache_key(self, prog_dict, controlfilename, phases_nlloc):
+        with open(os.path.join(prog_dict['dir'], controlfilename), "rt") as fh:
+            control = fh.read()
+        return self._locator_cache_key("nlloc", phases_nlloc, control)
+
+    def _write_hyp2000_input(self, prog_dict, phases_hypo71, stations_hypo71):
+        """
+        Removes output of previous runs and writes phase and station files
+        for hyp2000.
+        """
+        files = prog_dict['files']
+        precall = prog_dict['PreCall']
+        precall(prog_dict)
+
+        f = open(files['phases'], 'wt')
+        f.write(phases_hypo71)
+        f.close()
+
+        f2 = open(files['stations'], 'wt')
+        f2.write(stations_hypo71)
+        f2.close()
+
+    def _write_nlloc_input(self, prog_dict, phases_nlloc):
+        """
+        Removes output of previous runs and writes phase file for NLLoc.
+        """
+        precall = prog_dict['PreCall']
+        precall(prog_dict)
+
+        f = open(prog_dict['files']['phases'], 'wt')
+        f.write(phases_nlloc)
+        f.close()
+
+    def _run_program(self, description, prog_dict, args, callback,
+                     show_output=True):
+        """
+        Runs an external program (see setup_external_programs()) and waits
+        for it to finish, its output is logged afterwards (unless show_output
+        is False). Afterwards callback is called with the
+        :class:`~obspyck.util.ProgramRun`, also if it was stopped after the
+        timeout (check ``run.cancelled``). The GUI runs programs in the
+        background instead.
+        """
+        if show_output:
+            self.critical("%s started" % description)
+        run = prog_dict['Start'](prog_dict, *args,
+                                 timeout=self.external_program_timeout or None)
+        run.wait()
+        if show_output:
+            for line in run.stdout.splitlines():
+                self.info(line)
+            for line in run.stderr.splitlines():
+                self.error(line)
+        if run.timed_out:
+            self.error("Error: %s did not finish in %s seconds and was "
+                       "stopped." % (description, run.timeout))
+        else:
+            postcall = prog_dict.get('PostCall')
+            if postcall is not None:
+                postcall(prog_dict)
+        callback(run)
+
+    def doHyp2000(self, callback):
+        """
+        Writes input files for hyp2000 and runs the hyp2000 program (see
+        _run_program()). When hyp2000 finished, callback is called with the
+        location read from its output (see readHyp2000Output()), it is not
+        called if hyp2000 failed.
+        Locations for unchanged input are taken from the locator cache.
+        """
+        prog_dict = PROGRAMS['hyp_2000']
+        files = prog_dict['files']
+        phases_hypo71 = self.dicts2hypo71Phases()
+        stations_hypo71 = self.dicts2hypo71Stations()
+
+        self.critical('Phases for Hypo2000:')
+        self.critical(phases_hypo71)
+        self.critical('Stations for Hypo2000:')
+        self.critical(stations_hypo71)
+
+        key = self._locator_cache_key(
+            "hyp2000", phases_hypo71, stations_hypo71,
+            open(files['control'], "rt").read())
+        location = self.locator_cache.get(key)
+        if location is not None:
+            self.critical('--> using cached hyp2000 location for unchanged '
+                          'input')
+            callback(location)
+            return
+
+        self._write_hyp2000_input(prog_dict, phases_hypo71, stations_hypo71)
+
+        def finished(run):
+            if run.cancelled:
+                return
+            self.critical('--> hyp2000 finished')
+            self.catFile(files['summary'], self.critical)
+            location = self.readHyp2000Output()
+            if location is None:
+                return
+            self.locator_cache.put(key, location)
+            callback(location)
+
+        self._run_program("hyp2000", prog_dict, (), finished)
+
+    def doNLLoc(self, model, callback):
+        """
+        Writes input files for NLLoc and runs the NonLinLoc program with the
+        given velocity model (see _run_program()). When NLLoc finished,
+        callback is called with the result read from its output (see
+        readNLLocOutput()), it is not called if NLLoc failed.
+        Results for unchanged input are taken from the locator cache.
+        """
+        prog_dict = PROGRAMS['nlloc']
+        files = prog_dict['files']
+        controlfilename = "locate_%s.nlloc" % model
+        phases_nlloc = self.dicts2NLLocPhases()
+
+        self.critical('Phases for NLLoc:')
+        self.critical(phases_nlloc)
+
+        key = self._nlloc_cache_key(prog_dict, controlfilename, phases_nlloc)
+        result = self.locator_cache.get(key)
+        if result is not None:
+            self.critical('--> using cached NLLoc location for unchanged '
+                          'input')
+            callback(result)
+            return
+
+        self._write_nlloc_input(prog_dict, phases_nlloc)
+
+        def finished(run):
+            if run.cancelled:
+                return
+            self.critical('--> NLLoc finished')
+            self.catFile(files['summary'], self.critical)
+            result = self.readNLLocOutput(prog_dict)
+            if result is None:
+                return
+            self.locator_cache.put(key, result)
+            callback(result)
+
+        self._run_program("NLLoc", prog_dict, (controlfilename, ), finished)
+
+    def locateHyp2000(self):
+        """
+        Locates the event with hyp2000 and sets the new origin, waiting for
+        hyp2000 to finish (see doHyp2000()).
+
+        :returns: True if a new origin was set.
+        """
+        locations = []
+        self.doHyp2000(callback=locations.append)
+        if not locations:
+            return False
+        self.clearOriginMagnitude()
+        self.setXMLEventID()
+        self.loadHyp2000Data(locations[0])
+        return True
+
+    def locateNLLoc(self, model):
+        """
+        Locates the event with NLLoc using the given velocity model and sets
+        the new origin, waiting for NLLoc to finish (see doNLLoc()).
+
+        :returns: True if a new origin was set.
+        """
+        results = []
+        self.doNLLoc(model, callback=results.append)
+        if not results:
+            return False
+        self.clearOriginMagnitude()
+        self.setXMLEventID()
+        self.loadNLLocOutput(results[0])
+        return True
+
+    def catFile(self, file, logfunct):
+        lines = open(file, "rt").readlines()
+        msg = ""
+        for line in lines:
+            msg += line
+        logfunct(msg)
+
+    def readNLLocOutput(self, prog_dict=None):
+        """
+        Reads NLLoc output, by default from the main NLLoc directory or
+        otherwise from the given program dictionary.
+
+        :returns: Tuple of hypocenter (see :class:`obspyck.nlloc.NLLocHypocenter`),
+            name of velocity model and pdf scatter samples, or None if the
+            output can not be used.
+        """
+        if prog_dict is None:
+            prog_dict = PROGRAMS['nlloc']
+        files = prog_dict['files']
+        try:
+            hypocenters = read_nlloc_hyp(files['summary'])
+        except IOError:
+            err = "Error: NLLoc output file (%s) does not exist!" % \
+                    files['summary']
+            self.error(err)
+            return None
+        if not hypocenters or not hypocenters[0].is_complete():
+            err = "Error: No correct location info found in NLLoc " + \
+                  "outputfile (%s)!" % files['summary']
+            self.error(err)
+            return None
+        if len(hypocenters) > 1:
+            msg = ("Warning: NLLoc output file contains %i locations, using "
+                   "first one.") % len(hypocenters)
+            self.error(msg)
+        hypo = hypocenters[0]
+
+        # determine which model was used:
+        # XXX handling of path extremely hackish! to be improved!!
+        dirname = os.path.dirname(files['summary'])
+        model = read_nlloc_model(os.path.join(dirname, "last.in"))
+
+        # read NLLOC scatter file, optionally reduced to a maximum number of
+        # samples used for display and upload
+        max_samples = self._get_config_value(
+            "nonlinloc", "scatter_max_samples", default=0,
+            no_option_error_message=False, type=int)
+        scatter = readNLLocScatter(files['scatter'], None,
+                                   max_samples=max_samples or None)
+        return (hypo, model, scatter)
+
+    def loadNLLocOutput(self, result):
+        """
+        Sets a new origin from NLLoc output as returned by readNLLocOutput().
+        """
+        hypo, model, scatter = result
+
+        lon, lat = gk2lonlat(hypo.x, hypo.y)
+
+        # XXX TODO save original nlloc error ellipse?!
+        errX, errY, errZ = errorEllipsoid2CartesianErrors(*hypo.ellipsoid)
+
+        # XXX
+        # NLLOC uses error ellipsoid for 68% confidence interval relating to
+        # one standard deviation in the normal distribution.
+        # We multiply all errors by 2 to approximately get the 95% confidence
+        # level (two standard deviations)...
+        errX *= 2
+        errY *= 2
+        errZ *= 2
+
+        catalog = self.catalog
+        event = catalog[0]
+        if event.creation_info is None:
+            event.creation_info = CreationInfo()
+            event.creation_info.creation_time = UTCDateTime()
+        o = Origin()
+        event.origins = [o]
+        self.catalog[0].set_creation_info_username(self.username)
+        # version field has 64 char maximum per QuakeML RNG schema
+        o.creation_info = CreationInfo(creation_time=hypo.creation_time,
+                                       version=hypo.nlloc_version[:64])
+
+        # assign origin info
+        o.method_id = "/".join([ID_ROOT, "location_method", "nlloc", "4"])
+        o.origin_uncertainty = OriginUncertainty()
+        o.quality = OriginQuality()
+        ou = o.origin_uncertainty
+        oq = o.quality
+        o.longitude = lon
+        o.latitude = lat
+        o.depth = hypo.z * 1e3  # meters positive down!
+        if errY > errX:
+            ou.azimuth_max_horizontal_uncertainty = 0
+        else:
+            ou.azimuth_max_horizontal_uncertainty = 90
+        ou.min_horizontal_uncertainty, \
+                ou.max_horizontal_uncertainty = \
+                sorted([errX * 1e3, errY * 1e3])
+        ou.preferred_description = "uncertainty ellipse"
+        o.depth_errors.uncertainty = errZ * 1e3
+        oq.standard_error = hypo.rms #XXX stimmt diese Zuordnung!!!?!
+        oq.azimuthal_gap = hypo.gap
+        o.depth_type = "from location"
+        o.earth_model_id = "%s/earth_model/%s" % (ID_ROOT, model)
+        o.time = hypo.time
+
+        o.quality.used_phase_count = 0
+        o.quality.extra = AttribDict()
+        o.quality.extra.usedPhaseCountP = {'value': 0, 'namespace': NAMESPACE}
+        o.quality.extra.usedPhaseCountS = {'value': 0, 'namespace': NAMESPACE}
+
+        # go through all phase info lines
+        used_stations = set()
+        for phase in hypo.phases:
+            # check which type of phase
+            if phase.phase == "P":
+                type = "P"
+            elif phase.phase == "S":
+                type = "S"
+            else:
+                self.error("Encountered a phase that is not P and not S!! "
+                           "This case is not handled yet in reading NLLOC "
+                           "output...")
+                continue
+            # get values from line
+            station = phase.station
+            epidist = phase.epicentral_distance
+            azimuth = phase.ray_azimuth
+            ray_dip = phase.ray_dip
+            # if we do the location on traveltime-grids without angle-grids we
+            # do not get ray azimuth/incidence. but we can at least use the
+            # station to hypocenter azimuth which is very close (~2 deg) to the
+            # ray azimuth
+            if azimuth == 0.0 and ray_dip == 0.0:
+                azimuth = phase.station_azimuth
+                ray_dip = np.nan
+            if phase.onset == "I":
+                onset = "impulsive"
+            elif phase.onset == "E":
+                onset = "emergent"
+            else:
+                onset = None
+            if phase.polarity == "U":
+                polarity = "positive"
+            elif phase.polarity == "D":
+                polarity = "negative"
+            else:
+                polarity = None
+            # predicted travel time is zero.
+            # seems to happen when no travel time cube is present for a
+            # provided station reading. show an error message and skip this
+            # arrival.
+            if phase.predicted_travel_time == 0.0:
+                msg = ("Predicted travel time for station '%s' is zero. "
+                       "Most likely the travel time cube is missing for "
+                       "this station! Skipping arrival for this station.")
+                self.error(msg % station)
+                continue
+            res = phase.residual
+            weight = phase.weight
+
+            # assign synthetic phase info
+            pick = self.getPick(station=station, phase_hint=type)
+            if pick is None:
+                msg = "This should not happen! Location output was read and a corresponding pick is missing!"
+                raise NotImplementedError(msg)
+            arrival = Arrival(origin=o, pick=pick)
+            # residual is defined as P-Psynth by NLLOC!
+            arrival.distance = kilometer2degrees(epidist)
+            arrival.phase = type
+            arrival.time_residual = res
+            arrival.azimuth = azimuth
+            if not np.isnan(ray_dip):
+                arrival.takeoff_angle = ray_dip
+            if onset and not pick.onset:
+                pick.onset = onset
+            if polarity and not pick.polarity:
+                pick.polarity = polarity
+            # we use weights 0,1,2,3 but NLLoc outputs floats...
+            arrival.time_weight = weight
+            o.quality.used_phase_count += 1
+            if type == "P":
+                o.quality.extra.usedPhaseCountP['value'] += 1
+            elif type == "S":
+                o.quality.extra.usedPhaseCountS['value'] += 1
+            else:
+                self.error("Phase '%s' not recognized as P or S. " % type +
+                           "Not incrementing P nor S phase count.")
+            used_stations.add(station)
+        o.used_station_count = len(used_stations)
+        self.update_origin_azimuthal_gap()
+
+        o.nonlinloc_scatter = scatter
+
+    def readHyp2000Output(self):
+        """
+        Reads hyp2000 output.
+
+        :returns: Location (see :class:`obspyck.hyp2000.Hyp2000Location`) or
+            None if the output can not be used.
+        """
+        files = PROGRAMS['hyp_2000']['files']
+        try:
+            locations = read_hyp2000_prt(files['summary'])
+        except IOError:
+            err = "Error: Hypo2000 output file (%s) does not exist!" % \
+                    files['summary']
+            self.error(err)
+            return None
+        if not locations or not locations[0].is_complete():
+            err = "Error: No location info found in Hypo2000 outputfile " + \
+                  "(%s)!" % files['summary']
+            self.error(err)
+            return None
+        if len(locations) > 1:
+            msg = ("Warning: Hypo2000 output file contains %i locations, "
+                   "using first one.") % len(locations)
+            self.error(msg)
+        return locations[0]
+
+    def loadHyp2000Data(self, location):
+        """
+        Sets a new origin from a location as returned by readHyp2000Output().
+        """
+        sta_map_reverse = self._4_letter_sta_map_reverse
+
+        # this is to prevent characters that are invalid in QuakeML URIs
+        # hopefully handled in the future by obspy/obspy#1018
+        model = re.sub(r"[^\w\d\-\.\*\(\)\+\?_~'=,;#/&amp;]", '_',
+                       location.model)
+
+        # assign origin info
+        o = Origin()
+        self.catalog[0].origins = [o]
+        self.catalog[0].set_creation_info_username(self.username)
+        o.clear()
+        o.method_id = "/".join([ID_ROOT, "location_method", "hyp2000", "3"])
+        o.origin_uncertainty = OriginUncertainty()
+        o.quality = OriginQuality()
+        ou = o.origin_uncertainty
+        oq = o.quality
+        o.longitude = location.longitude
+        o.latitude = location.latitude
+        o.depth = location.depth * 1e3  # meters positive down!
+        # all errors are given in km!
+        ou.horizontal_uncertainty = location.error_horizontal * 1e3
+        ou.preferred_description = "horizontal uncertainty"
+        o.depth_errors.uncertainty = location.error_depth * 1e3
+        oq.standard_error = location.rms #XXX stimmt diese Zuordnung!!!?!
+        oq.azimuthal_gap = location.gap
+        o.depth_type = "from location"
+        o.earth_model_id = "%s/earth_model/%s" % (ID_ROOT, model)
+        o.time = location.time
+
+        oq.used_phase_count = 0
+        oq.extra = AttribDict()
+        oq.extra.usedPhaseCountP = {'value': 0, 'namespace': NAMESPACE}
+        oq.extra.usedPhaseCountS = {'value': 0, 'namespace': NAMESPACE}
+        used_stations = set()
+        for arr in location.arrivals:
+            type = arr.phase
+            # get values from line
+            station = sta_map_reverse[arr.station]
+            distance = arr.distance
+            azimuth = arr.azimuth
+            #XXX TODO check, if incident is correct!!
+            incident = arr.incidence
+            used_stations.add(station)
+            if arr.onset == "I":
+                onset = "impulsive"
+            elif arr.onset == "E":
+                onset = "emergent"
+            else:
+                onset = None
+            if arr.polarity == "U":
+                polarity = "positive"
+            elif arr.polarity == "D":
+                polarity = "negative"
+            else:
+                polarity = None
+            res = arr.residual
+            weight = arr.weight
+
+            # assign synthetic phase info
+            pick = self.getPick(station=station, phase_hint=type)
+            if pick is None:
+                msg = "This should not happen! Location output was read and a corresponding pick is missing!"
+                warnings.warn(msg)
+            arrival = Arrival(origin=o, pick=pick)
+            # residual is defined as P-Psynth by NLLOC!
+            # XXX does this also hold for hyp2000???
+            arrival.time_residual = res
+            arrival.azimuth = azimuth
+            arrival.distance = kilometer2degrees(distance)
+            arrival.takeoff_angle = incident
+            if onset and not pick.onset:
+                pick.onset = onset
+            if polarity and not pick.polarity:
+                pick.polarity = polarity
+            # we use weights 0,1,2,3 but hypo2000 outputs floats...
+            arrival.time_weight = weight
+            o.quality.used_phase_count += 1
+            if type == "P":
+                o.quality.extra.usedPhaseCountP['value'] += 1
+            elif type == "S":
+                o.quality.extra.usedPhaseCountS['value'] += 1
+            else:
+                self.error("Phase '%s' not recognized as P or S. " % type +
+                           "Not incrementing P nor S phase count.")
+        o.used_station_count = len(used_stations)
+
+    def updateMagnitude(self, stations=None):
+        """
+        Updates station magnitudes (all or only those of the given stations,
+        see calculateStationMagnitudes()) and network magnitude.
+        """
+        if self.catalog[0].origins:
+            self.info("updating magnitude info...")
+            self.calculateStationMagnitudes(stations)
+            self.updateNetworkMag()
+            self.setXMLEventID()
+        else:
+            self.critical("can not update magnitude (no origin)...")
+
+    def updateNetworkMag(self):
+        self.info("updating network magnitude...")
+        event = self.catalog[0]
+        self._catalog_changed()
+
+        if not event.origins:
+            event.magnitudes = []
+            self.critical("no origin information for magnitude...")
+            return
+
+        origin = event.origins[0]
+
+        used_stamags = []
+        for sm in event.station_magnitudes:
+            if sm.origin_id != origin.resource_id:
+                msg = ("Skipping station magnitude with non-matching origin "
+                       "ID (%s; Current origin: %s)" % (sm.origin_id,
+                                                        origin.resource_id))
+                self.error(msg)
+                continue
+            if not sm.get("used", True):
+                msg = ("Skipping manually deselected station magnitude for "
+                       "station %s." % sm.waveform_id.station_code)
+                self.error(msg)
+                continue
+            used_stamags.append(sm)
+
+        if not used_stamags:
+            event.magnitudes = []
+            self._network_mag = None
+            self.critical("no station magnitudes (or all deselected), nothing to do...")
+            return
+
+        # the network magnitude is kept up to date incrementally, with running
+        # mean and sum of squared deviations (Welford's algorithm) over the
+        # contributing station magnitudes. it is only set up from scratch if
+        # it was replaced/removed or the origin changed
+        state = self._network_mag
+        if (state is None or len(event.magnitudes) != 1 or
+                event.magnitudes[0] is not state['magnitude'] or
+                state['magnitude'].origin_id != origin.resource_id):
+            m = Magnitude()
+            event.magnitudes = [m]
+            m.method_id = "/".join([ID_ROOT, "magnitude_method", "obspyck",
+                                    "2"])
+            m.origin_id = origin.resource_id
+            m.type = "ML"
+            m.mag_errors.confidence_level = ONE_SIGMA
+            state = {'magnitude': m, 'count': 0, 'mean': 0.0,
+                     'sum_sq_dev': 0.0, 'contributions': {}}
+            self._network_mag = state
+        m = state['magnitude']
+        contributions = state['contributions']
+        count = state['count']
+
+        used = dict((str(sm.resource_id), sm) for sm in used_stamags)
+        for id_, (contrib, mag) in contributions.items():
+            sm = used.get(id_)
+            if sm is not None and sm.mag == mag:
+                continue
+            self._remove_network_mag_value(state, mag)
+            if sm is None:
+                del contributions[id_]
+                self._remove_station_magnitude_contribution(m, contrib)
+            else:
+                # station magnitude was recalculated
+                contributions[id_] = (contrib, sm.mag)
+                self._add_network_mag_value(state, sm.mag)
+        for sm in used_stamags:
+            id_ = str(sm.resource_id)
+            if id_ in contributions:
+                continue
+            contrib = StationMagnitudeContribution()
+            contrib.station_magnitude_id = sm.resource_id
+            contributions[id_] = (contrib, sm.mag)
+            m.station_magnitude_contributions.append(contrib)
+            self._add_network_mag_value(state, sm.mag)
+
+        m.mag = state['mean']
+        # population standard deviation (same as np.std)
+        m.mag_errors.uncertainty = np.sqrt(
+            state['sum_sq_dev'] / state['count'])
+        m.station_count = state['count']
+        # weights only change with the number of station magnitudes
+        if state['count'] != count:
+            single_weights = 1.0 / state['count']
+            for contrib in m.station_magnitude_contributions:
+                contrib.weight = single_weights
+
+        self.critical("new network magnitude: %.2f (Std: %.2f)" % (
+            m.mag, m.mag_errors.uncertainty))
+
+    @staticmethod
+    def _add_network_mag_value(state, mag):
+        """
+        Adds a station magnitude to running mean and sum of squared
+        deviations of the network magnitude (see updateNetworkMag()).
+        """
+        state['count'] += 1
+        delta = mag - state['mean']
+        state['mean'] += delta / state['count']
+        state['sum_sq_dev'] += delta * (mag - state['mean'])
+
+    @staticmethod
+    def _remove_network_mag_value(state, mag):
+        """
+        Removes a station magnitude from running mean and sum of squared
+        deviations of the network magnitude (reverse of
+        _add_network_mag_value()).
+        """
+        state['count'] -= 1
+        if not state['count']:
+            state['mean'] = 0.0
+            state['sum_sq_dev'] = 0.0
+            return
+        mean = state['mean']
+        state['mean'] -= (mag - mean) / state['count']
+        if state['count'] == 1:
+            state['sum_sq_dev'] = 0.0
+            return
+        # can only get negative at the order of rounding errors
+        state['sum_sq_dev'] = max(
+            state['sum_sq_dev'] - (mag - mean) * (mag - state['mean']), 0.0)
+
+    @staticmethod
+    def _remove_station_magnitude_contribution(magnitude, contrib):
+        """
+        Removes a contribution from a magnitude (by identity, other
+        contributions are left untouched).
+        """
+        contribs = magnitude.station_magnitude_contributions
+        for i, contrib_ in enumerate(contribs):
+            if contrib_ is contrib:
+                del contribs[i]
+                return
+
+    # XXX TODO Hypo distances needed?? where??
+    def calculateEpiHypoDists(self):
+        o = self.catalog[0].origins[0]
+        if not o.longitude or not o.latitude:
+            err = "Error: No coordinates for origin!"
+            self.error(err)
+        # XXX TODO need to check that distances are stored with arrival upon
+        # creation
+        epidists = [a.distance for a in o.arrivals]
+        if not o.quality:
+            o.quality = OriginQuality()
+        o.quality.maximum_distance = max(epidists)
+        o.quality.minimum_distance = min(epidists)
+        o.quality.median_distance = np.median(epidists)
+
+    def epidist_for_stream(self, stream):
+        """
+        Return epicentral distance for given stream (in kilometers), return
+        None if epicentral distance can not be computed (no origin, no
+        station coordinates, ..).
+        """
+        if not self.catalog or not self.catalog[0].origins:
+            err = 'Can not compute epicentral distance, no origin information.'
+            self.error(err)
+            return None
+        o = self.catalog[0].origins[0]
+        if not o.longitude or not o.latitude:
+            err = ('Can not compute epicentral distance, origin is missing '
+                   'latitude and/or longitude.')
+            self.error(err)
+            return None
+        tr = stream[0]
+        geometry = self.get_station_geometry()
+        i = geometry.get((tr.stats.network, tr.stats.station,
+                          tr.stats.location))
+        if i is None:
+            err = ('Can not compute epicentral distance, stream ({}) metadata '
+                   'is missing latitude and/or longitude.').format(tr.id)
+            self.error(err)
+            return None
+        return geometry.epicentral_distance[i] / 1e3
+
+    def hypoDist(self, network, station, location):
+        """
+        Return hypocentral distance for given station (in kilometers), None
+        if the station has no coordinates.
+        """
+        o = self.catalog[0].origins[0]
+        geometry = self.get_station_geometry()
+        if geometry is None:
+            return None
+        i = geometry.get((network, station, location))
+        if i is None:
+            return None
+        coords = self._get_station_coordinates()[(network, station, location)]
+        # origin depth is in m positive down,
+        # station elevation is in m positive up
+        if abs(o.depth) < 800:
+            msg = ("Calculating hypocentral distance for origin "
+                   "depth '%s' meters." % o.depth)
+            self.error(msg)
+            warnings.warn(msg)
+        if abs(coords['elevation']) < 8:
+            msg = ("Calculating hypocentral distance for station "
+                   "elevation '%s' meters." % coords['elevation'])
+            self.error(msg)
+        return geometry.hypocentral_distance[i] / 1e3
+
+    def get_station_geometry(self):
+        """
+        Returns distances, azimuths and incidence angles of all stations
+        relative to the current origin (see
+        :class:`~obspyck.util.StationGeometry`, stations keyed by (network,
+        station, location)) or None if there is no origin with coordinates.
+        The table is only recalculated when the origin changed, station
+        coordinates are only collected once (see _get_station_coordinates()).
+        """
+        if not self.catalog or not self.catalog[0].origins:
+            return None
+        o = self.catalog[0].origins[0]
+        if not o.longitude or not o.latitude:
+            return None
+        cache_key = (str(o.resource_id), o.latitude, o.longitude, o.depth)
+        if self._station_geometry is None or \
+                self._station_geometry[0] != cache_key:
+            geometry = StationGeometry(o.latitude, o.longitude, o.depth,
+                                       self._get_station_coordinates())
+            self._station_geometry = (cache_key, geometry)
+        return self._station_geometry[1]
+
+    def _get_station_coordinates(self):
+        """
+        Coordinates of all stations with metadata, keyed by (network,
+        station, location). Only collected once from the streams, see
+        _prepare_streams().
+        """
+        if self._station_coordinates is None:
+            coordinates = OrderedDict()
+            for st in self.streams_bkp:
+                stats = st[0].stats
+                key = (stats.network, stats.station, stats.location)
+                coords = stats.get("coordinates")
+                if key in coordinates or not coords or \
+                        coords.get("latitude") is None or \
+                        coords.get("longitude") is None:
+                    continue
+                coordinates[key] = coords
+            self._station_coordinates = coordinates
+        return self._station_coordinates
+
+    # XXX TODO maybe rename to "updateStationMagnitude"
+    # XXX TODO automatically update magnitude on setting amplitude picks!
+    def calculateStationMagnitudes(self, stations=None):
+        """
+        Calculates station magnitudes for all stations with amplitudes or
+        only for the given stations, keeping the other station magnitudes.
+
+        :type stations: list of tuples
+        :param stations: (network, station, location) of stations to update.
+        """
+        event = self.catalog[0]
+        origin = event.origins[0]
+
+        netstaloc = set([(amp.waveform_id.network_code,
+                          amp.waveform_id.station_code,
+                          amp.waveform_id.location_code)
+                         for amp in event.amplitudes])
+        # station magnitudes for another origin all need to be recalculated
+        if stations is not None and any(
+                sm.origin_id != origin.resource_id
+                for sm in event.station_magnitudes):
+            stations = None
+        if stations is None:
+            event.station_magnitudes = []
+        else:
+            stations = set(stations)
+            netstaloc &= stations
+            event.station_magnitudes = [
+                sm for sm in event.station_magnitudes
+                if (sm.waveform_id.network_code, sm.waveform_id.station_code,
+                    sm.waveform_id.location_code) not in stations]
+
+        # look up traces without copying streams (see getTrace()), original
+        # streams first as their metadata objects stay the same (see
+        # _get_response_amplitude())
+        traces = {}
+        for st in list(self.streams_bkp) + list(self.streams):
+            for tr in st:
+                traces.setdefault(tr.id, tr)
+
+        # all readings of all stations go into one vectorized magnitude
+        # calculation
+        station_info = []
+        p2ps = []
+        timedeltas = []
+        response_amplitudes = []
+        groups = []
+        for net, sta, loc in sorted(netstaloc):
+            amplitudes = []
+            channels = []
+            readings = []
+            for amplitude in self.getAmplitudes(net, sta, loc):
+                self.debug(str(amplitude))
+                timedelta = amplitude.get_timedelta()
+                self.debug("Timedelta: " + str(timedelta))
+                if timedelta is None:
+                    continue
+                tr = traces.get(amplitude.waveform_id.get_seed_string())
+                response_amplitude = None
+                if tr is not None:
+                    response_amplitude = self._get_response_amplitude(
+                        tr, 1.0 / (2 * timedelta))
+                self.debug("Response amplitude: " + str(response_amplitude))
+                if response_amplitude is None:
+                    # XXX TODO we could fetch the metadata from seishub if we
+                    # don't have a trace with PAZ and still use the stored info
+                    msg = ("Skipping amplitude for station "
+                           "'%s': Missing PAZ/response metadata" % sta)
+                    self.error(msg)
+                    continue
+                amplitudes.append(amplitude)
+                channels.append(tr.stats.channel)
+                readings.append((amplitude.get_p2p(), timedelta,
+                                 response_amplitude))
+
+            if not amplitudes:
+                continue
+            dist = self.hypoDist(net, sta, loc)
+            if dist is None:
+                msg = ("Skipping station '%s': Missing station "
+                       "coordinates" % sta)
+                self.error(msg)
+                continue
+            for p2p, timedelta, response_amplitude in readings:
+                p2ps.append(p2p)
+                timedeltas.append(timedelta)
+                response_amplitudes.append(response_amplitude)
+                groups.append(len(station_info))
+            station_info.append((net, sta, loc, dist, amplitudes, channels))
+
+        if not station_info:
+            return
+        mags = local_magnitudes(p2ps, timedeltas, response_amplitudes, groups,
+                                [info[3] for info in station_info])
+
+        for (net, sta, loc, _, amplitudes, channels), mag in zip(
+                station_info, mags):
+            sm = StationMagnitude()
+            event.station_magnitudes.append(sm)
+            sm.origin_id = origin.resource_id
+            sm.method_id = "/".join(
+                [ID_ROOT, "station_magnitude_method", "obspyck", "2"])
+            sm.mag = float(mag)
+            sm.type = "ML"
+            sm.waveform_id = WaveformStreamID()
+            sm.waveform_id.network_code = net
+            sm.waveform_id.station_code = sta
+            sm.waveform_id.location_code = loc
+            extra = sm.setdefault("extra", AttribDict())
+            extra.channels = {'value': ",".join(channels),
+                              'namespace': NAMESPACE}
+            extra.amplitudeIDs = {'value': ",".join([str(a.resource_id)
+                                                     for a in amplitudes]),
+                                  'namespace': NAMESPACE}
+            self.critical('calculated new magnitude for %s: %0.2f (channels: %s)' % (
+                sta, mag, ",".join(channels)))
+
+    def _get_response_amplitude(self, tr, freq):
+        """
+        Returns amplitude of the instrument response of the trace at the given
+        frequency in counts per m/s (see
+        :func:`~obspyck.util.response_amplitude`) or None if the trace has
+        no PAZ/response metadata. Values are cached per channel and
+        frequency.
+        """
+        # either use attached PAZ or response..
+        if "parser" in tr.stats:
+            metadata = tr.stats["parser"]
+        elif "response" in tr.stats:
+            metadata = tr.stats["response"]
+        else:
+            return None
+        key = (tr.id, freq)
+        cached = self.response_amplitude_cache.get(key)
+        # metadata objects get replaced when data is fetched again
+        if cached is not None and cached[0] is metadata:
+            return cached[1]
+        if "parser" in tr.stats:
+            paz = metadata.get_paz(tr.id, tr.stats.starttime)
+        else:
+            paz = metadata
+        if paz is None:
+            return None
+        value = response_amplitude(paz, freq)
+        self.response_amplitude_cache.put(key, (metadata, value))
+        return value
+
+    # XXX TODO rename method
+    def dicts2hypo71Stations(self):
+        """
+        Returns the station location information in hypo71
+        stations file format as a string. This string can then be written to
+        a file.
+        """
+        sta_map = self._4_letter_sta_map
+        fmt = "%6s%02i%05.2f%1s%03i%05.2f%1s%4i\n"
+        hypo71_string = ""
+
+        for st in self.streams:
+            stats = st[0].stats
+            sta = stats.station
+            lon = stats.coordinates.longitude
+            lon_deg = int(abs(lon))
+            lon_min = (abs(lon) - abs(lon_deg)) * 60.
+            lat = stats.coordinates.latitude
+            lat_deg = int(abs(lat))
+            lat_min = (abs(lat) - abs(lat_deg)) * 60.
+            hem_NS = 'N'
+            hem_EW = 'E'
+            if lat < 0:
+                hem_NS = 'S'
+            if lon < 0:
+                hem_EW = 'W'
+            # hypo 71 format uses elevation in meters not kilometers
+            ele = stats.coordinates.elevation
+            # if sensor is buried or downhole, account for the specified sensor
+            # depth
+            depth = stats.coordinates.get('local_depth')
+            if depth:
+                ele -= depth
+            hypo71_string += fmt % (sta_map[sta], lat_deg, lat_min, hem_NS,
+                                    lon_deg, lon_min, hem_EW, ele)
+
+        return hypo71_string
+
+    def dicts2hypo71Phases(self):
+        """
+        Returns the pick information in hypo71 phase file format
+        as a string. This string can then be written to a file.
+
+        Information on the file formats can be found at:
+        http://geopubs.wr.usgs.gov/open-file/of02-171/of02-171.pdf p.30
+
+        Quote:
+        The traditional USGS phase data input format (not Y2000 compatible)
+        Some fields were added after the original HYPO71 phase format
+        definition.
+
+        Col. Len. Format Data
+         1    4  A4       4-letter station site code. Also see col 78.
+         5    2  A2       P remark such as "IP". If blank, any P time is
+                          ignored.
+         7    1  A1       P first motion such as U, D, +, -, C, D.
+         8    1  I1       Assigned P weight code.
+         9    1  A1       Optional 1-letter station component.
+        10   10  5I2      Year, month, day, hour and minute.
+        20    5  F5.2     Second of P arrival.
+        25    1  1X       Presently unused.
+        26    6  6X       Reserved remark field. This field is not copied to
+                          output files.
+        32    5  F5.2     Second of S arrival. The S time will be used if this
+                          field is nonblank.
+        37    2  A2, 1X   S remark such as "ES".
+        40    1  I1       Assigned weight code for S.
+        41    1  A1, 3X   Data source code. This is copied to the archive
+                          output.
+        45    3  F3.0     Peak-to-peak amplitude in mm on Develocorder viewer
+                          screen or paper record.
+        48    3  F3.2     Optional period in seconds of amplitude read on the
+                          seismogram. If blank, use the standard period from
+                          station file.
+        51    1  I1       Amplitude magnitude weight code. Same codes as P & S.
+        52    3  3X       Amplitude magnitude remark (presently unused).
+        55    4  I4       Optional event sequence or ID number. This number may
+                          be replaced by an ID number on the terminator line.
+        59    4  F4.1     Optional calibration factor to use for amplitude
+                          magnitudes. If blank, the standard cal factor from
+                          the station file is used.
+        63    3  A3       Optional event remark. Certain event remarks are
+                          translated into 1-letter codes to save in output.
+        66    5  F5.2     Clock correction to be added to both P and S times.
+        71    1  A1       Station seismogram remark. Unused except as a label
+                          on output.
+        72    4  F4.0     Coda duration in seconds.
+        76    1  I1       Duration magnitude weight code. Same codes as P & S.
+        77    1  1X       Reserved.
+        78    1  A1       Optional 5th letter of station site code.
+        79    3  A3       Station component code.
+        82    2  A2       Station network code.
+        84-85 2  A2     2-letter station location code (component extension).
+        """
+        sta_map = self._4_letter_sta_map
+
+        fmtP = "%4s%1sP%1s%1i %15s"
+        fmtS = "%12s%1sS%1s%1i\n"
+        hypo71_string = ""
+
+        for st in self.streams:
+            net = st[0].stats.network
+            sta = st[0].stats.station
+            pick_p = self.getPick(network=net, station=sta, phase_hint='P')
+            pick_s = self.getPick(network=net, station=sta, phase_hint='S')
+            if not pick_p and not pick_s:
+                continue
+            if not pick_p:
+                msg = ("Hypo2000 phase file format does not support S pick "
+                       "without P pick. Skipping station: %s") % sta
+                self.error(msg)
+                continue
+
+            # P Pick
+            pick = pick_p
+            t = pick.time
+            hundredth = int(round(t.microsecond / 1e4))
+            if hundredth == 100:  # XXX check!!
+                t_p = t + 1
+                hundredth = 0
+            else:
+                t_p = t
+            date = t_p.strftime("%y%m%d%H%M%S") + ".%02d" % hundredth
+            if pick.onset == 'impulsive':
+                onset = 'I'
+            elif pick.onset == 'emergent':
+                onset = 'E'
+            else:
+                onset = '?'
+            if pick.polarity == "positive":
+                polarity = "U"
+            elif pick.polarity == "negative":
+                polarity = "D"
+            else:
+                polarity = "?"
+            try:
+                weight = int(pick.extra.weight.value)
+            except:
+                weight = 0
+            hypo71_string += fmtP % (sta_map[sta], onset, polarity, weight, date)
+
+            # S Pick
+            if pick_s:
+                if not pick_p:
+                    err = "Warning: Trying to print a Hypo2000 phase file " + \
+                          "with an S phase without P phase.\n" + \
+                          "This case might not be covered correctly and " + \
+                          "could screw our file up!"
+                    self.error(err)
+                pick = pick_s
+                t2 = pick.time
+                # if the S time's absolute minute is higher than that of the
+                # P pick, we have to add 60 to the S second count for the
+                # hypo 2000 output file
+                # +60 %60 is necessary if t.min = 57, t2.min = 2 e.g.
+                mindiff = (t2.minute - t.minute + 60) % 60
+                abs_sec = t2.second + (mindiff * 60)
+                if abs_sec > 99:
+                    err = "Warning: S phase seconds are greater than 99 " + \
+                          "which is not covered by the hypo phase file " + \
+                          "format! Omitting S phase of station %s!" % sta
+                    self.error(err)
+                    hypo71_string += "\n"
+                    continue
+                hundredth = int(round(t2.microsecond / 1e4))
+                if hundredth == 100:
+                    abs_sec += 1
+                    hundredth = 0
+                date2 = "%s.%02d" % (abs_sec, hundredth)
+                if pick.onset == 'impulsive':
+                    onset2 = 'I'
+                elif pick.onset == 'emergent':
+                    onset2 = 'E'
+                else:
+                    onset2 = '?'
+                if pick.polarity == "positive":
+                    polarity2 = "U"
+                elif pick.polarity == "negative":
+                    polarity2 = "D"
+                else:
+                    polarity2 = "?"
+                try:
+                    weight2 = int(pick.extra.weight.value)
+                except:
+                    weight2 = 0
+                hypo71_string += fmtS % (date2, onset2, polarity2, weight2)
+            else:
+                hypo71_string += "\n"
+
+        return hypo71_string
+
+    def dicts2NLLocPhases(self):
+        """
+        Returns the pick information in NonLinLoc's own phase
+        file format as a string. This string can then be written to a file.
+        Currently only those fields really needed in location are actually used
+        in assembling the phase information string.
+
+        Information on the file formats can be found at:
+        http://alomax.free.fr/nlloc/soft6.00/formats.html#_phase_
+
+        Quote:
+        NonLinLoc Phase file format (ASCII, NLLoc obsFileType = NLLOC_OBS)
+
+        The NonLinLoc Phase file format is intended to give a comprehensive
+        phase time-pick description that is easy to write and read.
+
+        For each event to be located, this file contains one set of records. In
+        each set there is one "arrival-time" record for each phase at each seismic
+        station. The final record of each set is a blank. As many events as desired can
+        be included in one file.
+
+        Each record has a fixed format, with a blank space between fields. A
+        field should never be left blank - use a "?" for unused characther fields and a
+        zero or invalid numeric value for numeric fields.
+
+        The NonLinLoc Phase file record is identical to the first part of each
+        phase record in the NLLoc Hypocenter-Phase file output by the program NLLoc.
+        Thus the phase list output by NLLoc can be used without modification as time
+        pick observations for other runs of NLLoc.
+
+        NonLinLoc phase record:
+        Fields:
+        Station name (char*6)
+            station name or code
+        Instrument (char*4)
+            instument identification for the trace for which the time pick
+            corresponds (i.e. SP, BRB, VBB)
+        Component (char*4)
+            component identification for the trace for which the time pick
+            corresponds (i.e. Z, N, E, H)
+        P phase onset (char*1)
+            description of P phase arrival onset; i, e
+        Phase descriptor (char*6)
+            Phase identification (i.e. P, S, PmP)
+        First Motion (char*1)
+            first motion direction of P arrival; c, C, u, U = compression;
+            d, D = dilatation; +, -, Z, N; . or ? = not readable.
+        Date (yyyymmdd) (int*6)
+            year (with century), month, day
+        Hour/minute (hhmm) (int*4)
+            Hour, min
+        Seconds (float*7.4)
+            seconds of phase arrival
+        Err (char*3)
+            Error/uncertainty type; GAU
+        ErrMag (expFloat*9.2)
+            Error/uncertainty magnitude in seconds
+        Coda duration (expFloat*9.2)
+            coda duration reading
+        Amplitude (expFloat*9.2)
+            Maxumim peak-to-peak amplitude
+        Period (expFloat*9.2)
+            Period of amplitude reading
+        PriorWt (expFloat*9.2)
+
+        A-priori phase weight Currently can be 0 (do not use reading) or
+        1 (use reading). (NLL_FORMAT_VER_2 - WARNING: under development)
+
+        Example:
+
+        GRX    ?    ?    ? P      U 19940217 2216   44.9200 GAU  2.00e-02 -1.00e+00 -1.00e+00 -1.00e+00
+        GRX    ?    ?    ? S      ? 19940217 2216   48.6900 GAU  4.00e-02 -1.00e+00 -1.00e+00 -1.00e+00
+        CAD    ?    ?    ? P      D 19940217 2216   46.3500 GAU  2.00e-02 -1.00e+00 -1.00e+00 -1.00e+00
+        CAD    ?    ?    ? S      ? 19940217 2216   50.4000 GAU  4.00e-02 -1.00e+00 -1.00e+00 -1.00e+00
+        BMT    ?    ?    ? P      U 19940217 2216   47.3500 GAU  2.00e-02 -1.00e+00 -1.00e+00 -1.00e+00
+        """
+        nlloc_str = ""
+
+        for pick in self.catalog[0].picks:
+            sta = pick.waveform_id.station_code.ljust(6)
+            inst = "?".ljust(4)
+            comp = "?".ljust(4)
+            onset = "?"
+            phase = pick.phase_hint.ljust(6)
+            pol = "?"
+            t = pick.time
+            date = t.strftime("%Y%m%d")
+            hour_min = t.strftime("%H%M")
+            sec = "%7.4f" % (t.second + t.microsecond / 1e6)
+            error_type = "GAU"
+            error = None
+            # XXX check: should we take only half of the complete left-to-right error?!?
+            if pick.time_errors.upper_uncertainty and pick.time_errors.lower_uncertainty:
+                error = pick.time_errors.upper_uncertainty + pick.time_errors.lower_uncertainty
+            elif pick.time_errors.uncertainty:
+                error = 2 * pick.time_errors.uncertainty
+            if error is None:
+                error = self.config.getfloat("nonlinloc",
+                                             "default_pick_uncertainty")
+                err = ("Warning: Missing pick error. Using a default error "
+                       "of {}s for {} phase of station {}. Please set pick "
+                       "errors.").format(error, phase.strip(), sta.strip())
+                self.error(err)
+            error = "%9.2e" % error
+            coda_dur = "-1.00e+00"
+            ampl = "-1.00e+00"
+            period = "-1.00e+00"
+            fields = [sta, inst, comp, onset, phase, pol, date, hour_min,
+                      sec, error_type, error, coda_dur, ampl, period]
+            phase_str = " ".join(fields)
+            nlloc_str += phase_str + "\n"
+        return nlloc_str
+
+    def _get_event_flags(self):
+        """
+        Returns evaluation mode, public flag and QuakeML event type (or
+        '<event type>' for none) of the event.
+
+        Events processed without GUI are automatic and not public.
+        """
+        return "automatic", False, '<event type>'
+
+    def get_QUAKEML_string(self):
+        """
+        Returns all information as xml file (type string)
+
+        The serialization is done in memory and is cached, it is only redone
+        if the catalog changed in the meantime (see
+        :meth:`_catalog_changed`) or if evaluation mode, public flag or event
+        type changed (see _get_event_flags()).
+        """
+        evaluation_mode, public, event_quakeml_type = self._get_event_flags()
+        key = (self._catalog_version, evaluation_mode, public,
+               event_quakeml_type)
+        cached_key, xml = self._quakeml_cache
+        if cached_key == key:
+            return xml
+
+        cat = self.catalog
+        if cat.creation_info is None:
+            cat.creation_info = CreationInfo()
+        cat.creation_info.creation_time = UTCDateTime()
+        cat.creation_info.version = VERSION_INFO
+        e = cat[0]
+        extra = e.setdefault("extra", AttribDict())
+
+        extra.evaluationMode = {'value': evaluation_mode,
+                                'namespace': NAMESPACE}
+        extra.public = {'value': public, 'namespace': NAMESPACE}
+
+        # check if an quakeML event type should be set
+        if event_quakeml_type != '<event type>':
+            e.event_type = event_quakeml_type
+
+        # XXX TODO change handling of resource ids. never change id set at
+        # creation and make sure that only wanted arrivals/picks get
+        # saved/stored.
+
+        string_io = StringIO()
+        cat.write(string_io, "QUAKEML", nsmap=NSMAP)
+        xml = string_io.getvalue()
+        string_io.close()
+
+        self._quakeml_cache = (key, xml)
+        return xml
+
+    def _catalog_changed(self):
+        """
+        Needs to be called whenever the catalog (or anything in it) changes,
+        invalidates the cached QuakeML serialization.
+        """
+        self._catalog_version += 1
+
+    def setXMLEventID(self, event_id=None):
+        #XXX TODO: is problematic if two people create an event at exactly the same second!
+        # then one event is overwritten with the other during submission.
+        if event_id is None:
+            event_id = UTCDateTime().strftime('%Y%m%d%H%M%S')
+        self.catalog[0].resource_id = "/".join([ID_ROOT, "event", event_id])
+        self.catalog.resource_id = "/".join([ID_ROOT, "catalog", event_id])
+        # event id gets set before/after all kinds of changes to the event
+        self._catalog_changed()
+
+    def clearEvent(self):
+        self.info("Clearing previous event data.")
+        self.catalog = Catalog()
+        event = Event()
+        event.set_creation_info_username(self.username)
+        self.catalog.events = [event]
+        self._catalog_changed()
+
+    def clearOriginMagnitude(self):
+        self.info("Clearing previous origin and magnitude data.")
+        self.catalog[0].origins = []
+        self.catalog[0].magnitudes = []
+        self.catalog[0].station_magnitudes = []
+        self._catalog_changed()
+
+    def delPick(self, pick):
+        event = self.catalog[0]
+        if pick in event.picks:
+            event.picks.remove(pick)
+            self._catalog_changed()
+
+    def delAmplitude(self, amplitude):
+        event = self.catalog[0]
+        if amplitude in event.amplitudes:
+            event.amplitudes.remove(amplitude)
+            self._catalog_changed()
+
+    def getPick(self, network=None, station=None, phase_hint=None, waveform_id=None, setdefault=False, seed_string=None):
+        """
+        returns first matching pick, does NOT ensure there is only one!
+        if setdefault is True then if no pick is found an empty one is returned and inserted into self.picks.
+        """
+        picks = self.catalog[0].picks
+        for p in picks:
+            if network is not None and network != p.waveform_id.network_code:
+                continue
+            if station is not None and station != p.waveform_id.station_code:
+                continue
+            if phase_hint is not None and phase_hint != p.phase_hint:
+                continue
+            if waveform_id is not None and waveform_id != p.waveform_id:
+                continue
+            if seed_string is not None and seed_string != p.waveform_id.get_seed_string():
+                continue
+            return p
+        if setdefault:
+            # XXX TODO check if handling of picks/arrivals with regard to
+            # resource ids is safe (overwritten picks, arrivals get deleted
+            # etc., association of picks/arrivals is ok)
+            # also check if setup of resource id strings make sense in general
+            # (make versioning of methods possible, etc)
+            if seed_string is None:
+                raise Exception("Pick setdefault needs seed_string and phase_hint kwargs")
+            p = Pick(seed_string=seed_string, phase_hint=phase_hint)
+            picks.append(p)
+            self._catalog_changed()
+            return p
+        else:
+            return None
+
+    def getPicks(self, network, station, location=None):
+        """
+        returns all matching picks as list.
+        """
+        picks = self.catalog[0].picks
+        ret = []
+        for p in picks:
+            if network != p.waveform_id.network_code:
+                continue
+            if station != p.waveform_id.station_code:
+                continue
+            if location is not None:
+                if location != p.waveform_id.location_code:
+                    continue
+            ret.append(p)
+        return ret
+
+    def getAmplitude(self, network=None, station=None, waveform_id=None, setdefault=False, seed_string=None):
+        """
+        returns first matching amplitude, does NOT ensure there is only one!
+        if setdefault is True then if no arrival is found an empty one is returned and inserted into self.arrivals.
+        """
+        amplitudes = self.catalog[0].amplitudes
+        for a in amplitudes:
+            if network is not None and network != a.waveform_id.network_code:
+                continue
+            if station is not None and station != a.waveform_id.station_code:
+                continue
+            if waveform_id is not None and waveform_id != a.waveform_id:
+                continue
+            if seed_string is not None and seed_string != a.waveform_id.get_seed_string():
+                continue
+            return a
+        if setdefault:
+            # XXX TODO check if handling of picks/arrivals with regard to
+            # resource ids is safe (overwritten picks, arrivals get deleted
+            # etc., association of picks/arrivals is ok)
+            # also check if setup of resource id strings make sense in general
+            # (make versioning of methods possible, etc)
+            if seed_string is None:
+                raise Exception("Arrival setdefault needs seed_string kwarg")
+            self.debug(seed_string)
+            a = Amplitude(seed_string=seed_string)
+            amplitudes.append(a)
+            self._catalog_changed()
+            return a
+        else:
+            return None
+
+    def getAmplitudes(self, network, station, location):
+        """
+        returns all matching amplitudes as list.
+        """
+        amplitudes = self.catalog[0].amplitudes
+        ret = []
+        for a in amplitudes:
+            if network != a.waveform_id.network_code:
+                continue
+            if station != a.waveform_id.station_code:
+                continue
+            if location != a.waveform_id.location_code:
+                continue
+            ret.append(a)
+        return ret
+
+    def getTrace(self, seed_string):
+        """
+        returns matching trace, does NOT ensure there is only one!
+        """
+        network, station, location, channel = seed_string.split(".")
+        st = self.getStream(network, station, location)
+        self.debug("seed_string: %s" % seed_string)
+        self.debug(str(st))
+        if st is None:
+            return None
+        st = st.select(channel=channel)
+        self.debug(str(st))
+        if not st:
+            return None
+        #if len(st) > 1:
+        #    err = ("Warning: More than one trace matching:\n%s\n"
+        #           "This should not happen. Using first Trace.") % str(st)
+        #    self.error(err)
+        return st[0]
+
+    def getStream(self, network=None, station=None, location=None):
+        """
+        returns matching stream, does NOT ensure there is only one!
+        """
+        self.debug("net: %s, sta: %s,loc: %s" % (network, station, location))
+        st = Stream()
+        for st_, st_bkp in zip(self.streams, self.streams_bkp):
+            if st_ is not st_bkp:
+                st += st_
+            # merging below works in place, only copy matching original data
+            st += st_bkp.select(network=network, station=station,
+                                location=location).copy()
+        self.debug(str(st))
+        st = st.select(network=network, station=station,
+                       location=location)
+        self.debug(str(st))
+        st.merge(-1)
+        self.debug(str(st))
+        if st:
+            return st
+        return None
+
+    def getStationMagnitude(self, network, station, location):
+        """
+        returns matching station magnitude, does NOT ensure there is only one!
+        """
+        try:
+            stamags = self.catalog[0].station_magnitudes
+        except:
+            return None
+        for stamag in stamags:
+            wid = stamag.waveform_id
+            if network != wid.network_code:
+                continue
+            if station != wid.station_code:
+                continue
+            if location != wid.location_code:
+                continue
+            return stamag
+        return None
+
+    def update_origin_azimuthal_gap(self):
+        origin = self.catalog[0].origins[0]
+        arrivals = origin.arrivals
+        picks = self.catalog[0].picks
+        geometry = self.get_station_geometry()
+        azims = {}
+        for a in arrivals:
+            p = getPickForArrival(picks, a)
+            if p is None:
+                msg = ("Could not find pick for arrival. Aborting calculation "
+                       "of azimuthal gap.")
+                self.error(msg)
+                return
+            netsta = ".".join([p.waveform_id.network_code, p.waveform_id.station_code])
+            azim = a.azimuth
+            # fall back to azimuth from station geometry
+            if azim is None and geometry is not None:
+                i = geometry.get((p.waveform_id.network_code,
+                                  p.waveform_id.station_code,
+                                  p.waveform_id.location_code))
+                if i is not None:
+                    azim = geometry.azimuth[i]
+            if azim is None:
+                msg = ("Arrival's azimuth is 'None'. "
+                       "Calculated azimuthal gap might be wrong")
+                self.error(msg)
+            else:
+                azims.setdefault(netsta, []).append(azim)
+        self.debug("Arrival azimuths: %s" % azims)
+        azim_list = []
+        for netsta in azims:
+            tmp_list = azims.get(netsta, [])
+            if not tmp_list:
+                msg = ("No azimuth information for station %s. "
+                       "Aborting calculation of azimuthal gap.")
+                self.error(msg)
+                return
+            azim_list.append((np.median(tmp_list), netsta))
+        azim_list = sorted(azim_list)
+        azims = np.array([azim for azim, netsta in azim_list])
+        azims.sort()
+        # calculate azimuthal gap
+        gaps = azims - np.roll(azims, 1)
+        gaps[0] += 360.0
+        gap = gaps.max()
+        i_ = gaps.argmax()
+        netstas = (azim_list[i_][1], azim_list[i_-1][1])
+        if origin.quality is None:
+            origin.quality = OriginQuality()
+        origin.quality.azimuthal_gap = gap
+        self.info("Azimuthal gap of %s between stations %s" % (gap, netstas))
+        # calculate secondary azimuthal gap
+        gaps = azims - np.roll(azims, 2)
+        gaps[0] += 360.0
+        gaps[1] += 360.0
+        gap = gaps.max()
+        i_ = gaps.argmax()
+        netstas = (azim_list[i_][1], azim_list[i_-2][1])
+        origin.quality.secondary_azimuthal_gap = gap
+        self.info(("Secondary azimuthal gap of "
+                   "%s between stations %s" % (gap, netstas)))
+
+    def removeDuplicatePicks(self):
+        """
+        Makes sure that any waveform_id/phase_hint combination is unique in
+        picks. Leave first occurence, remove all others and warn.
+
+        XXX should be called when fetching an event.
+        """
+        picks = self.catalog[0].picks
+        _ids = [p.waveform_id for p in picks]
+        _phase_hints = [p.phase_hint for p in picks]
+        msg = "For picks, any waveform_id / phase_hint combination must " + \
+              "be unique. Some non-unique picks were removed:"
+        for _id in _ids:
+            for _phase_hint in _phase_hints:
+                picks = [p for p in picks
+                         if p.phase_hint == _phase_hint
+                         and p.waveform_id == _id]
+                if len(picks) > 1:
+                    self.critical(msg)
+                    for p in picks[1:]:
+                        self.critical(str(p))
+                        self.catalog[0].picks.remove(p)
+
+    def setPick(self, pick):
+        """
+        Replace stored pick with given pick object.
+        """
+        picks = self.catalog[0].picks
+        old = self.getPick(waveform_id=pick.waveform_id, phase_hint=pick.phase_hint)
+        picks.remove(old)
+        picks.append(pick)
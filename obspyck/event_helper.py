@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import re
+import threading
 import warnings
 from copy import deepcopy
 
@@ -17,6 +18,8 @@ AGENCY_URI = "%s/agency" % ID_ROOT
 CLASSES_TO_PATCH = [
     'FocalMechanism', 'StationMagnitudeContribution', 'StationMagnitude',
     'Magnitude', 'Catalog', 'Event', 'Origin', 'Pick', 'Arrival', 'Amplitude']
+# patching of the QuakeML reader module is not thread safe
+_READ_QUAKEML_LOCK = threading.Lock()
 
 
 # we're setting some attributes for internal purposes and want to ignore those
@@ -295,17 +298,21 @@ def readQuakeML(*args, **kwargs):
     """
     Patched readEvents function from obspy that creates instances of our
     subclassed event classes instead of the original obspy classes.
+    Can be used from multiple threads.
     """
-    bkp = {}
-    # replace original event classes with subclasses
-    for classname in CLASSES_TO_PATCH:
-        bkp[classname] = obspy.core.event.__dict__[classname]
-        obspy.io.quakeml.core.__dict__[classname] = local[classname]
     from obspy.io.quakeml.core import _read_quakeml
-    ret = obspy.io.quakeml.core._read_quakeml(*args, **kwargs)
-    # reset original event classes
-    for classname, class_ in bkp.iteritems():
-        obspy.io.quakeml.core.__dict__[classname] = bkp[classname]
+    with _READ_QUAKEML_LOCK:
+        bkp = {}
+        # replace original event classes with subclasses
+        for classname in CLASSES_TO_PATCH:
+            bkp[classname] = obspy.core.event.__dict__[classname]
+            obspy.io.quakeml.core.__dict__[classname] = local[classname]
+        try:
+            ret = obspy.io.quakeml.core._read_quakeml(*args, **kwargs)
+        finally:
+            # reset original event classes
+            for classname, class_ in bkp.iteritems():
+                obspy.io.quakeml.core.__dict__[classname] = bkp[classname]
     return ret
 
 
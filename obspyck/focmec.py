@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------
+# Filename: focmec.py
+#  Purpose: Focal mechanism grid search on first motion polarities
+#   Author: agent
+#    Email: agent@local
+#  License: GPLv2
+#
+# Copyright (C) 2026 agent
+# -------------------------------------------------------------------
+"""
+Grid search for double couple focal mechanisms that fit first motion
+polarities (same kind of search as done by FOCMEC, without running the
+external program).
+
+Does not depend on any GUI components and can be used e.g. in batch
+processing.
+"""
+import numpy as np
+
+
+# FOCMEC polarity identifiers: phase type (0: P, 1: SV, 2: SH) and sign of
+# the radiation amplitude (Aki & Richards convention, SV positive for motion
+# in direction of increasing takeoff angle, SH positive clockwise as seen from
+# above, i.e. to the right looking from the source towards the station)
+POLARITIES = {"U": (0, 1), "C": (0, 1), "D": (0, -1),
+              "F": (1, 1), "B": (1, -1),
+              "R": (2, 1), "L": (2, -1)}
+# number of grid points evaluated at once, limits memory usage
+CHUNK_SIZE = 20000
+
+
+def radiation_pattern(strike, dip, rake, azimuth, takeoff):
+    """
+    Far field P, SV and SH radiation amplitudes of double couple sources
+    (Aki & Richards, eq. 4.89).
+
+    All angles in degrees, takeoff angle measured from downward vertical.
+    Arguments are broadcast against each other, e.g. source parameters of
+    shape ``(n, 1)`` and station geometry of shape ``(m, )`` give results of
+    shape ``(n, m)``.
+
+    :returns: Tuple of P, SV and SH amplitudes.
+    """
+    strike, dip, rake, azimuth, takeoff = [
+        np.radians(x) for x in (strike, dip, rake, azimuth, takeoff)]
+    phi = azimuth - strike
+    sin_rake = np.sin(rake)
+    cos_rake = np.cos(rake)
+    sin_dip = np.sin(dip)
+    cos_dip = np.cos(dip)
+    sin_2dip = np.sin(2 * dip)
+    cos_2dip = np.cos(2 * dip)
+    sin_i = np.sin(takeoff)
+    cos_i = np.cos(takeoff)
+    sin_2i = np.sin(2 * takeoff)
+    cos_2i = np.cos(2 * takeoff)
+    sin_phi = np.sin(phi)
+    cos_phi = np.cos(phi)
+    sin_2phi = np.sin(2 * phi)
+    cos_2phi = np.cos(2 * phi)
+    p = (cos_rake * sin_dip * sin_i ** 2 * sin_2phi -
+         cos_rake * cos_dip * sin_2i * cos_phi +
+         sin_rake * sin_2dip * (cos_i ** 2 - sin_i ** 2 * sin_phi ** 2) +
+         sin_rake * cos_2dip * sin_2i * sin_phi)
+    sv = (sin_rake * cos_2dip * cos_2i * sin_phi -
+          cos_rake * cos_dip * cos_2i * cos_phi +
+          0.5 * cos_rake * sin_dip * sin_2i * sin_2phi -
+          0.5 * sin_rake * sin_2dip * sin_2i * (1 + sin_phi ** 2))
+    sh = (cos_rake * cos_dip * cos_i * sin_phi +
+          cos_rake * sin_dip * sin_i * cos_2phi +
+          sin_rake * cos_2dip * cos_i * cos_phi -
+          0.5 * sin_rake * sin_2dip * sin_i * sin_2phi)
+    return p, sv, sh
+
+
+def polarity_misfit(strikes, dips, rakes, azimuths, takeoffs, polarities):
+    """
+    Counts polarity errors of focal mechanisms.
+
+    :type strikes, dips, rakes: :class:`numpy.ndarray`
+    :param strikes, dips, rakes: Source parameters of ``n`` focal mechanisms
+        in degrees.
+    :type azimuths, takeoffs: :class:`numpy.ndarray`
+    :param azimuths, takeoffs: Station azimuths and takeoff angles of ``m``
+        observations in degrees.
+    :type polarities: list of str
+    :param polarities: FOCMEC polarity identifiers of the observations (see
+        :const:`POLARITIES`).
+    :returns: Array of shape ``(n, 3)`` with numbers of P, SV and SH polarity
+        errors and array of shape ``(n, )`` with the mean radiation amplitude
+        in direction of the observed polarities (higher values for solutions
+        with observations farther away from nodal planes).
+    """
+    phases, signs = np.array([POLARITIES[pol] for pol in polarities],
+                             dtype=np.int8).reshape(-1, 2).T
+    azimuths = np.asarray(azimuths, dtype=np.float64)
+    takeoffs = np.asarray(takeoffs, dtype=np.float64)
+    errors = np.empty((len(strikes), 3), dtype=np.int64)
+    fit = np.empty(len(strikes), dtype=np.float64)
+    for start in range(0, len(strikes), CHUNK_SIZE):
+        stop = start + CHUNK_SIZE
+        amplitudes = radiation_pattern(
+            strikes[start:stop, np.newaxis], dips[start:stop, np.newaxis],
+            rakes[start:stop, np.newaxis], azimuths, takeoffs)
+        # pick amplitude of the right phase type for every observation
+        amplitudes = np.choose(phases, amplitudes)
+        amplitudes = amplitudes * signs
+        fit[start:stop] = amplitudes.mean(axis=1)
+        wrong = amplitudes < 0
+        for i in range(3):
+            errors[start:stop, i] = wrong[:, phases == i].sum(axis=1)
+    return errors, fit
+
+
+def _grid(start, stop, step):
+    """
+    Grid points from start to stop (inclusive) with (approximately) the given
+    spacing.
+    """
+    count = max(int(round((stop - start) / float(step))), 1)
+    return np.linspace(start, stop, count + 1)
+
+
+def grid_search(azimuths, takeoffs, polarities, max_errors=0, step=5.0,
+                refinements=2, max_solutions=100):
+    """
+    Grid search over strike, dip and rake for focal mechanisms with the
+    fewest polarity errors.
+
+    Like the focmec wrapper script, which raises the allowed number of
+    polarity errors from zero until solutions are found, solutions with the
+    smallest number of errors on the initial grid are accepted, plus
+    `max_errors` more errors. So inconsistent polarities still give
+    solutions.
+
+    The search starts on a regular grid with the given step width. For every
+    refinement the grid spacing is halved around the accepted solutions only,
+    so fine grids can be searched at a fraction of the cost of a regular fine
+    grid.
+
+    :type max_errors: int
+    :param max_errors: Number of polarity errors accepted in addition to the
+        smallest number of errors of any solution on the initial grid.
+
+    :type azimuths, takeoffs: list of float
+    :param azimuths, takeoffs: Station azimuths and takeoff angles of the
+        observations in degrees.
+    :type polarities: list of str
+    :param polarities: FOCMEC polarity identifiers of the observations (see
+        :const:`POLARITIES`).
+    :type max_solutions: int
+    :param max_solutions: Maximum number of solutions returned (the ones with
+        fewest polarity errors, see :func:`polarity_misfit` for how solutions
+        with equal number of errors are ranked), ``None`` for all solutions.
+    :returns: List of ``(dip, strike, rake, p_errors, sv_errors, sh_errors)``
+        (same order as in FOCMEC output), best solutions first. Empty if no
+        solution was found.
+    """
+    strikes, dips, rakes = np.meshgrid(
+        _grid(0, 360, step)[:-1], _grid(0, 90, step),
+        _grid(-180, 180, step)[:-1], indexing="ij")
+    grid = np.column_stack([strikes.ravel(), dips.ravel(), rakes.ravel()])
+    for i in range(refinements + 1):
+        errors, fit = polarity_misfit(grid[:, 0], grid[:, 1], grid[:, 2],
+                                      azimuths, takeoffs, polarities)
+        if i == 0:
+            allowed_errors = errors.sum(axis=1).min() + max_errors
+        accepted = errors.sum(axis=1) <= allowed_errors
+        grid = grid[accepted]
+        errors = errors[accepted]
+        fit = fit[accepted]
+        if not len(grid) or i == refinements:
+            break
+        # refine around accepted solutions with half the grid spacing
+        step /= 2.0
+        offsets = np.array([-step, 0, step])
+        offsets = np.stack(np.meshgrid(offsets, offsets, offsets,
+                                       indexing="ij"), axis=-1).reshape(-1, 3)
+        grid = (grid[:, np.newaxis, :] + offsets).reshape(-1, 3)
+        grid[:, 0] %= 360
+        grid[:, 1] = np.clip(grid[:, 1], 0, 90)
+        grid[:, 2] = (grid[:, 2] + 180) % 360 - 180
+        grid = np.unique(np.round(grid, 6), axis=0)
+    order = np.lexsort((-fit, errors.sum(axis=1)))[:max_solutions]
+    return [(grid[j, 1], grid[j, 0], grid[j, 2]) + tuple(errors[j])
+            for j in order]
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------
+# Filename: hyp2000.py
+#  Purpose: Reading of Hypo2000 location output
+#   Author: agent
+#    Email: agent@local
+#  License: GPLv2
+#
+# Copyright (C) 2026 agent
+# -------------------------------------------------------------------
+"""
+Single pass parser for Hypo2000 print output (``hypo.prt``).
+
+Does not depend on any GUI components and can be used e.g. in batch
+processing.
+"""
+from collections import namedtuple
+
+from obspy import UTCDateTime
+
+
+_HEADER_ORIGIN = " YEAR MO DA  --ORIGIN--"
+_HEADER_QUALITY = " NSTA NPHS  DMIN MODEL"
+_HEADER_ARRIVALS = " STA NET COM L CR DIST AZM"
+
+# One phase line of the station list of a print file. ``station`` is the
+# station code as used in the Hypo2000 run (e.g. a 4 letter alias).
+# S phases that are printed in the line following the P phase of the same
+# station (with the station columns left blank) get station, distance,
+# azimuth and incidence angle of the previous line.
+# Distance is in kilometers, angles in degrees.
+Hyp2000Arrival = namedtuple("Hyp2000Arrival", [
+    "station", "onset", "phase", "polarity", "distance", "azimuth",
+    "incidence", "residual", "weight"])
+
+
+class Hyp2000Location(object):
+    """
+    Location result for one event of a Hypo2000 print file.
+
+    ``depth`` is in kilometers (positive down), ``error_horizontal`` and
+    ``error_depth`` are in kilometers as well.
+    """
+    def __init__(self):
+        self.time = None
+        self.latitude = None
+        self.longitude = None
+        self.depth = None
+        self.rms = None
+        self.error_horizontal = None
+        self.error_depth = None
+        self.gap = None
+        self.model = None
+        self.arrivals = []
+
+    def is_complete(self):
+        """
+        Whether all information needed for an origin could be read.
+        """
+        return None not in (self.time, self.latitude, self.longitude,
+                            self.depth, self.rms, self.error_horizontal,
+                            self.error_depth, self.gap, self.model)
+
+
+def _parse_origin(line, location):
+    location.time = UTCDateTime(
+        int(line[1:5]), int(line[6:8]), int(line[9:11]), int(line[13:15]),
+        int(line[15:17]), float(line[18:23]))
+    lat = int(line[25:27]) + float(line[28:33]) / 60.
+    if line[27] == "S":
+        lat = -lat
+    lon = int(line[35:38]) + float(line[39:44]) / 60.
+    if line[38] == "W":
+        lon = -lon
+    location.latitude = lat
+    location.longitude = lon
+    location.depth = float(line[46:51])
+    location.rms = float(line[52:57])
+    location.error_horizontal = float(line[58:63])
+    location.error_depth = float(line[64:69])
+
+
+def iter_hyp2000_prt(lines):
+    """
+    Parse Hypo2000 print output, yielding one :class:`Hyp2000Location` per
+    event.
+
+    :param lines: Iterable of lines, e.g. an open file.
+    """
+    location = None
+    # what the next line is expected to contain, if anything specific
+    expect = None
+    in_arrivals = False
+    station_info = None
+    for line in lines:
+        if expect == "origin":
+            expect = None
+            _parse_origin(line, location)
+            continue
+        elif expect == "gap":
+            expect = "model"
+            location.gap = int(line[23:26])
+            continue
+        elif expect == "model":
+            expect = None
+            location.model = line[49:].strip()
+            continue
+        if line.startswith(_HEADER_ORIGIN):
+            if location is not None:
+                yield location
+            location = Hyp2000Location()
+            expect = "origin"
+            in_arrivals = False
+            station_info = None
+            continue
+        if location is None:
+            continue
+        if line.startswith(_HEADER_QUALITY):
+            expect = "gap"
+        elif line.startswith(_HEADER_ARRIVALS):
+            in_arrivals = True
+        elif in_arrivals and len(line) > 33 and line[32] in ("P", "S"):
+            station = line[0:6].strip()
+            if station:
+                station_info = (station, float(line[18:23]),
+                                int(line[23:26]), int(line[27:30]))
+            elif station_info is None:
+                continue
+            station, distance, azimuth, incidence = station_info
+            location.arrivals.append(Hyp2000Arrival(
+                station=station, onset=line[31], phase=line[32],
+                polarity=line[33], distance=distance, azimuth=azimuth,
+                incidence=incidence, residual=float(line[61:66]),
+                weight=float(line[68:72])))
+    if location is not None:
+        yield location
+
+
+def read_hyp2000_prt(filename):
+    """
+    Read Hypo2000 print output file (or file-like object).
+
+    :rtype: list of :class:`Hyp2000Location`
+    """
+    if hasattr(filename, "read"):
+        return list(iter_hyp2000_prt(filename))
+    with open(filename, "rt") as fh:
+        return list(iter_hyp2000_prt(fh))
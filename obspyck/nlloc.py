@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------
+# Filename: nlloc.py
+#  Purpose: Reading of NonLinLoc location output
+#   Author: agent
+#    Email: agent@local
+#  License: GPLv2
+#
+# Copyright (C) 2026 agent
+# -------------------------------------------------------------------
+"""
+Single pass parser for NonLinLoc hypocenter-phase files (``*.hyp``).
+
+Does not depend on any GUI components and can be used e.g. in batch
+processing.
+"""
+import re
+from collections import namedtuple
+
+from obspy import UTCDateTime
+
+
+# month abbreviations as used by NonLinLoc, parsed without going through
+# the (locale dependent) strptime
+MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6, 'Jul': 7,
+    'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+_SIGNATURE_DATE = re.compile(r"^(?:run:)?(\d{1,2})([A-Za-z]{3})(\d{4})$")
+_SIGNATURE_TIME = re.compile(r"^(\d{1,2})h(\d{1,2})m(\d{1,2})$")
+
+
+# One phase line of the synthetic phase block of a hyp file.
+#
+# Order of fields in the hyp file:
+# ID Ins Cmp On Pha FM Q Date HrMn Sec Coda Amp Per PriorWt > Err ErrMag
+# TTpred Res Weight StaLoc(X Y Z) SDist SAzim RAz RDip RQual Tcorr
+# TTerrTcorr
+#
+# Fields:
+# ID (char*6)
+#     station name or code
+# Ins (char*4)
+#     instrument identification for the trace for which the time pick corresponds (i.e. SP, BRB, VBB)
+# Cmp (char*4)
+#     component identification for the trace for which the time pick corresponds (i.e. Z, N, E, H)
+# On (char*1)
+#     description of P phase arrival onset; i, e
+# Pha (char*6)
+#     Phase identification (i.e. P, S, PmP)
+# FM (char*1)
+#     first motion direction of P arrival; c, C, u, U = compression; d, D = dilatation; +, -, Z, N; . or ? = not readable.
+# Date (yyyymmdd) (int*6)
+#     year (with century), month, day
+# HrMn (hhmm) (int*4)
+#     Hour, min
+# Sec (float*7.4)
+#     seconds of phase arrival
+# Err (char*3)
+#     Error/uncertainty type; GAU
+# ErrMag (expFloat*9.2)
+#     Error/uncertainty magnitude in seconds
+# Coda (expFloat*9.2)
+#     coda duration reading
+# Amp (expFloat*9.2)
+#     Maxumim peak-to-peak amplitude
+# Per (expFloat*9.2)
+#     Period of amplitude reading
+# PriorWt (expFloat*9.2)
+#     A-priori phase weight
+# > (char*1)
+#     Required separator between first part (observations) and second part (calculated values) of phase record.
+# TTpred (float*9.4)
+#     Predicted travel time
+# Res (float*9.4)
+#     Residual (observed - predicted arrival time)
+# Weight (float*9.4)
+#     Phase weight (covariance matrix weight for LOCMETH GAU_ANALYTIC, posterior weight for LOCMETH EDT EDT_OT_WT)
+# StaLoc(X Y Z) (3 * float*9.4)
+#     Non-GLOBAL: x, y, z location of station in transformed, rectangular coordinates
+#     GLOBAL: longitude, latitude, z location of station
+# SDist (float*9.4)
+#     Maximum likelihood hypocenter to station epicentral distance in kilometers
+# SAzim (float*6.2)
+#     Maximum likelihood hypocenter to station epicentral azimuth in degrees CW from North
+# RAz (float*5.1)
+#     Ray take-off azimuth at maximum likelihood hypocenter in degrees CW from North
+# RDip (float*5.1)
+#     Ray take-off dip at maximum likelihood hypocenter in degrees upwards from vertical down (0 = down, 180 = up)
+# RQual (float*5.1)
+#     Quality of take-off angle estimation (0 = unreliable, 10 = best)
+# Tcorr (float*9.4)
+#     Time correction (station delay) used for location
+# TTerr (expFloat*9.2)
+#     Traveltime error used for location
+NLLocPhase = namedtuple("NLLocPhase", [
+    "station", "instrument", "component", "onset", "phase", "polarity",
+    "predicted_travel_time", "residual", "weight", "epicentral_distance",
+    "station_azimuth", "ray_azimuth", "ray_dip"])
+
+
+class NLLocHypocenter(object):
+    """
+    Location result for one event of a NonLinLoc hypocenter-phase file.
+
+    Coordinates ``x``/``y``/``z`` are in kilometers in the (rectangular)
+    coordinate system used in the location, ``z`` is positive down.
+    ``ellipsoid`` is the 68% confidence error ellipsoid as a tuple
+    ``(azimuth1, dip1, length1, azimuth2, dip2, length2, length3)``.
+    """
+    def __init__(self):
+        self.status = None
+        self.signature = None
+        self.nlloc_version = None
+        self.creation_time = None
+        self.x = None
+        self.y = None
+        self.z = None
+        self.time = None
+        self.rms = None
+        self.gap = None
+        self.ellipsoid = None
+        self.phases = []
+
+    def is_complete(self):
+        """
+        Whether all information needed for an origin could be read.
+        """
+        return None not in (self.nlloc_version, self.x, self.y, self.z,
+                            self.time, self.rms, self.gap, self.ellipsoid)
+
+
+def _parse_signature(line):
+    """
+    Returns signature, NonLinLoc version and creation time from SIGNATURE
+    line. Creation time is ``None`` if the timestamp can not be parsed.
+    """
+    line = line.rstrip().split('"')[1]
+    # fields can be separated by several blanks
+    signature, nlloc_version, date, time = line.rsplit(None, 3)
+    # new NLLoc > 6.0 seems to add prefix 'run:' before date
+    match_date = _SIGNATURE_DATE.match(date)
+    match_time = _SIGNATURE_TIME.match(time)
+    creation_time = None
+    if match_date and match_time:
+        day, month, year = match_date.groups()
+        month = MONTHS.get(month.capitalize())
+        if month is not None:
+            hour, minute, second = map(int, match_time.groups())
+            creation_time = UTCDateTime(int(year), month, int(day), hour,
+                                        minute, second)
+    return signature, nlloc_version, creation_time
+
+
+def _parse_phase(line):
+    line = line.split()
+    return NLLocPhase(
+        station=line[0], instrument=line[1], component=line[2],
+        onset=line[3], phase=line[4], polarity=line[5],
+        predicted_travel_time=float(line[15]), residual=float(line[16]),
+        weight=float(line[17]), epicentral_distance=float(line[21]),
+        station_azimuth=float(line[22]), ray_azimuth=float(line[23]),
+        ray_dip=float(line[24]))
+
+
+def iter_nlloc_hyp(lines):
+    """
+    Parse NonLinLoc hypocenter-phase output, yielding one
+    :class:`NLLocHypocenter` per event.
+
+    :param lines: Iterable of lines, e.g. an open file.
+    """
+    hypo = None
+    in_phases = False
+    for line in lines:
+        if in_phases:
+            if line.startswith("END_PHASE"):
+                in_phases = False
+            elif line.strip():
+                hypo.phases.append(_parse_phase(line))
+            continue
+        if line.startswith("END_NLLOC"):
+            if hypo is not None:
+                yield hypo
+            hypo = None
+            continue
+        if line.startswith("NLLOC"):
+            if hypo is not None:
+                yield hypo
+            hypo = NLLocHypocenter()
+            parts = line.split('"')
+            if len(parts) > 3:
+                hypo.status = parts[3]
+            continue
+        key = line.split(None, 1)[0] if line.strip() else None
+        if key not in ("SIGNATURE", "HYPOCENTER", "GEOGRAPHIC", "QUALITY",
+                       "STATISTICS", "PHASE"):
+            continue
+        # files without NLLOC header line
+        if hypo is None:
+            hypo = NLLocHypocenter()
+        fields = line.split()
+        if key == "SIGNATURE":
+            hypo.signature, hypo.nlloc_version, hypo.creation_time = \
+                _parse_signature(line)
+        elif key == "HYPOCENTER":
+            hypo.x = float(fields[2])
+            hypo.y = float(fields[4])
+            hypo.z = float(fields[6])
+        elif key == "GEOGRAPHIC" and fields[1] == "OT":
+            hypo.time = UTCDateTime(
+                int(fields[2]), int(fields[3]), int(fields[4]),
+                int(fields[5]), int(fields[6]), float(fields[7]))
+        elif key == "QUALITY":
+            hypo.rms = float(fields[8])
+            hypo.gap = float(fields[12])
+        elif key == "STATISTICS":
+            # error ellipsoid given as azimuth/dip/length of axis 1 and 2 and
+            # as length of axis 3
+            hypo.ellipsoid = tuple(
+                float(fields[i]) for i in (20, 22, 24, 26, 28, 30, 32))
+        elif key == "PHASE" and fields[1] == "ID":
+            in_phases = True
+    if hypo is not None:
+        yield hypo
+
+
+def read_nlloc_hyp(filename):
+    """
+    Read NonLinLoc hypocenter-phase file (or file-like object).
+
+    :rtype: list of :class:`NLLocHypocenter`
+    """
+    if hasattr(filename, "read"):
+        return list(iter_nlloc_hyp(filename))
+    with open(filename, "rt") as fh:
+        return list(iter_nlloc_hyp(fh))
+
+
+def read_nlloc_model(filename):
+    """
+    Returns name of the velocity model used in a NonLinLoc run, as found in
+    the control file of the run (``last.in``).
+    """
+    model = None
+    with open(filename, "rt") as fh:
+        for line in fh:
+            if line.startswith("LOCFILES"):
+                model = line.split()[3].split("/")[-1]
+    return model
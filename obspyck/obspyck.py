@@ -9,28 +9,24 @@
 #
 # Copyright (C) 2010 Tobias Megies, Lion Krischer
 #---------------------------------------------------------------------
-import locale
-import logging
+import multiprocessing
 import optparse
 import os
-import re
-import shutil
 import socket
 import sys
 import tempfile
+import time
 import warnings
-from collections import OrderedDict
-from ConfigParser import SafeConfigParser, NoOptionError, NoSectionError
+from collections import OrderedDict, deque
 from StringIO import StringIO
 
 from PyQt4 import QtGui, QtCore
 from PyQt4.QtCore import Qt
 import numpy as np
 import matplotlib as mpl
-import matplotlib.pyplot as plt
 import matplotlib.cm
 import matplotlib.transforms
-import requests
+from matplotlib.artist import setp
 from matplotlib.cm import get_cmap
 from matplotlib.patches import Ellipse
 from matplotlib.ticker import FuncFormatter, FormatStrFormatter, MaxNLocator
@@ -39,39 +35,33 @@ from matplotlib.backend_bases import MouseEvent as MplMouseEvent
 #sys.path.append('/baysoft/obspy/misc/symlink')
 #os.chdir("/baysoft/obspyck/")
 import obspy
-import obspy.imaging.cm as obspy_cm
-from obspy import UTCDateTime, Stream, Trace
-from obspy.core.event import CreationInfo, WaveformStreamID, \
-    OriginUncertainty, OriginQuality, Comment, NodalPlane, NodalPlanes
-from obspy.core.util import NamedTemporaryFile, AttribDict
-from obspy.geodetics.base import gps2dist_azimuth, kilometer2degrees
+from obspy import Stream
+from obspy.core.event import OriginUncertainty, Comment, NodalPlane, \
+    NodalPlanes
+from obspy.core.util import AttribDict
 from obspy.signal.util import util_lon_lat
-from obspy.signal.invsim import estimate_magnitude
-from obspy.signal.rotate import rotate_zne_lqt, rotate_ne_rt
-from obspy.signal.trigger import ar_pick
-from obspy.imaging.spectrogram import spectrogram
-from obspy.imaging.beachball import beach
-from obspy.clients.seishub import Client as SeisHubClient
 
 from . import __version__
 from .qt_designer import Ui_qMainWindow_obsPyck
+from .batch import main as batch_main
+from .core import ObsPyckCore, NAMESPACE
 from .util import (
-    _save_input_data, fetch_waveforms_with_metadata, matplotlib_color_to_rgb,
-    SplitWriter, LOGLEVELS, setup_external_programs, connect_to_server,
-    merge_check_and_cleanup_streams, cleanup_streams_without_metadata,
-    MultiCursor, WIDGET_NAMES, coords2azbazinc, map_rotated_channel_code,
-    ONSET_CHARS, POLARITY_CHARS, COMPONENT_COLORS, formatXTicklabels,
-    AXVLINEWIDTH, PROGRAMS, getArrivalForPick, POLARITY_2_FOCMEC, gk2lonlat,
-    errorEllipsoid2CartesianErrors, readNLLocScatter, ONE_SIGMA, VERSION_INFO,
-    MAG_MARKER, getPickForArrival, COMMANDLINE_OPTIONS, set_matplotlib_defaults,
-    check_keybinding_conflicts)
-from .event_helper import Catalog, Event, Origin, Pick, Arrival, \
-    Magnitude, StationMagnitude, StationMagnitudeContribution, \
-    FocalMechanism, ResourceIdentifier, ID_ROOT, readQuakeML, Amplitude, \
-    merge_events_in_catalog
-
-NAMESPACE = "http://erdbeben-in-bayern.de/xmlns/0.1"
-NSMAP = {"edb": NAMESPACE}
+    fetch_waveforms_with_metadata, matplotlib_color_to_rgb, SplitWriter,
+    connect_to_server, MultiCursor, WIDGET_NAMES, ONSET_CHARS,
+    POLARITY_CHARS, COMPONENT_COLORS, formatXTicklabels, AXVLINEWIDTH,
+    PROGRAMS, getArrivalForPick, POLARITY_2_FOCMEC, gk2lonlat,
+    errorEllipsoid2CartesianErrors, MAG_MARKER, COMMANDLINE_OPTIONS,
+    set_matplotlib_defaults, check_keybinding_conflicts, read_config,
+    BackgroundJobQueue, HTTPStatusError, is_transient_error, PrefetchCache,
+    clone_program_dir, split_phases_by_station, resample_stations,
+    resampled_location_errors, gse2_calibrated_amplitude, FOCMEC_PHASE_SETS)
+from .nlloc import read_nlloc_hyp
+from .hyp2000 import read_hyp2000_prt
+from .event_helper import FocalMechanism, ResourceIdentifier, ID_ROOT, \
+    readQuakeML, merge_events_in_catalog
+
+# delay (in ms) used to combine frequent consecutive updates of QuakeML text
+QML_UPDATE_DELAY = 300
 
 ICON_PATH = os.path.join(os.path.dirname(
     sys.modules[__name__].__file__), 'obspyck{}.gif')
@@ -81,7 +71,7 @@ if map(int, obspy.__version__.split('.')[:2]) < [1, 1]:
     warnings.warn(msg.format(obspy.__version__))
 
 
-class ObsPyck(QtGui.QMainWindow):
+class ObsPyck(QtGui.QMainWindow, ObsPyckCore):
     """
     Main Window with the design loaded from the Qt Designer.
     """
@@ -89,40 +79,12 @@ class ObsPyck(QtGui.QMainWindow):
         """
         Standard init.
         """
-        self.clients = clients
-        self.streams = streams
-        self.options = options
         self.keys = keys
-        self.config = config
 
         # make a mapping of seismic phases to colors as specified in config
         self.seismic_phases = OrderedDict(config.items('seismic_phases'))
         self._magnitude_color = config.get('base', 'magnitude_pick_color')
 
-        # TREF is the global reference time (zero in relative time scales)
-        if options.time is not None:
-            self.TREF = UTCDateTime(options.time)
-        else:
-            self.TREF = UTCDateTime(config.get("base", "time"))
-        if options.starttime_offset is not None:
-            self.T0 = self.TREF + options.starttime_offset
-        else:
-            self.T0 = self.TREF + config.getfloat("base", "starttime_offset")
-        # T1 is the end time specified by user
-        if options.duration is not None:
-            self.T1 = self.T0 + options.duration
-        else:
-            self.T1 = self.T0 + config.getfloat("base", "duration")
-
-        # save username of current user
-        try:
-            self.username = os.getlogin()
-        except:
-            try:
-                self.username = os.environ['USER']
-            except:
-                self.username = "unknown"
-
         # init the GUI stuff
         QtGui.QMainWindow.__init__(self)
         # Init the widgets from the autogenerated file.
@@ -163,30 +125,9 @@ class ObsPyck(QtGui.QMainWindow):
         # We automatically redirect all messages to both console and Gui boxes
         sys.stdout = SplitWriter(sys.stdout, self.widgets.qPlainTextEdit_stdout)
         sys.stderr = SplitWriter(sys.stderr, self.widgets.qPlainTextEdit_stderr)
-        # set up loggers
-        log1 = logging.getLogger("log1")
-        sh = logging.StreamHandler(sys.stdout)
-        sh.setFormatter(logging.Formatter('%(message)s'))
-        log1.addHandler(sh)
-        log2 = logging.getLogger("log2")
-        sh = logging.StreamHandler(sys.stderr)
-        sh.setFormatter(logging.Formatter('%(message)s'))
-        log2.addHandler(sh)
-        log2.setLevel("DEBUG")
-        self.log2 = log2
-        self.error = self.log2.error
-        # XXX TODO: parse verbose flag from command line
-        loglevel = LOGLEVELS.get(config.get("base", "verbosity"), None)
-        if loglevel is None:
-            loglevel = "CRITICAL"
-            self.error("unknown loglevel ('%s'), using loglevel 'normal'." % (
-                config.get("base", "verbosity")))
-        log1.setLevel(loglevel)
-        self.log1 = log1
-        self.info = self.log1.info
-        self.critical = self.log1.critical
-        self.debug = self.log1.debug
-        logging.getLogger().handlers = []
+        # set up loggers (on the redirected stdout/stderr), reference times
+        # and the (empty) event
+        ObsPyckCore.__init__(self, clients, streams, options, config)
 
         # Matplotlib figure.
         # we bind the figure to the FigureCanvas, so that it will be
@@ -233,35 +174,66 @@ class ObsPyck(QtGui.QMainWindow):
         facecolor = self.qMain.palette().color(QtGui.QPalette.Window).getRgb()
         self.fig.set_facecolor([value / 255.0 for value in facecolor])
 
-        try:
-            self.tmp_dir = setup_external_programs(options, config)
-        except IOError:
-            msg = "Cannot find external programs dir, localization " + \
-                  "methods/functions are deactivated"
-            warnings.warn(msg)
+        self._setup_external_programs()
 
         try:
             self.info('Using temporary directory: ' + self.tmp_dir)
+            # separate NLLoc working directories per velocity model, set up
+            # on first use
+            self._nlloc_model_dirs = {}
+            # same for focmec runs with different phase sets and allowed
+            # numbers of polarity errors
+            self._focmec_dirs = {}
+            # focal mechanisms can be searched with the focmec program or
+            # in-process
+            self.focmec_engine = self._get_config_value(
+                "focmec", "engine", default="external",
+                no_option_error_message=False)
+            if self.focmec_engine not in ("external", "native"):
+                msg = ("Unknown focmec engine '%s', using external focmec "
+                       "program.") % self.focmec_engine
+                self.error(msg)
+                self.focmec_engine = "external"
+            self.focmec_grid_step = self._get_config_value(
+                "focmec", "grid_step", default=5.0,
+                no_option_error_message=False, type=float)
+            self.focmec_grid_refinements = self._get_config_value(
+                "focmec", "grid_refinements", default=2,
+                no_option_error_message=False, type=int)
+            self.focmec_max_polarity_errors = self._get_config_value(
+                "focmec", "max_polarity_errors", default=0,
+                no_option_error_message=False, type=int)
+            self.focmec_max_solutions = self._get_config_value(
+                "focmec", "max_solutions", default=100,
+                no_option_error_message=False, type=int)
+            polarity_errors = self._get_config_value(
+                "focmec", "polarity_errors", default="0,1,2",
+                no_option_error_message=False) or "0"
+            self.focmec_polarity_errors = sorted(set(
+                int(errors) for errors in polarity_errors.split(",")))
 
-            self.catalog = Catalog()
-            event = Event()
-            event.set_creation_info_username(self.username)
-            self.catalog.events = [event]
-            self.setXMLEventID()
             # indicates which of the available focal mechanisms is selected
             self.focMechCurrent = None
-            _cmap_name = self._get_config_value(
-                "base", "spectrogram_colormap",
-                default=mpl.rcParams.get('image.cmap', 'jet'))
-            try:
-                cmap_spectrogram = getattr(obspy_cm, _cmap_name)
-            except AttributeError:
-                cmap_spectrogram = get_cmap(_cmap_name)
-            self.spectrogramColormap = cmap_spectrogram
+            # looked up when first showing spectrograms, see
+            # _get_spectrogram_colormap()
+            self.spectrogramColormap = None
             # indicates which of the available events from seishub was loaded
             self.seishubEventCurrent = None
             # indicates how many events are available from seishub
             self.seishubEventCount = None
+            # next events in the list get downloaded and parsed in the
+            # background while the analyst works on the current event
+            self.seishub_prefetch = self._get_config_value(
+                "base", "seishub_prefetch", default=5,
+                no_option_error_message=False, type=int)
+            self.event_prefetch = PrefetchCache(
+                self._fetch_event_from_seishub,
+                size=self.seishub_prefetch + 1)
+            # event list query results are reused for a short time
+            self.event_list_cache_ttl = self._get_config_value(
+                "base", "event_list_cache_ttl", default=30.0,
+                no_option_error_message=False, type=float)
+            self._event_list_cache = {}
             # connect to server for event pull/push if not already connected
             event_server_name = config.get("base", "event_server")
             if event_server_name:
@@ -280,31 +252,76 @@ class ObsPyck(QtGui.QMainWindow):
                     test_event_server_name, config, clients)
             else:
                 self.test_event_server = None
-
-            # save input raw data and metadata for eventual reuse
-            _save_input_data(streams, inventories, self.tmp_dir)
-
-            (warn_msg, merge_msg, streams) = \
-                    merge_check_and_cleanup_streams(streams, options, config)
-
-            # if it's not empty show the merge info message now
-            if merge_msg:
-                self.info(merge_msg)
-            # exit if no streams are left after removing everything not suited.
-            if not streams:
-                err = "No streams left to work with after removing bad streams."
-                raise Exception(err)
+            # uploads/deletions of events are done in a background thread, so
+            # that the analyst can go on working while these are in progress
+            # created on first upload/deletion, see _get_http_session()
+            self.http_session = None
+            self.upload_queue = BackgroundJobQueue(
+                retries=self._get_config_value(
+                    "base", "upload_retries", default=3,
+                    no_option_error_message=False, type=int),
+                backoff=self._get_config_value(
+                    "base", "upload_retry_backoff", default=2.0,
+                    no_option_error_message=False, type=float),
+                # retrying e.g. failed authentication would not help
+                retry_if=is_transient_error)
+            self.qLabel_uploadStatus = QtGui.QLabel()
+            self.statusBar().addPermanentWidget(self.qLabel_uploadStatus)
+            self.upload_timer = QtCore.QTimer(self)
+            self.connect(self.upload_timer, QtCore.SIGNAL("timeout()"),
+                         self._poll_upload_queue)
+            # raw input data is saved in the background as well
+            self.connect(self.upload_timer, QtCore.SIGNAL("timeout()"),
+                         self._poll_input_data_queue)
+            self.upload_timer.start(200)
+            # the QuakeML text view is only updated (debounced) while it is
+            # visible, because for large events this is rather expensive
+            self._qml_text_key = None
+            self.qml_timer = QtCore.QTimer(self)
+            self.qml_timer.setSingleShot(True)
+            self.connect(self.qml_timer, QtCore.SIGNAL("timeout()"),
+                         self._render_qml_text)
+            self.connect(self.widgets.qSplitter_horizontal,
+                         QtCore.SIGNAL("splitterMoved(int, int)"),
+                         self._on_qml_panel_moved)
+            # external programs (location, focal mechanism) run in the
+            # background, their output is streamed to the log panes
+            self._program_runs = []
+            # relocations with resampled stations run in parallel, in
+            # separate working directories per worker
+            self._resampling_dirs = {}
+            self.resampling_workers = self._get_config_value(
+                "base", "resampling_workers", default=0,
+                no_option_error_message=False, type=int) or \
+                multiprocessing.cpu_count()
+            self.resampling_bootstrap_runs = self._get_config_value(
+                "base", "resampling_bootstrap_runs", default=100,
+                no_option_error_message=False, type=int)
+            self.qPushButton_cancelPrograms = QtGui.QPushButton("cancel")
+            self.qPushButton_cancelPrograms.setToolTip(
+                "stop running location/focal mechanism programs")
+            self.qPushButton_cancelPrograms.setFocusPolicy(Qt.NoFocus)
+            self.qPushButton_cancelPrograms.hide()
+            self.statusBar().addPermanentWidget(
+                self.qPushButton_cancelPrograms)
+            self.connect(self.qPushButton_cancelPrograms,
+                         QtCore.SIGNAL("clicked()"),
+                         self._cancel_program_runs)
+            self.program_timer = QtCore.QTimer(self)
+            self.connect(self.program_timer, QtCore.SIGNAL("timeout()"),
+                         self._poll_program_runs)
+
+            # save input data, check and clean up streams. data read from
+            # local files only is available on disk already
+            from_servers = bool(self.options.station_combinations or
+                                self.options.seed_ids)
+            warn_msg = self._prepare_streams(inventories,
+                                             save_input_data=from_servers)
 
             # set up dictionaries to store phase_type/axes/line informations
             self.lines = {}
             self.texts = {}
 
-            # sort streams by station name
-            streams.sort(key=lambda st: st[0].stats['station'])
-            if not config.get("base", "no_metadata"):
-                streams = cleanup_streams_without_metadata(streams)
-            self.streams_bkp = [st.copy() for st in streams]
-            self._setup_4_letter_station_map()
             # XXX TODO replace old 'eventMapColors'
 
             #Define a pointer to navigate through the streams
@@ -362,11 +379,11 @@ class ObsPyck(QtGui.QMainWindow):
             #print self.canv.hasFocus()
 
             if self.event_server:
+                from obspy.clients.seishub import Client as SeisHubClient
                 if not isinstance(self.event_server, SeisHubClient):
                     msg = ("Only SeisHub implemented as event server right now.")
                     raise NotImplementedError(msg)
-
-            if not self.event_server or not isinstance(self.event_server, SeisHubClient):
+            else:
                 msg = ("Warning: SeisHub specific features will not work "
                        "(e.g. 'send Event').")
                 self.error(msg)
@@ -379,34 +396,6 @@ class ObsPyck(QtGui.QMainWindow):
             self.cleanup(skip_duplicate_check=True)
             raise
 
-    def _get_config_value(self, section, key, default=None,
-                          no_option_error_message=True, type=str):
-        """
-        Get a config key value, optionally with default value if key is missing
-        showing a warning about it by default.
-
-        :param type: str, int, float or bool
-        """
-        if type is bool:
-            config_getter = self.config.getboolean
-        elif type is int:
-            config_getter = self.config.getint
-        elif type is float:
-            config_getter = self.config.getfloat
-        elif type is str:
-            config_getter = self.config.get
-        else:
-            raise ValueError()
-        try:
-            return config_getter(section, key)
-        except NoOptionError:
-            if no_option_error_message:
-                msg = ("No configuration option '{key}' in section "
-                       "'{section}'. Defaulting to '{default}'").format(
-                           key=key, section=section, default=str(default))
-                self.error(msg)
-            return default
-
     def getCurrentStream(self):
         """
         returns currently active/displayed stream
@@ -419,41 +408,30 @@ class ObsPyck(QtGui.QMainWindow):
         """
         return str(self.widgets.qComboBox_phaseType.currentText())
 
-    def time_abs2rel(self, abstime):
-        """
-        Converts an absolute UTCDateTime to the time in ObsPyck's relative time
-        frame.
-
-        :type abstime: :class:`obspy.core.utcdatetime.UTCDateTime`
-        :param abstime: Absolute time in UTC.
-        :returns: time in ObsPyck's relative time as a float
-        """
-        return abstime - self.TREF
-
-    def time_rel2abs(self, reltime):
-        """
-        Converts a relative time in global relative time system to the absolute
-        UTCDateTime.
-
-        :type reltime: float
-        :param reltime: Relative time in ObsPyck's realtive time frame
-        :returns: absolute UTCDateTime
-        """
-        return self.TREF + reltime
-
     def cleanup(self, skip_duplicate_check=False):
         """
         Cleanup and prepare for quit.
         Do:
+            - stop running external programs
+            - wait for pending uploads/deletions
             - check if sysop duplicates are there
             - remove temporary directory and all contents
         """
+        for _, _, run, _ in getattr(self, "_program_runs", []):
+            run.cancel()
+        event_prefetch = getattr(self, "event_prefetch", None)
+        if event_prefetch is not None:
+            event_prefetch.close()
+        upload_queue = getattr(self, "upload_queue", None)
+        if upload_queue is not None and upload_queue.pending:
+            print "waiting for pending uploads/deletions to finish:"
+            for description in upload_queue.pending:
+                print "  - " + description
+            upload_queue.join()
+            self._poll_upload_queue(run_callbacks=False)
         if not skip_duplicate_check and self.event_server:
             self.checkForSysopEventDuplicates(self.T0, self.T1)
-        try:
-            shutil.rmtree(self.tmp_dir)
-        except:
-            pass
+        self._remove_tmp_dir()
 
     ###########################################################################
     ### signal handlers START #################################################
@@ -515,13 +493,11 @@ class ObsPyck(QtGui.QMainWindow):
         #self.delAllItems()
         self.clearOriginMagnitude()
         self.setXMLEventID()
-        self.doHyp2000()
-        self.loadHyp2000Data()
-        self.calculateEpiHypoDists()
-        self.updateMagnitude()
-        self.updateAllItems()
-        self.redraw()
-        self.widgets.qToolButton_showMap.setChecked(True)
+        self.doHyp2000(callback=self._on_hyp2000_finished)
+
+    def _on_hyp2000_finished(self, location):
+        self.loadHyp2000Data(location)
+        self._show_new_location()
 
     def on_qToolButton_doNlloc_clicked(self, *args):
         if args:
@@ -529,8 +505,111 @@ class ObsPyck(QtGui.QMainWindow):
         #self.delAllItems()
         self.clearOriginMagnitude()
         self.setXMLEventID()
-        self.doNLLoc()
-        self.loadNLLocOutput()
+        model = str(self.widgets.qComboBox_nllocModel.currentText())
+        self.doNLLoc(model, callback=self._on_nlloc_finished)
+
+    def _on_nlloc_finished(self, result):
+        self.loadNLLocOutput(result)
+        self._show_new_location()
+
+    def on_qToolButton_doNllocAllModels_clicked(self, *args):
+        if args:
+            return
+        self.doNLLocAllModels(callback=self._on_nlloc_all_models_finished)
+
+    def _on_nlloc_all_models_finished(self, results):
+        if not results:
+            return
+        result = self._select_nlloc_model(results)
+        if result is None:
+            return
+        self.clearOriginMagnitude()
+        self.setXMLEventID()
+        self.loadNLLocOutput(result)
+        self._show_new_location()
+
+    def on_qToolButton_resampleLocation_clicked(self, *args):
+        if args:
+            return
+        event = self.catalog[0]
+        if not event.origins:
+            self.error("Error: No origin to estimate uncertainties for.")
+            return
+        method_id = str(event.origins[0].method_id)
+        if "nlloc" in method_id:
+            locator = "nlloc"
+        elif "hyp2000" in method_id:
+            locator = "hyp_2000"
+        else:
+            self.error("Error: Resampling only works for origins located "
+                       "with hyp2000 or NLLoc.")
+            return
+        method, ok = QtGui.QInputDialog.getItem(
+            self, "Location uncertainty", "Resampling of stations:",
+            ["jackknife", "bootstrap"], 0, False)
+        if not ok:
+            return
+        self.doLocationResampling(locator, str(method),
+                                  self._on_location_resampling_finished)
+
+    def _on_location_resampling_finished(self, origin, method, locations,
+                                         runs):
+        if origin not in self.catalog[0].origins:
+            self.error("Origin changed during resampling, discarding "
+                       "results.")
+            return
+        if len(locations) < 3:
+            self.error("Error: Only %i of %i relocations succeeded, can not "
+                       "estimate uncertainties." % (len(locations), runs))
+            return
+        # jackknife needs every station left out exactly once
+        if method == "jackknife" and len(locations) != runs:
+            self.error("Error: Only %i of %i relocations succeeded, can not "
+                       "estimate uncertainties with jackknife (try "
+                       "bootstrap)." % (len(locations), runs))
+            return
+        lons, lats, depths, times = zip(*locations)
+        errX, errY, errZ, errT = resampled_location_errors(
+            lons, lats, depths, times, method)
+        # two standard deviations, same as for NLLoc error ellipsoid
+        errX *= 2
+        errY *= 2
+        errZ *= 2
+        errT *= 2
+        self.critical("Location uncertainty from %s (%i of %i relocations "
+                      "succeeded, two standard deviations): x: %.2fkm "
+                      "y: %.2fkm depth: %.2fkm time: %.3fs" % (
+                          method, len(locations), runs, errX, errY, errZ,
+                          errT))
+        if origin.origin_uncertainty is None:
+            origin.origin_uncertainty = OriginUncertainty()
+        ou = origin.origin_uncertainty
+        if errY > errX:
+            ou.azimuth_max_horizontal_uncertainty = 0
+        else:
+            ou.azimuth_max_horizontal_uncertainty = 90
+        ou.min_horizontal_uncertainty, \
+                ou.max_horizontal_uncertainty = \
+                sorted([errX * 1e3, errY * 1e3])
+        ou.preferred_description = "uncertainty ellipse"
+        origin.depth_errors.uncertainty = errZ * 1e3
+        origin.time_errors.uncertainty = errT
+        origin.comments.append(Comment(
+            text="Uncertainties estimated by %s resampling of stations "
+                 "(%i relocations, two standard deviations)" % (
+                     method, len(locations))))
+        self._catalog_changed()
+        self.update_qml_text()
+        if self.widgets.qToolButton_showMap.isChecked():
+            self.delEventMap()
+            self.fig.clear()
+            self.drawEventMap()
+            self.canv.draw()
+
+    def _show_new_location(self):
+        """
+        Update magnitudes and display after a new origin was set.
+        """
         self.calculateEpiHypoDists()
         self.updateMagnitude()
         self.updateAllItems()
@@ -541,8 +620,7 @@ class ObsPyck(QtGui.QMainWindow):
         if args:
             return
         self.clearFocmec()
-        self.doFocmec()
-        self.setXMLEventID()
+        self.doFocmec(callback=self.setXMLEventID)
 
     def on_qToolButton_showMap_toggled(self):
         state = self.widgets.qToolButton_showMap.isChecked()
@@ -663,6 +741,8 @@ class ObsPyck(QtGui.QMainWindow):
     def on_qToolButton_updateEventList_clicked(self, *args):
         if args:
             return
+        # an explicit refresh always asks the server again
+        self._invalidate_event_list()
         self.updateEventListFromSeisHub(self.T0, self.T1)
 
     def on_qToolButton_sendNewEvent_clicked(self, *args):
@@ -678,9 +758,7 @@ class ObsPyck(QtGui.QMainWindow):
             if not ok:
                 self.popupBadEventError(msg)
                 return
-        self.upload_event()
-        self.on_qToolButton_updateEventList_clicked()
-        self.checkForSysopEventDuplicates(self.T0, self.T1)
+        self.upload_event(callback=self._on_event_uploaded)
 
     def on_qToolButton_replaceEvent_clicked(self, *args):
         if args:
@@ -725,11 +803,11 @@ class ObsPyck(QtGui.QMainWindow):
         qMessageBox.setStandardButtons(QtGui.QMessageBox.Cancel | QtGui.QMessageBox.Ok)
         qMessageBox.setDefaultButton(QtGui.QMessageBox.Cancel)
         if qMessageBox.exec_() == QtGui.QMessageBox.Ok:
+            # jobs are processed in order, so the deletion is done before the
+            # upload of the replacement
             self.delete_event(resource_name)
             self.setXMLEventID(event_id)
-            self.upload_event()
-            self.on_qToolButton_updateEventList_clicked()
-            self.checkForSysopEventDuplicates(self.T0, self.T1)
+            self.upload_event(callback=self._on_event_uploaded)
 
     def on_qToolButton_deleteEvent_clicked(self, *args):
         if args:
@@ -762,8 +840,9 @@ class ObsPyck(QtGui.QMainWindow):
         qMessageBox.setStandardButtons(QtGui.QMessageBox.Cancel | QtGui.QMessageBox.Ok)
         qMessageBox.setDefaultButton(QtGui.QMessageBox.Cancel)
         if qMessageBox.exec_() == QtGui.QMessageBox.Ok:
-            self.delete_event(resource_name)
-            self.on_qToolButton_updateEventList_clicked()
+            self.delete_event(
+                resource_name,
+                callback=self.on_qToolButton_updateEventList_clicked)
 
     def on_qToolButton_saveEventLocally_clicked(self, *args):
         if args:
@@ -791,6 +870,7 @@ class ObsPyck(QtGui.QMainWindow):
             return
         event_server = self.config.get("base", "event_server")
         passwd = str(self.widgets.qLineEdit_sysopPassword.text())
+        from obspy.clients.seishub import Client as SeisHubClient
         tmp_client = SeisHubClient(
             base_url=self.config.get(event_server, "base_url"),
             user="sysop", password=passwd)
@@ -820,7 +900,7 @@ class ObsPyck(QtGui.QMainWindow):
         if args:
             return
         self.streams_bkp.sort(key=lambda stream: stream[0].id)
-        self.streams = [st.copy() for st in self.streams_bkp]
+        self.streams = list(self.streams_bkp)
         self.stPt = 0
         self.widgets.qComboBox_streamName.setCurrentIndex(self.stPt)
         self.update_stream_name_combobox_from_streams()
@@ -828,9 +908,11 @@ class ObsPyck(QtGui.QMainWindow):
     def on_qToolButton_sort_distance_clicked(self, *args):
         if args:
             return
-        self.streams_bkp.sort(key=self.epidist_for_stream)
-        self.streams = [st.copy() for st in self.streams_bkp]
-        epidists = [self.epidist_for_stream(st) for st in self.streams_bkp]
+        epidists = dict((id(st), self.epidist_for_stream(st))
+                        for st in self.streams_bkp)
+        self.streams_bkp.sort(key=lambda st: epidists[id(st)])
+        self.streams = list(self.streams_bkp)
+        epidists = [epidists[id(st)] for st in self.streams_bkp]
         suffixes = ['{:.1f}km'.format(dist) if dist is not None else '??km'
                     for dist in epidists]
         self.stPt = 0
@@ -849,7 +931,6 @@ class ObsPyck(QtGui.QMainWindow):
         if not isinstance(newvalue, int):
             return
         self.stPt = self.widgets.qComboBox_streamName.currentIndex()
-        self.streams[self.stPt] = self.streams_bkp[self.stPt].copy()
         stats = self.streams[self.stPt][0].stats
         self.info("Going to stream: %s.%s" % (stats.network, stats.station))
         self.drawStream()
@@ -871,7 +952,6 @@ class ObsPyck(QtGui.QMainWindow):
             pass
 
     def on_qToolButton_physical_units_toggled(self):
-        self.streams[self.stPt] = self.streams_bkp[self.stPt].copy()
         self.drawStream()
 
     def on_qDoubleSpinBox_waterlevel_valueChanged(self, newvalue):
@@ -909,7 +989,38 @@ class ObsPyck(QtGui.QMainWindow):
         self.clearEvent()
         self.updateAllItems()
         self._arpicker()
-        self.updateAllItems()
+
+    def on_qToolButton_coincidence_clicked(self, *args):
+        """
+        Run network coincidence trigger on all stations (see
+        :meth:`ObsPyckCore.coincidence_trigger`) and let the user choose a
+        triggered time window to zoom to.
+        """
+        if args:
+            return
+        windows = self.coincidence_trigger(
+            filter=self.widgets.qToolButton_filter.isChecked())
+        if not windows:
+            self.error("No network coincidence triggers found.")
+            return
+        items = []
+        for window in windows:
+            items.append("%.2fs (%s): %.1fs, %i stations: %s" % (
+                self.time_abs2rel(window['time']),
+                window['time'].strftime("%H:%M:%S.%f")[:-4],
+                window['duration'], window['coincidence_sum'],
+                " ".join(window['stations'])))
+        item, ok = QtGui.QInputDialog.getItem(
+            self, "Network coincidence trigger",
+            "Select triggered time window to show:", items, 0, False)
+        if not ok:
+            return
+        window = windows[items.index(str(item))]
+        # show some time before and after the triggered window
+        margin = max(window['duration'], 5.0)
+        start = self.time_abs2rel(window['time']) - margin
+        end = self.time_abs2rel(window['time']) + window['duration'] + margin
+        self.axs[0].set_xlim(start, end)
         self.redraw()
 
     def on_qComboBox_filterType_currentIndexChanged(self, newvalue):
@@ -1053,36 +1164,56 @@ class ObsPyck(QtGui.QMainWindow):
             self.on_qToolButton_spectrogram_toggled()
 
     def on_qPushButton_qml_update_clicked(self):
-        self.update_qml_text()
+        self._render_qml_text(force=True)
 
     ###########################################################################
     ### signal handlers END ###### ############################################
     ###########################################################################
 
-    def update_qml_text(self, qml=None):
-        if qml is None:
-            qml = self.get_QUAKEML_string()
-        self.widgets.qTextEdit_qml.setText(qml)
+    def update_qml_text(self):
+        """
+        Schedule an update of the QuakeML text view. Consecutive calls within
+        a short time are combined into one update.
+        """
+        self.qml_timer.start(QML_UPDATE_DELAY)
+
+    def _qml_panel_visible(self):
+        """
+        Whether the QuakeML text view is currently visible (i.e. the right
+        panel is not collapsed).
+        """
+        widget = self.widgets.qPlainTextEdit_qml
+        return (widget.isVisible() and widget.width() > 0 and
+                not widget.visibleRegion().isEmpty())
+
+    def _on_qml_panel_moved(self, pos, index):
+        if self._qml_panel_visible():
+            self.update_qml_text()
 
-    def _filter(self, stream):
+    def _render_qml_text(self, force=False):
         """
-        Applies filter currently selected in GUI to Trace or Stream object.
-        Also displays a message.
+        Show current QuakeML in text view. Unless forced, skipped if the text
+        view is not visible or if it already shows the current state.
         """
-        # get taper settings from config
-        taper_max_length = self._get_config_value(
-            'base', 'taper_max_length', default=5, type=float)
-        taper_max_percentage = self._get_config_value(
-            'base', 'taper_max_percentage', default=0.05, type=float)
-        taper_type = self._get_config_value(
-            'base', 'taper_type', default='cosine', type=str)
+        if not force and not self._qml_panel_visible():
+            return
+        xml = self.get_QUAKEML_string()
+        key = self._quakeml_cache[0]
+        if not force and key == self._qml_text_key:
+            return
+        self.widgets.qPlainTextEdit_qml.setPlainText(xml)
+        self._qml_text_key = key
 
+    def _get_filter_settings(self):
+        """
+        Returns filter currently selected in GUI (see
+        :meth:`ObsPyckCore._get_filter_settings`).
+        """
         w = self.widgets
         type = str(w.qComboBox_filterType.currentText()).lower()
         options = {}
         options['corners'] = int(w.qDoubleSpinBox_corners.value())
         options['zerophase'] = w.qCheckBox_zerophase.isChecked()
-        msg = ""
         if type in ("bandpass", "bandstop"):
             options['freqmin'] = w.qDoubleSpinBox_highpass.value()
             options['freqmax'] = w.qDoubleSpinBox_lowpass.value()
@@ -1090,134 +1221,32 @@ class ObsPyck(QtGui.QMainWindow):
             options['freq'] = w.qDoubleSpinBox_lowpass.value()
         elif type == "highpass":
             options['freq'] = w.qDoubleSpinBox_highpass.value()
-        if type in ("bandpass", "bandstop"):
-            msg = "%s (zerophase=%s): %.2f-%.2f Hz" % \
-                    (type, options['zerophase'],
-                     options['freqmin'], options['freqmax'])
-        elif type in ("lowpass", "highpass"):
-            msg = "%s (zerophase=%s): %.2f Hz" % \
-                    (type, options['zerophase'], options['freq'])
-        try:
-            stream.detrend("linear")
-            try:
-                stream.taper(max_percentage=taper_max_percentage,
-                             max_length=taper_max_length, type=taper_type)
-            except:
-                stream.taper()
-                msg = ('Error in stream tapering (old obspy version?). '
-                       'Tapering will be performed with Trace.taper() '
-                       'defaults.')
-                self.error(msg)
-            if w.qCheckBox_50Hz.isChecked():
-                for i_ in xrange(2):
-                    stream.filter("bandstop", freqmin=46, freqmax=54,
-                                  corners=2, zerophase=options['zerophase'])
-                msg2 = "50Hz Bandstop"
-                self.info(msg2)
-            stream.filter(type, **options)
-            self.info(msg)
-        except:
-            err = "Error during filtering. Showing unfiltered data."
-            self.error(err)
+        return type, options, w.qCheckBox_50Hz.isChecked()
 
-    def _physical_units(self, stream):
-        """
-        Corrects to physical units (m/s or m or m/s**2), as specified by
-        configuration file.
-        """
-        if isinstance(stream, Trace):
-            stream = Stream(traces=[stream])
+    def _get_water_level(self):
+        return float(self.widgets.qDoubleSpinBox_waterlevel.value())
 
-        w = self.widgets
-        water_level = float(w.qDoubleSpinBox_waterlevel.value())
-        output_units = self._get_config_value('base', 'physical_units',
-                                              default='velocity')
-        if output_units == 'velocity':
-            output_units = 'VEL'
-            label = '[m/s]'
-        elif output_units == 'displacement':
-            output_units = 'DISP'
-            label = '[m]'
-        elif output_units == 'acceleration':
-            output_units = 'ACC'
-            label = '[m/s**2]'
-        else:
-            msg = ('Unrecognized physical units in configuration option '
-                   '"physical_units" in section "base": "{}". Defaulting '
-                   'to m/s for physical units switch.').format(output_units)
-            self.error(msg)
-            output_units = 'VEL'
-            label = '[m/s]'
+    def _physical_units(self, stream):
+        label = ObsPyckCore._physical_units(self, stream)
         self.widgets.qToolButton_physical_units.setText(label)
-        msg = "Correcting to {} (water_level={:.1f}).".format(label,
-                                                              water_level)
+        return label
 
-        try:
-            if 'parser' in stream[0].stats:
-                # metadata from SEED
-                for tr in stream:
-                    tr.simulate(seedresp={'filename': tr.stats.parser,
-                                          'units': output_units},
-                                remove_sensitivity=True,
-                                water_level=water_level)
-            elif 'response' in stream[0].stats:
-                # metadata from StationXML
-                stream.remove_response(output=output_units,
-                                       water_level=water_level)
-            else:
-                msg = ('No Response object attached to trace, '
-                       'can not convert to physical units:\n')
-                self.error(msg + str(stream[0].stats))
-            self.info(msg)
-        except Exception as e:
-            err = ("Error during instrument correction. Showing uncorrected "
-                   "data.\n" + str(e))
-            self.error(err)
-
-    def _rotateLQT(self, stream, origin):
+    def _get_event_flags(self):
         """
-        Rotates stream to LQT with respect to station location in first trace
-        of stream and origin information.
-        Exception handling should be done outside this function.
-        Also displays a message.
+        Events are manually reviewed in the GUI, public flag and event type
+        are set in the GUI.
         """
-        # calculate backazimuth and incidence from station/event geometry
-        azim, bazim, inci = coords2azbazinc(stream, origin)
-        # replace ZNE data with rotated data
-        z = stream.select(component="Z")[0].data
-        n = stream.select(component="N")[0].data
-        e = stream.select(component="E")[0].data
-        self.info("using baz, takeoff: %s, %s" % (bazim, inci))
-        l, q, t = rotate_zne_lqt(z, n, e, bazim, inci)
-        for comp, data in zip("ZNE", (l, q, t)):
-            tr = stream.select(component=comp)[0]
-            tr.data = data
-            tr.stats.channel = map_rotated_channel_code(tr.stats.channel,
-                                                        "LQT")
-        self.info("Showing traces rotated to LQT.")
-
-    def _rotateZRT(self, stream, origin):
+        public = self.widgets.qCheckBox_public.isChecked()
+        event_quakeml_type = str(self.widgets.qComboBox_eventType.currentText())
+        return "manual", public, event_quakeml_type
+
+    def _get_sta_lta(self):
         """
-        Rotates stream to ZRT with respect to station location in first trace
-        of stream and origin information.
-        Exception handling should be done outside this function.
-        Also displays a message.
+        STA/LTA window lengths as set in the GUI.
         """
-        # calculate backazimuth from station/event geometry
-        azim, bazim, inci = coords2azbazinc(stream, origin)
-        # replace NE data with rotated data
-        n = stream.select(component="N")[0].data
-        e = stream.select(component="E")[0].data
-        self.info("using baz: %s" % bazim)
-        r, t = rotate_ne_rt(n, e, bazim)
-        stream.select(component="N")[0].data = r
-        stream.select(component="E")[0].data = t
-        for comp, data in zip("NE", (r, t)):
-            tr = stream.select(component=comp)[0]
-            tr.data = data
-            tr.stats.channel = map_rotated_channel_code(tr.stats.channel,
-                                                        "ZRT")
-        self.info("Showing traces rotated to ZRT.")
+        sta = self.widgets.qDoubleSpinBox_sta.value()
+        lta = self.widgets.qDoubleSpinBox_lta.value()
+        return sta, lta
 
     def _trigger(self, stream):
         """
@@ -1225,68 +1254,52 @@ class ObsPyck(QtGui.QMainWindow):
         Exception handling should be done outside this function.
         Also displays a message.
         """
-        sta = self.widgets.qDoubleSpinBox_sta.value()
-        lta = self.widgets.qDoubleSpinBox_lta.value()
+        sta, lta = self._get_sta_lta()
         stream.trigger("recstalta", sta=sta, lta=lta)
         self.info("Showing recSTALTA triggered traces.")
 
     def _arpicker(self):
         """
-        Run AR picker on all streams and set P/S picks accordingly.
-        Also displays a message.
-        """
-        try:
-            f1 = self.config.getfloat("ar_picker", "f1")
-            f2 = self.config.getfloat("ar_picker", "f2")
-            sta_p = self.config.getfloat("ar_picker", "sta_p")
-            lta_p = self.config.getfloat("ar_picker", "lta_p")
-            sta_s = self.config.getfloat("ar_picker", "sta_s")
-            lta_s = self.config.getfloat("ar_picker", "lta_s")
-            m_p = self.config.getint("ar_picker", "m_p")
-            m_s = self.config.getint("ar_picker", "m_s")
-            l_p = self.config.getfloat("ar_picker", "l_p")
-            l_s = self.config.getfloat("ar_picker", "l_s")
-        except (NoOptionError, NoSectionError) as e:
-            msg = ('To use AR Picker, you need to have a section [ar_picker] '
-                   'in your .obspyckrc with the following keys set: "f1", '
-                   '"f2", "lta_p", "sta_p", "lta_s", "sta_s", "m_p", "m_s", '
-                   '"l_p", "l_s" (compare documentation for '
-                   'obspy.signal.trigger.ar_pick\n%s') % str(e)
-            self.error(msg)
-            return
-        self.info("Setting automatic picks using AR picker:")
-        for i, st in enumerate(self.streams):
-            try:
-                z = st.select(component="Z")[0]
-                n = st.select(component="N")[0]
-                e = st.select(component="E")[0]
-            except IndexError:
-                msg = ('AR picker currently only implemented for Z/N/E data, '
-                       'but provided stream was:\n%s') % st
-                self.error(msg)
-                continue
-            try:
-                assert z.stats.sampling_rate == n.stats.sampling_rate == \
-                    e.stats.sampling_rate
-            except AssertionError:
-                msg = ('AR picker needs same sampling rate on all traces '
-                       'but provided stream was:\n%s') % st
-                self.error(msg)
-                continue
-            spr = z.stats.sampling_rate
-            p, s = ar_pick(z.data, n.data, e.data, spr, f1, f2, lta_p, sta_p,
-                           lta_s, sta_s, m_p, m_s, l_p, l_s)
-            for t, phase_hint, tr in zip((p, s), 'PS', (z, n)):
-                pick = self.getPick(phase_hint=phase_hint, setdefault=True,
-                                    seed_string=tr.id)
-                pick.setTime(z.stats.starttime + t)
-                self.info(str(pick))
-                self.info("%s pick set at %.3f (%s)" % (
-                    phase_hint, self.time_abs2rel(pick.time),
-                    pick.time.isoformat()))
+        Run AR picker on all streams in the background (see
+        :meth:`ObsPyckCore._start_arpicker`) showing a progress dialog, the
+        new picks are shown when it finished. If it gets cancelled, picks of
+        stations that were already done are set.
+        """
+        job = self._start_arpicker()
+        if job is None:
+            return
+        # modal, so that the event can not be changed while picking
+        dialog = QtGui.QProgressDialog(
+            "Setting automatic picks using AR picker...", "Cancel", 0,
+            job.total, self)
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(500)
+        self.connect(dialog, QtCore.SIGNAL("canceled()"), job.cancel)
+        timer = QtCore.QTimer(self)
+        self._arpicker_run = (job, dialog, timer, [])
+        self.connect(timer, QtCore.SIGNAL("timeout()"), self._poll_arpicker)
+        timer.start(100)
+
+    def _poll_arpicker(self):
+        """
+        Show progress of the AR picker and set picks when it finished.
+        """
+        job, dialog, timer, results = self._arpicker_run
+        results += job.poll()
+        if not job.finished:
+            dialog.setValue(job.count)
+            return
+        timer.stop()
+        dialog.reset()
+        timer.deleteLater()
+        dialog.deleteLater()
+        self._arpicker_run = None
+        if job.cancelled:
+            self.error("AR picker was cancelled, picks set for %i of %i "
+                       "stations." % (len(results), job.total))
+        self._set_arpicker_picks(results)
         self.updateAllItems()
         self.redraw()
-        return
 
     def debugger(self):
         sys.stdout = self.stdout_backup
@@ -1424,6 +1437,22 @@ class ObsPyck(QtGui.QMainWindow):
             ax.set_ybound(upper=ymax, lower=ymin)
         self.redraw()
 
+    def _get_spectrogram_colormap(self):
+        """
+        Colormap for spectrograms (config option ``spectrogram_colormap`` in
+        section ``[base]``), looked up on first use.
+        """
+        if self.spectrogramColormap is None:
+            import obspy.imaging.cm as obspy_cm
+            name = self._get_config_value(
+                "base", "spectrogram_colormap",
+                default=mpl.rcParams.get('image.cmap', 'jet'))
+            try:
+                self.spectrogramColormap = getattr(obspy_cm, name)
+            except AttributeError:
+                self.spectrogramColormap = get_cmap(name)
+        return self.spectrogramColormap
+
     def drawAxes(self):
         st = self.getCurrentStream()
         fig = self.fig
@@ -1456,11 +1485,12 @@ class ObsPyck(QtGui.QMainWindow):
                                                                   ax.transAxes))
             ax.xaxis.set_major_formatter(FuncFormatter(formatXTicklabels))
             if self.widgets.qToolButton_spectrogram.isChecked():
+                from obspy.imaging.spectrogram import spectrogram
                 log = self.widgets.qCheckBox_spectrogramLog.isChecked()
                 wlen = self.widgets.qDoubleSpinBox_wlen.value()
                 perlap = self.widgets.qDoubleSpinBox_perlap.value()
                 spectrogram(tr.data, tr.stats.sampling_rate, log=log, wlen=wlen, per_lap=perlap,
-                            cmap=self.spectrogramColormap, axes=ax, zorder=-10)
+                            cmap=self._get_spectrogram_colormap(), axes=ax, zorder=-10)
                 textcolor = "red"
                 # adjust spectrogram start time offset, relative to reference time
                 if log:
@@ -1509,10 +1539,13 @@ class ObsPyck(QtGui.QMainWindow):
         Update current stream either with raw/rotated/filtered data
         according to current button settings in GUI.
         """
-        # XXX copying is only necessary if "Filter" or "Rotate" is selected
-        # XXX it is simpler for the code to just copy in any case..
-        self.streams[self.stPt] = self.streams_bkp[self.stPt].copy()
-        st = self.streams[self.stPt]
+        w = self.widgets
+        # original data only gets copied if it is going to be modified
+        modify = any(button.isChecked() for button in (
+            w.qToolButton_physical_units, w.qToolButton_filter,
+            w.qToolButton_rotateLQT, w.qToolButton_rotateZRT,
+            w.qToolButton_trigger))
+        st = self._stream_view(self.stPt, modify=modify)
         # To display filtered data we overwrite our alias to current stream
         # and replace it with the filtered data.
         if self.widgets.qToolButton_physical_units.isChecked():
@@ -1646,6 +1679,7 @@ class ObsPyck(QtGui.QMainWindow):
                 self.debug(map(str, [ev.inaxes, self.axs, phase_type, tr.id]))
                 self.info(str(pick))
                 pick.setTime(self.time_rel2abs(pickSample))
+                self._catalog_changed()
                 #self.updateAxes(ev.inaxes)
                 self.updateAllItems()
                 self.redraw()
@@ -1679,6 +1713,7 @@ class ObsPyck(QtGui.QMainWindow):
                     raise NotImplementedError()
                 extra.weight = {'value': value,
                                 'namespace': NAMESPACE}
+                self._catalog_changed()
                 self.updateAllItems()
                 self.redraw()
                 self.info("%s weight set to %i" % (phase_type, value))
@@ -1706,6 +1741,7 @@ class ObsPyck(QtGui.QMainWindow):
                 #              "over R or T axes."
                 #        self.error(err)
                 pick.polarity = value
+                self._catalog_changed()
                 self.updateAllItems()
                 self.redraw()
                 self.info("%s polarity set to %s" % (phase_type, value))
@@ -1721,6 +1757,7 @@ class ObsPyck(QtGui.QMainWindow):
                     value = "emergent"
                 else:
                     raise NotImplementedError()
+                self._catalog_changed()
                 self.updateAllItems()
                 self.redraw()
                 self.info("%s onset set to %s" % (phase_type, pick.onset))
@@ -1738,6 +1775,7 @@ class ObsPyck(QtGui.QMainWindow):
                 if pick is None or not pick.time:
                     return
                 pick.setErrorTime(self.time_rel2abs(pickSample))
+                self._catalog_changed()
                 self.updateAllItems()
                 self.redraw()
                 self.info("%s error pick set at %s" % (phase_type,
@@ -1764,16 +1802,16 @@ class ObsPyck(QtGui.QMainWindow):
                 elif ev.key == keys['setMagMax']:
                     val = np.max(ydata[xpos-picker_width:xpos+picker_width])
                     tmp_magtime = cutoffSamples + np.argmax(ydata[xpos-picker_width:xpos+picker_width])
-                # XXX TODO GSE calib handling! special handling for GSE2 data: apply calibration
-                if tr.stats._format == "GSE2":
-                    val = val / (tr.stats.calib * 2 * np.pi / tr.stats.gse2.calper)
+                val = gse2_calibrated_amplitude(tr, val)
                 # save time of magnitude minimum in seconds
                 tmp_magtime = self.time_rel2abs(t[tmp_magtime])
                 if ev.key == keys['setMagMin']:
                     ampl.setLow(tmp_magtime, val)
                 elif ev.key == keys['setMagMax']:
                     ampl.setHigh(tmp_magtime, val)
-                self.updateMagnitude()
+                self._catalog_changed()
+                self.updateMagnitude(stations=[(
+                    tr.stats.network, tr.stats.station, tr.stats.location)])
                 self.updateAllItems()
                 self.redraw()
                 return
@@ -1785,7 +1823,10 @@ class ObsPyck(QtGui.QMainWindow):
             if phase_type == 'Mag':
                 if amplitude is not None:
                     self.delAmplitude(amplitude)
-                    self.updateMagnitude()
+                    wid = amplitude.waveform_id
+                    self.updateMagnitude(stations=[(
+                        wid.network_code, wid.station_code,
+                        wid.location_code)])
                     self.updateAllItems()
                     self.redraw()
                 return
@@ -2019,13 +2060,19 @@ class ObsPyck(QtGui.QMainWindow):
             labels = ["%s %s" % (l, s) for l, s in zip(labels, suffixes)]
         self.widgets.qComboBox_streamName.addItems(labels)
 
-    def doFocmec(self):
-        prog_dict = PROGRAMS['focmec']
-        files = prog_dict['files']
+    def doFocmec(self, callback=None):
+        """
+        Writes input files for focmec and starts focmec in the background,
+        once for each phase set (see :const:`obspyck.util.FOCMEC_PHASE_SETS`)
+        with polarities and each allowed number of polarity errors (config
+        option ``polarity_errors`` in section ``[focmec]``), all runs at the
+        same time in separate working directories. Focal mechanisms of all
+        runs are set (ranked by misfit) when all runs finished, then the
+        optional callback is called.
+        """
         #Fortran style! 1: Station 2: Azimuth 3: Incident 4: Polarity
         #fmt = "ONTN  349.00   96.00C"
         fmt = "%4s  %6.2f  %6.2f%1s\n"
-        count = 0
         polarities = []
         for pick in self.catalog[0].picks:
             arrival = getArrivalForPick(self.catalog[0].origins[0].arrivals,
@@ -2079,46 +2126,196 @@ class ObsPyck(QtGui.QMainWindow):
                 err = err % (pick.waveform_id.station_code, pt, pol)
                 self.error(err)
                 continue
-            count += 1
             polarities.append((sta, azim, inci, pol))
         sta_map = self._4_letter_sta_map
-        with open(files['phases'], 'wt') as f:
-            f.write("\n") #first line is ignored!
-            for sta, azim, inci, pol in polarities:
-                f.write(fmt % (sta_map[sta], azim, inci, pol))
-        self.critical('Phases for focmec: %i' % count)
-        self.catFile(files['phases'], self.critical)
-        call = prog_dict['Call']
-        (msg, err, returncode) = call(prog_dict)
-        self.info(msg)
-        self.error(err)
-        if returncode == 1:
-            err = "Error: focmec did not find a suitable solution!"
-            self.error(err)
-            return
-        self.critical('--> focmec finished')
-        lines = open(files['summary'], "rt").readlines()
-        self.critical('%i suitable solutions found:' % len(lines))
+
+        # phase sets without additional polarities would only repeat the run
+        # of a smaller phase set
+        phase_sets = OrderedDict()
+        for phase_set, identifiers in FOCMEC_PHASE_SETS.items():
+            polarities_ = [p for p in polarities if p[3] in identifiers]
+            if not polarities_ or polarities_ in phase_sets.values():
+                continue
+            phase_sets[phase_set] = polarities_
+        if not phase_sets:
+            self.error("Error: No polarities for focmec!")
+            return
+
+        if self.focmec_engine == "native":
+            fms = []
+            for phase_set, polarities_ in phase_sets.items():
+                self.critical('Phases for focmec grid search (%s): %i' % (
+                    phase_set, len(polarities_)))
+                fms += self.gridSearchFocmec(polarities_, phase_set)
+            if not fms:
+                err = "Error: focmec grid search did not find a suitable " + \
+                      "solution!"
+                self.error(err)
+                return
+            self.loadFocmecOutput(fms)
+            if callback is not None:
+                callback()
+            return
+
+        runs = OrderedDict()
+        for phase_set, polarities_ in phase_sets.items():
+            self.critical('Phases for focmec (%s): %i' % (phase_set,
+                                                         len(polarities_)))
+            # allowing as many errors as there are polarities accepts
+            # everything
+            errors_ = [errors for errors in self.focmec_polarity_errors
+                       if errors < len(polarities_)]
+            for errors in errors_:
+                key = (phase_set, errors)
+                if not runs:
+                    prog_dict = PROGRAMS['focmec']
+                else:
+                    prog_dict = self._focmec_dirs.get(key)
+                    if prog_dict is None:
+                        prog_dict = clone_program_dir(
+                            PROGRAMS['focmec'], "focmec_%s_%i" % (
+                                phase_set.replace("+", "_"), errors))
+                        self._focmec_dirs[key] = prog_dict
+                files = prog_dict['files']
+                with open(files['phases'], 'wt') as f:
+                    f.write("\n") #first line is ignored!
+                    for sta, azim, inci, pol in polarities_:
+                        f.write(fmt % (sta_map[sta], azim, inci, pol))
+                runs[key] = (prog_dict, len(polarities_))
+            if errors_:
+                self.catFile(files['phases'], self.critical)
+        if not runs:
+            self.error("Error: Too few polarities for focmec with allowed "
+                       "polarity errors %s!" % self.focmec_polarity_errors)
+            return
+
+        pending = set(runs)
+        results = {}
+
+        def finished(run, key):
+            pending.discard(key)
+            prog_dict, count_ = runs[key]
+            description = "%s, %i errors" % key
+            if run.cancelled:
+                results[key] = None
+            elif run.returncode:
+                self.error("Error: focmec failed (%s)!" % description)
+            else:
+                self.critical('--> focmec finished (%s)' % description)
+                results[key] = self.readFocmecOutput(
+                    prog_dict, count_, key[0])
+                if not results[key]:
+                    self.error("Error: focmec did not find a suitable "
+                               "solution (%s)!" % description)
+            if pending:
+                return
+            # discard everything if any run was cancelled
+            if None in results.values():
+                return
+            # runs allowing more errors also find the solutions of runs
+            # allowing less errors
+            fms = []
+            seen = set()
+            for key_ in runs:
+                for fm in results.get(key_, []):
+                    np1 = fm.nodal_planes.nodal_plane_1
+                    solution = (key_[0], np1.strike, np1.dip, np1.rake)
+                    if solution not in seen:
+                        seen.add(solution)
+                        fms.append(fm)
+            if not fms:
+                return
+            self.loadFocmecOutput(fms)
+            if callback is not None:
+                callback()
+
+        for key, (prog_dict, _) in runs.items():
+            self._run_program(
+                "focmec (%s, %i errors)" % key, prog_dict, key,
+                lambda run, key=key: finished(run, key))
+
+    def readFocmecOutput(self, prog_dict, count, phase_set):
+        """
+        Reads focmec output of one run into focal mechanisms.
+
+        :type count: int
+        :param count: Number of station polarities used.
+        :type phase_set: str
+        :param phase_set: Phase set used in the run (see
+            :const:`obspyck.util.FOCMEC_PHASE_SETS`).
+        """
+        lines = open(prog_dict['files']['summary'], "rt").readlines()
+        solutions = [[float(x) for x in line.split()[:6]] for line in lines]
+        method_id = "/".join([ID_ROOT, "focal_mechanism_method", "focmec",
+                              "2"])
+        return self._focmec_solutions_to_focal_mechanisms(
+            solutions, count, phase_set, method_id)
+
+    def gridSearchFocmec(self, polarities, phase_set):
+        """
+        Searches focal mechanisms fitting the given polarities in-process,
+        without running the focmec program (see
+        :func:`obspyck.focmec.grid_search`).
+
+        :type polarities: list
+        :param polarities: List of (station, azimuth, takeoff angle, FOCMEC
+            polarity identifier) as used for focmec input files.
+        :type phase_set: str
+        :param phase_set: Phase set of the polarities (see
+            :const:`obspyck.util.FOCMEC_PHASE_SETS`).
+        """
+        from .focmec import grid_search as focmec_grid_search
+        _, azimuths, takeoffs, identifiers = zip(*polarities)
+        solutions = focmec_grid_search(
+            azimuths, takeoffs, identifiers,
+            max_errors=self.focmec_max_polarity_errors,
+            step=self.focmec_grid_step,
+            refinements=self.focmec_grid_refinements,
+            max_solutions=self.focmec_max_solutions)
+        method_id = "/".join([ID_ROOT, "focal_mechanism_method",
+                              "obspyck_grid_search", "1"])
+        return self._focmec_solutions_to_focal_mechanisms(
+            solutions, len(polarities), phase_set, method_id)
+
+    def _focmec_solutions_to_focal_mechanisms(self, solutions, count,
+                                              phase_set, method_id):
+        """
+        Makes focal mechanisms out of focmec solutions, each given as dip,
+        strike, rake and numbers of P, SV and SH polarity errors.
+        """
+        self.critical('%i suitable solutions found (%s):' % (len(solutions),
+                                                            phase_set))
         fms = []
-        for line in lines:
-            line = line.split()
+        for line in solutions:
             np1 = NodalPlane()
             np = NodalPlanes()
             fm = FocalMechanism()
             fm.nodal_planes = np
             fm.nodal_planes.nodal_plane_1 = np1
-            fm.method_id = "/".join([ID_ROOT, "focal_mechanism_method", "focmec", "2"])
+            fm.method_id = method_id
             np1.dip = float(line[0])
             np1.strike = float(line[1])
             np1.rake = float(line[2])
             fm.station_polarity_count = count
-            errors = sum([int(float(line[no])) for no in (3, 4, 5)]) # not used in xml
+            errors = sum([int(line[no]) for no in (3, 4, 5)]) # not used in xml
             fm.misfit = errors / float(fm.station_polarity_count)
-            fm.comments.append(Comment(text="Possible Solution Count: %i" % len(lines)))
+            fm.comments.append(Comment(text="Possible Solution Count: %i" % len(solutions)))
             fm.comments.append(Comment(text="Polarity Errors: %i" % errors))
+            fm.comments.append(Comment(text="Phases: %s" % phase_set))
             self.critical("Strike: %6.2f  Dip: %6.2f  Rake: %6.2f  Polarity Errors: %i/%i" % \
                       (np1.strike, np1.dip, np1.rake, errors, count))
             fms.append(fm)
+        return fms
+
+    def loadFocmecOutput(self, fms):
+        """
+        Sets focal mechanisms of (possibly several) focmec runs, ranked by
+        misfit and for equal misfits by number of polarities used. The best
+        solution gets selected.
+        """
+        # stable sort, order of phase sets is kept otherwise
+        fms = sorted(fms, key=lambda fm: (fm.misfit,
+                                          -fm.station_polarity_count))
         self.catalog[0].focal_mechanisms = fms
         self.focMechCurrent = 0
         self.critical("selecting Focal Mechanism No.  1 of %2i:" % len(fms))
@@ -2134,12 +2331,14 @@ class ObsPyck(QtGui.QMainWindow):
         fm = fms[self.focMechCurrent]
         np1 = fm.nodal_planes.nodal_plane_1
         self.catalog[0].preferred_focal_mechanism_id = str(fm.resource_id)
+        self._catalog_changed()
         self.critical("selecting Focal Mechanism No. %2i of %2i:" % \
                       (self.focMechCurrent + 1, len(fms)))
         self.critical("Strike: %6.2f  Dip: %6.2f  Rake: %6.2f  Misfit: %.2f" % \
                       (np1.strike, np1.dip, np1.rake, fm.misfit))
 
     def drawFocMec(self):
+        from obspy.imaging.beachball import beach
         fms = self.catalog[0].focal_mechanisms
         if not fms:
             err = "Error: No focal mechanism data!"
@@ -2248,858 +2447,309 @@ class ObsPyck(QtGui.QMainWindow):
                     self.fig.delaxes(ax)
                 del ax
 
-    def _setup_4_letter_station_map(self):
-        # make sure the 4-letter station codes are unique
-        sta_map_tmp = {}
-        for sta in [st[0].stats.station for st in self.streams_bkp]:
-            sta_map_tmp.setdefault(sta[:4], set()).add(sta)
-        sta_map = {}
-        sta_map_reverse = {}
-        for sta_short, stations in sta_map_tmp.iteritems():
-            stations = list(stations)
-            if len(stations) == 1:
-                sta_map[stations[0]] = sta_short
-                sta_map_reverse[sta_short] = stations[0]
-            else:
-                if len(stations) <= 10:
-                    for i, sta in enumerate(stations):
-                        short_name = sta[:2] + "_%i" % i
-                        sta_map[sta] = short_name
-                        sta_map_reverse[short_name] = sta
-                else:
-                    for i, sta in enumerate(stations):
-                        short_name = sta[0] + "_%02i" % i
-                        sta_map[sta] = short_name
-                        sta_map_reverse[short_name] = sta
-        self._4_letter_sta_map = sta_map
-        self._4_letter_sta_map_reverse = sta_map_reverse
-
-    def doHyp2000(self):
-        """
-        Writes input files for hyp2000 and starts the hyp2000 program via a
-        system call.
-        """
-        prog_dict = PROGRAMS['hyp_2000']
-        files = prog_dict['files']
-        precall = prog_dict['PreCall']
-        precall(prog_dict)
-
-        f = open(files['phases'], 'wt')
-        phases_hypo71 = self.dicts2hypo71Phases()
-        f.write(phases_hypo71)
-        f.close()
-
-        f2 = open(files['stations'], 'wt')
-        stations_hypo71 = self.dicts2hypo71Stations()
-        f2.write(stations_hypo71)
-        f2.close()
-
-        self.critical('Phases for Hypo2000:')
-        self.catFile(files['phases'], self.critical)
-        self.critical('Stations for Hypo2000:')
-        self.catFile(files['stations'], self.critical)
-
-        call = prog_dict['Call']
-        (msg, err, returncode) = call(prog_dict)
-        self.info(msg)
-        self.error(err)
-        self.critical('--> hyp2000 finished')
-        self.catFile(files['summary'], self.critical)
-
-    def doNLLoc(self):
+    def doNLLocAllModels(self, callback):
         """
-        Writes input files for NLLoc and starts the NonLinLoc program via a
-        system call.
+        Runs NonLinLoc for all velocity models available in the model
+        selection at the same time (in the background), each in a separate
+        working directory. When all runs finished, callback is called with a
+        list of (model, result) for all models that produced a location (see
+        readNLLocOutput()). Results for unchanged input are taken from the
+        locator cache.
         """
-        prog_dict = PROGRAMS['nlloc']
-        files = prog_dict['files']
-        # determine which model should be used in location
-        controlfilename = "locate_%s.nlloc" % \
-                          str(self.widgets.qComboBox_nllocModel.currentText())
-
-        precall = prog_dict['PreCall']
-        precall(prog_dict)
-
-        f = open(files['phases'], 'wt')
+        combobox = self.widgets.qComboBox_nllocModel
+        models = [str(combobox.itemText(i)) for i in range(combobox.count())]
         phases_nlloc = self.dicts2NLLocPhases()
-        f.write(phases_nlloc)
-        f.close()
-
         self.critical('Phases for NLLoc:')
-        self.catFile(files['phases'], self.critical)
+        self.critical(phases_nlloc)
+
+        results = {}
+        pending = {}
+        for model in models:
+            controlfilename = "locate_%s.nlloc" % model
+            key = self._nlloc_cache_key(PROGRAMS['nlloc'], controlfilename,
+                                        phases_nlloc)
+            result = self.locator_cache.get(key)
+            if result is not None:
+                self.critical('--> using cached NLLoc location for unchanged '
+                              'input (model %s)' % model)
+                results[model] = result
+                continue
+            prog_dict = self._nlloc_model_dirs.get(model)
+            if prog_dict is None:
+                prog_dict = clone_program_dir(PROGRAMS['nlloc'],
+                                              "nlloc_%s" % model)
+                self._nlloc_model_dirs[model] = prog_dict
+            self._write_nlloc_input(prog_dict, phases_nlloc)
+            pending[model] = (prog_dict, controlfilename, key)
+
+        def done():
+            callback([(model, results[model]) for model in models
+                      if results.get(model) is not None])
+
+        def finished(run, model):
+            prog_dict, _, key = pending.pop(model)
+            if not run.cancelled:
+                self.critical('--> NLLoc finished (model %s)' % model)
+                result = self.readNLLocOutput(prog_dict)
+                if result is not None:
+                    self.locator_cache.put(key, result)
+                results[model] = result
+            if not pending:
+                done()
+
+        if not pending:
+            done()
+            return
+        for model, (prog_dict, controlfilename, _) in pending.items():
+            self._run_program(
+                "NLLoc (model %s)" % model, prog_dict, (controlfilename, ),
+                lambda run, model=model: finished(run, model))
+
+    def _select_nlloc_model(self, results):
+        """
+        Shows location results for different velocity models side by side and
+        lets the user choose one. Returns chosen result or None if cancelled.
+        """
+        items = []
+        for model, (hypo, _, _) in results:
+            lon, lat = gk2lonlat(hypo.x, hypo.y)
+            # 2 sigma, see loadNLLocOutput
+            errX, errY, errZ = [
+                2 * err for err in
+                errorEllipsoid2CartesianErrors(*hypo.ellipsoid)]
+            items.append(
+                "%s: RMS %.3fs  gap %.0f  err x/y/z %.2f/%.2f/%.2fkm  "
+                "lon %.4f lat %.4f depth %.2fkm" % (
+                    model, hypo.rms, hypo.gap, errX, errY, errZ, lon, lat,
+                    hypo.z))
+        self.critical("NLLoc results for all velocity models:\n" +
+                      "\n".join(items))
+        # preselect the location with the lowest RMS
+        best = min(range(len(results)), key=lambda i: results[i][1][0].rms)
+        item, ok = QtGui.QInputDialog.getItem(
+            self, "NLLoc velocity models", "Select location to use:", items,
+            best, False)
+        if not ok:
+            return None
+        model, result = results[items.index(str(item))]
+        combobox = self.widgets.qComboBox_nllocModel
+        combobox.setCurrentIndex(combobox.findText(model))
+        return result
 
-        call = prog_dict['Call']
-        (msg, err, returncode) = call(prog_dict, controlfilename)
-        self.info(msg)
-        self.error(err)
-        self.critical('--> NLLoc finished')
-        self.catFile(files['summary'], self.critical)
-
-    def catFile(self, file, logfunct):
-        lines = open(file, "rt").readlines()
-        msg = ""
-        for line in lines:
-            msg += line
-        logfunct(msg)
-
-    def loadNLLocOutput(self):
-        files = PROGRAMS['nlloc']['files']
-        lines = open(files['summary'], "rt").readlines()
-        if not lines:
-            err = "Error: NLLoc output file (%s) does not exist!" % \
-                    files['summary']
-            self.error(err)
-            return
-        # goto signature info line
-        try:
-            line = lines.pop(0)
-            while not line.startswith("SIGNATURE"):
-                line = lines.pop(0)
-        except:
-            err = "Error: No correct location info found in NLLoc " + \
-                  "outputfile (%s)!" % files['summary']
-            self.error(err)
-            return
+    def doLocationResampling(self, locator, method, callback):
+        """
+        Relocates the event repeatedly with resampled sets of stations (see
+        :func:`~obspyck.util.resample_stations`) to estimate location
+        uncertainties. Relocations are run in parallel, each worker in a
+        separate working directory. When all relocations finished, callback
+        is called with the origin, the resampling method, the list of
+        relocations (longitude, latitude, depth in km, origin time) and the
+        number of relocation runs.
 
-        line = line.rstrip().split('"')[1]
-        signature, nlloc_version, date, time = line.rsplit(" ", 3)
-        # new NLLoc > 6.0 seems to add prefix 'run:' before date
-        if date.startswith('run:'):
-            date = date[4:]
-        saved_locale = locale.getlocale()
-        try:
-            locale.setlocale(locale.LC_ALL, ('en_US', 'UTF-8'))
-        except:
-            creation_time = None
+        A single timed out relocation only counts as failed, if relocations
+        get cancelled (or the event is switched) remaining relocations are
+        not started and callback is not called.
+
+        :type locator: str
+        :param locator: ``"hyp_2000"`` or ``"nlloc"``.
+        """
+        origin = self.catalog[0].origins[0]
+        if locator == "nlloc":
+            controlfilename = "locate_%s.nlloc" % \
+                str(self.widgets.qComboBox_nllocModel.currentText())
+            args = (controlfilename, )
+            phases = split_phases_by_station(self.dicts2NLLocPhases())
         else:
-            creation_time = UTCDateTime().strptime(date + time,
-                                                   str("%d%b%Y%Hh%Mm%S"))
-        finally:
-            locale.setlocale(locale.LC_ALL, saved_locale)
-        # goto maximum likelihood origin location info line
-        try:
-            line = lines.pop(0)
-            while not line.startswith("HYPOCENTER"):
-                line = lines.pop(0)
-        except:
-            err = "Error: No correct location info found in NLLoc " + \
-                  "outputfile (%s)!" % files['summary']
-            self.error(err)
-            return
+            args = ()
+            stations_hypo71 = self.dicts2hypo71Stations()
+            phases = split_phases_by_station(self.dicts2hypo71Phases(),
+                                             station_width=4)
+        if len(phases) < 4:
+            self.error("Error: Too few stations (%i) for resampling." %
+                       len(phases))
+            return
+        jobs = deque(
+            "".join(line for station in stations for line in phases[station])
+            for stations in resample_stations(
+                phases.keys(), method, count=self.resampling_bootstrap_runs))
+        runs = len(jobs)
+        self.critical("Relocating %i times with %s resampling of %i "
+                      "stations..." % (runs, method, len(phases)))
+
+        locations = []
+        state = {'running': 0, 'finished': 0, 'aborted': False}
+
+        def start(prog_dict):
+            if locator == "hyp_2000":
+                self._write_hyp2000_input(prog_dict, jobs.popleft(),
+                                          stations_hypo71)
+            else:
+                self._write_nlloc_input(prog_dict, jobs.popleft())
+            state['running'] += 1
+            self._run_program(
+                "relocation", prog_dict, args,
+                lambda run: finished(run, prog_dict), show_output=False)
+
+        def finished(run, prog_dict):
+            state['running'] -= 1
+            state['finished'] += 1
+            if run.cancelled:
+                # a timed out relocation only counts as failed
+                if not run.timed_out:
+                    state['aborted'] = True
+                    jobs.clear()
+            elif locator == "nlloc":
+                try:
+                    hypo = read_nlloc_hyp(prog_dict['files']['summary'])[0]
+                except (IOError, IndexError):
+                    hypo = None
+                if hypo is not None and hypo.is_complete():
+                    lon, lat = gk2lonlat(hypo.x, hypo.y)
+                    locations.append((lon, lat, hypo.z, hypo.time))
+            else:
+                try:
+                    location = read_hyp2000_prt(
+                        prog_dict['files']['summary'])[0]
+                except (IOError, IndexError):
+                    location = None
+                if location is not None and location.is_complete():
+                    locations.append((location.longitude, location.latitude,
+                                      location.depth, location.time))
+            self.statusBar().showMessage(
+                "Relocations: %i of %i finished" % (state['finished'], runs),
+                5000)
+            if jobs:
+                start(prog_dict)
+            elif state['running']:
+                pass
+            elif state['aborted']:
+                self.error("Resampling aborted, discarding %i relocations." %
+                           len(locations))
+            else:
+                callback(origin, method, locations, runs)
+
+        for i in range(min(self.resampling_workers, runs)):
+            key = (locator, i)
+            prog_dict = self._resampling_dirs.get(key)
+            if prog_dict is None:
+                prog_dict = clone_program_dir(
+                    PROGRAMS[locator], "%s_worker%i" % (locator, i))
+                self._resampling_dirs[key] = prog_dict
+            start(prog_dict)
+
+    def _run_program(self, description, prog_dict, args, callback,
+                     show_output=True):
+        """
+        Start an external program (see setup_external_programs()) in the
+        background instead of waiting for it (see
+        :meth:`ObsPyckCore._run_program`). Its output is shown in the log
+        panes while it is running (unless show_output is False).
+        When it finished, callback is called (in the GUI thread) with the
+        :class:`~obspyck.util.ProgramRun`, also if it was cancelled or timed
+        out (check ``run.cancelled``).
+        """
+        run = prog_dict['Start'](prog_dict, *args,
+                                 timeout=self.external_program_timeout or None)
+        # results are discarded if the event gets switched in the meantime
+        run.event = self.catalog[0]
+        run.show_output = show_output
+        self._program_runs.append((description, prog_dict, run, callback))
+        if show_output:
+            self.critical("%s started" % description)
+        self._set_program_buttons_enabled(False)
+        self.qPushButton_cancelPrograms.show()
+        if not self.program_timer.isActive():
+            self.program_timer.start(100)
+
+    def _poll_program_runs(self):
+        """
+        Show new output of running external programs and hand back finished
+        runs.
+        """
+        finished = []
+        for entry in list(self._program_runs):
+            description, prog_dict, run, callback = entry
+            for stream, line in run.poll():
+                if not run.show_output:
+                    continue
+                if stream == "stdout":
+                    self.info(line.rstrip("\n"))
+                else:
+                    self.error(line.rstrip("\n"))
+            if run.done:
+                self._program_runs.remove(entry)
+                finished.append(entry)
+        if not self._program_runs:
+            self.program_timer.stop()
+            self.qPushButton_cancelPrograms.hide()
+            self._set_program_buttons_enabled(True)
+        # callbacks might open dialogs that run an event loop, so they are
+        # only called after the bookkeeping is done
+        for description, prog_dict, run, callback in finished:
+            if run.timed_out:
+                self.error("Error: %s did not finish in %s seconds and was "
+                           "stopped." % (description, run.timeout))
+            elif run.cancelled:
+                self.error("%s was cancelled." % description)
+            elif run.event is not self.catalog[0]:
+                self.error("Event was changed while %s was running, "
+                           "discarding results." % description)
+                run.cancelled = True
+            else:
+                postcall = prog_dict.get('PostCall')
+                if postcall is not None:
+                    postcall(prog_dict)
+            callback(run)
 
-        line = line.split()
-        x = float(line[2])
-        y = float(line[4])
-        depth = - float(line[6]) # depth: negative down!
+    def _cancel_program_runs(self):
+        for description, prog_dict, run, callback in self._program_runs:
+            run.cancel()
 
-        lon, lat = gk2lonlat(x, y)
+    def _set_program_buttons_enabled(self, enabled):
+        """
+        Avoid starting programs while others are running in the same working
+        directories.
+        """
+        for name in ("qToolButton_doHyp2000", "qToolButton_doNlloc",
+                     "qToolButton_doNllocAllModels",
+                     "qToolButton_resampleLocation", "qToolButton_doFocMec"):
+            getattr(self.widgets, name).setEnabled(enabled)
 
-        # goto origin time info line
+    #see http://www.scipy.org/Cookbook/LinearRegression for alternative routine
+    #XXX replace with drawWadati()
+    def drawWadati(self):
+        """
+        Shows a Wadati diagram plotting P time in (truncated) Julian seconds
+        against S-P time for every station and doing a linear regression
+        using rpy. An estimate of Vp/Vs is given by the slope + 1.
+        """
         try:
-            line = lines.pop(0)
-            while not line.startswith("GEOGRAPHIC  OT"):
-                line = lines.pop(0)
+            import rpy
         except:
-            err = "Error: No correct location info found in NLLoc " + \
-                  "outputfile (%s)!" % files['summary']
+            err = "Error: Package rpy could not be imported!\n" + \
+                  "(We should switch to scipy polyfit, anyway!)"
             self.error(err)
             return
-
-        line = line.split()
-        year = int(line[2])
-        month = int(line[3])
-        day = int(line[4])
-        hour = int(line[5])
-        minute = int(line[6])
-        seconds = float(line[7])
-        time = UTCDateTime(year, month, day, hour, minute, seconds)
-
-        # goto location quality info line
-        try:
-            line = lines.pop(0)
-            while not line.startswith("QUALITY"):
-                line = lines.pop(0)
-        except:
-            err = "Error: No correct location info found in NLLoc " + \
-                  "outputfile (%s)!" % files['summary']
-            self.error(err)
-            return
-
-        line = line.split()
-        rms = float(line[8])
-        gap = float(line[12])
-
-        # goto location quality info line
-        try:
-            line = lines.pop(0)
-            while not line.startswith("STATISTICS"):
-                line = lines.pop(0)
-        except:
-            err = "Error: No correct location info found in NLLoc " + \
-                  "outputfile (%s)!" % files['summary']
-            self.error(err)
-            return
-
-        line = line.split()
-        # read in the error ellipsoid representation of the location error.
-        # this is given as azimuth/dip/length of axis 1 and 2 and as length
-        # of axis 3.
-        azim1 = float(line[20])
-        dip1 = float(line[22])
-        len1 = float(line[24])
-        azim2 = float(line[26])
-        dip2 = float(line[28])
-        len2 = float(line[30])
-        len3 = float(line[32])
-
-        # XXX TODO save original nlloc error ellipse?!
-        errX, errY, errZ = errorEllipsoid2CartesianErrors(azim1, dip1, len1,
-                                                          azim2, dip2, len2,
-                                                          len3)
-
-        # XXX
-        # NLLOC uses error ellipsoid for 68% confidence interval relating to
-        # one standard deviation in the normal distribution.
-        # We multiply all errors by 2 to approximately get the 95% confidence
-        # level (two standard deviations)...
-        errX *= 2
-        errY *= 2
-        errZ *= 2
-
-        # determine which model was used:
-        # XXX handling of path extremely hackish! to be improved!!
-        dirname = os.path.dirname(files['summary'])
-        controlfile = os.path.join(dirname, "last.in")
-        lines2 = open(controlfile, "rt").readlines()
-        line2 = lines2.pop()
-        while not line2.startswith("LOCFILES"):
-            line2 = lines2.pop()
-        line2 = line2.split()
-        model = line2[3]
-        model = model.split("/")[-1]
-
-        catalog = self.catalog
-        event = catalog[0]
-        if event.creation_info is None:
-            event.creation_info = CreationInfo()
-            event.creation_info.creation_time = UTCDateTime()
-        o = Origin()
-        event.origins = [o]
-        self.catalog[0].set_creation_info_username(self.username)
-        # version field has 64 char maximum per QuakeML RNG schema
-        o.creation_info = CreationInfo(creation_time=creation_time,
-                                       version=nlloc_version[:64])
-
-        # assign origin info
-        o.method_id = "/".join([ID_ROOT, "location_method", "nlloc", "4"])
-        o.origin_uncertainty = OriginUncertainty()
-        o.quality = OriginQuality()
-        ou = o.origin_uncertainty
-        oq = o.quality
-        o.longitude = lon
-        o.latitude = lat
-        o.depth = depth * (-1e3)  # meters positive down!
-        if errY > errX:
-            ou.azimuth_max_horizontal_uncertainty = 0
-        else:
-            ou.azimuth_max_horizontal_uncertainty = 90
-        ou.min_horizontal_uncertainty, \
-                ou.max_horizontal_uncertainty = \
-                sorted([errX * 1e3, errY * 1e3])
-        ou.preferred_description = "uncertainty ellipse"
-        o.depth_errors.uncertainty = errZ * 1e3
-        oq.standard_error = rms #XXX stimmt diese Zuordnung!!!?!
-        oq.azimuthal_gap = gap
-        o.depth_type = "from location"
-        o.earth_model_id = "%s/earth_model/%s" % (ID_ROOT, model)
-        o.time = time
-
-        # goto synthetic phases info lines
-        try:
-            line = lines.pop(0)
-            while not line.startswith("PHASE ID"):
-                line = lines.pop(0)
-        except:
-            err = "Error: No correct synthetic phase info found in NLLoc " + \
-                  "outputfile (%s)!" % files['summary']
-            self.error(err)
-            return
-
-        # remove all non phase-info-lines from bottom of list
-        try:
-            badline = lines.pop()
-            while not badline.startswith("END_PHASE"):
-                badline = lines.pop()
-        except:
-            err = "Error: Could not remove unwanted lines at bottom of " + \
-                  "NLLoc outputfile (%s)!" % files['summary']
-            self.error(err)
-            return
-
-        o.quality.used_phase_count = 0
-        o.quality.extra = AttribDict()
-        o.quality.extra.usedPhaseCountP = {'value': 0, 'namespace': NAMESPACE}
-        o.quality.extra.usedPhaseCountS = {'value': 0, 'namespace': NAMESPACE}
-
-        # go through all phase info lines
-        """
-        Order of fields:
-        ID Ins Cmp On Pha FM Q Date HrMn Sec Coda Amp Per PriorWt > Err ErrMag
-        TTpred Res Weight StaLoc(X Y Z) SDist SAzim RAz RDip RQual Tcorr
-        TTerrTcorr
-
-        Fields:
-        ID (char*6)
-            station name or code
-        Ins (char*4)
-            instrument identification for the trace for which the time pick corresponds (i.e. SP, BRB, VBB)
-        Cmp (char*4)
-            component identification for the trace for which the time pick corresponds (i.e. Z, N, E, H)
-        On (char*1)
-            description of P phase arrival onset; i, e
-        Pha (char*6)
-            Phase identification (i.e. P, S, PmP)
-        FM (char*1)
-            first motion direction of P arrival; c, C, u, U = compression; d, D = dilatation; +, -, Z, N; . or ? = not readable.
-        Date (yyyymmdd) (int*6)
-            year (with century), month, day
-        HrMn (hhmm) (int*4)
-            Hour, min
-        Sec (float*7.4)
-            seconds of phase arrival
-        Err (char*3)
-            Error/uncertainty type; GAU
-        ErrMag (expFloat*9.2)
-            Error/uncertainty magnitude in seconds
-        Coda (expFloat*9.2)
-            coda duration reading
-        Amp (expFloat*9.2)
-            Maxumim peak-to-peak amplitude
-        Per (expFloat*9.2)
-            Period of amplitude reading
-        PriorWt (expFloat*9.2)
-            A-priori phase weight
-        > (char*1)
-            Required separator between first part (observations) and second part (calculated values) of phase record.
-        TTpred (float*9.4)
-            Predicted travel time
-        Res (float*9.4)
-            Residual (observed - predicted arrival time)
-        Weight (float*9.4)
-            Phase weight (covariance matrix weight for LOCMETH GAU_ANALYTIC, posterior weight for LOCMETH EDT EDT_OT_WT)
-        StaLoc(X Y Z) (3 * float*9.4)
-            Non-GLOBAL: x, y, z location of station in transformed, rectangular coordinates
-            GLOBAL: longitude, latitude, z location of station
-        SDist (float*9.4)
-            Maximum likelihood hypocenter to station epicentral distance in kilometers
-        SAzim (float*6.2)
-            Maximum likelihood hypocenter to station epicentral azimuth in degrees CW from North
-        RAz (float*5.1)
-            Ray take-off azimuth at maximum likelihood hypocenter in degrees CW from North
-        RDip (float*5.1)
-            Ray take-off dip at maximum likelihood hypocenter in degrees upwards from vertical down (0 = down, 180 = up)
-        RQual (float*5.1)
-            Quality of take-off angle estimation (0 = unreliable, 10 = best)
-        Tcorr (float*9.4)
-            Time correction (station delay) used for location
-        TTerr (expFloat*9.2)
-            Traveltime error used for location
-        """
-        used_stations = set()
-        for line in lines:
-            line = line.split()
-            # check which type of phase
-            if line[4] == "P":
-                type = "P"
-            elif line[4] == "S":
-                type = "S"
-            else:
-                self.error("Encountered a phase that is not P and not S!! "
-                           "This case is not handled yet in reading NLLOC "
-                           "output...")
-                continue
-            # get values from line
-            station = line[0]
-            epidist = float(line[21])
-            azimuth = float(line[23])
-            ray_dip = float(line[24])
-            # if we do the location on traveltime-grids without angle-grids we
-            # do not get ray azimuth/incidence. but we can at least use the
-            # station to hypocenter azimuth which is very close (~2 deg) to the
-            # ray azimuth
-            if azimuth == 0.0 and ray_dip == 0.0:
-                azimuth = float(line[22])
-                ray_dip = np.nan
-            if line[3] == "I":
-                onset = "impulsive"
-            elif line[3] == "E":
-                onset = "emergent"
-            else:
-                onset = None
-            if line[5] == "U":
-                polarity = "positive"
-            elif line[5] == "D":
-                polarity = "negative"
-            else:
-                polarity = None
-            # predicted travel time is zero.
-            # seems to happen when no travel time cube is present for a
-            # provided station reading. show an error message and skip this
-            # arrival.
-            if float(line[15]) == 0.0:
-                msg = ("Predicted travel time for station '%s' is zero. "
-                       "Most likely the travel time cube is missing for "
-                       "this station! Skipping arrival for this station.")
-                self.error(msg % station)
-                continue
-            res = float(line[16])
-            weight = float(line[17])
-
-            # assign synthetic phase info
-            pick = self.getPick(station=station, phase_hint=type)
-            if pick is None:
-                msg = "This should not happen! Location output was read and a corresponding pick is missing!"
-                raise NotImplementedError(msg)
-            arrival = Arrival(origin=o, pick=pick)
-            # residual is defined as P-Psynth by NLLOC!
-            arrival.distance = kilometer2degrees(epidist)
-            arrival.phase = type
-            arrival.time_residual = res
-            arrival.azimuth = azimuth
-            if not np.isnan(ray_dip):
-                arrival.takeoff_angle = ray_dip
-            if onset and not pick.onset:
-                pick.onset = onset
-            if polarity and not pick.polarity:
-                pick.polarity = polarity
-            # we use weights 0,1,2,3 but NLLoc outputs floats...
-            arrival.time_weight = weight
-            o.quality.used_phase_count += 1
-            if type == "P":
-                o.quality.extra.usedPhaseCountP['value'] += 1
-            elif type == "S":
-                o.quality.extra.usedPhaseCountS['value'] += 1
-            else:
-                self.error("Phase '%s' not recognized as P or S. " % type +
-                           "Not incrementing P nor S phase count.")
-            used_stations.add(station)
-        o.used_station_count = len(used_stations)
-        self.update_origin_azimuthal_gap()
-
-        # read NLLOC scatter file
-        data = readNLLocScatter(PROGRAMS['nlloc']['files']['scatter'],
-                                self.widgets.qPlainTextEdit_stderr)
-        o.nonlinloc_scatter = data
-
-    def loadHyp2000Data(self):
-        sta_map_reverse = self._4_letter_sta_map_reverse
-        files = PROGRAMS['hyp_2000']['files']
-        lines = open(files['summary'], "rt").readlines()
-        if lines == []:
-            err = "Error: Hypo2000 output file (%s) does not exist!" % \
-                    files['summary']
-            self.error(err)
-            return
-        # goto origin info line
-        while True:
-            try:
-                line = lines.pop(0)
-            except:
-                break
-            if line.startswith(" YEAR MO DA  --ORIGIN--"):
-                break
-        try:
-            line = lines.pop(0)
-        except:
-            err = "Error: No location info found in Hypo2000 outputfile " + \
-                  "(%s)!" % files['summary']
-            self.error(err)
-            return
-
-        year = int(line[1:5])
-        month = int(line[6:8])
-        day = int(line[9:11])
-        hour = int(line[13:15])
-        minute = int(line[15:17])
-        seconds = float(line[18:23])
-        time = UTCDateTime(year, month, day, hour, minute, seconds)
-        lat_deg = int(line[25:27])
-        lat_min = float(line[28:33])
-        lat = lat_deg + (lat_min / 60.)
-        if line[27] == "S":
-            lat = -lat
-        lon_deg = int(line[35:38])
-        lon_min = float(line[39:44])
-        lon = lon_deg + (lon_min / 60.)
-        if line[38] == "W":
-            lon = -lon
-        depth = -float(line[46:51]) # depth: negative down!
-        rms = float(line[52:57])
-        errXY = float(line[58:63])
-        errZ = float(line[64:69])
-
-        # goto next origin info line
-        while True:
-            try:
-                line = lines.pop(0)
-            except:
-                break
-            if line.startswith(" NSTA NPHS  DMIN MODEL"):
-                break
-        line = lines.pop(0)
-
-        #model = line[17:22].strip()
-        gap = int(line[23:26])
-
-        line = lines.pop(0)
-        model = line[49:].strip()
-        # this is to prevent characters that are invalid in QuakeML URIs
-        # hopefully handled in the future by obspy/obspy#1018
-        model = re.sub(r"[^\w\d\-\.\*\(\)\+\?_~'=,;#/&amp;]", '_', model)
-
-        # assign origin info
-        o = Origin()
-        self.catalog[0].origins = [o]
-        self.catalog[0].set_creation_info_username(self.username)
-        o.clear()
-        o.method_id = "/".join([ID_ROOT, "location_method", "hyp2000", "3"])
-        o.origin_uncertainty = OriginUncertainty()
-        o.quality = OriginQuality()
-        ou = o.origin_uncertainty
-        oq = o.quality
-        o.longitude = lon
-        o.latitude = lat
-        o.depth = depth * (-1e3)  # meters positive down!
-        # all errors are given in km!
-        ou.horizontal_uncertainty = errXY * 1e3
-        ou.preferred_description = "horizontal uncertainty"
-        o.depth_errors.uncertainty = errZ * 1e3
-        oq.standard_error = rms #XXX stimmt diese Zuordnung!!!?!
-        oq.azimuthal_gap = gap
-        o.depth_type = "from location"
-        o.earth_model_id = "%s/earth_model/%s" % (ID_ROOT, model)
-        o.time = time
-
-        # goto station and phases info lines
-        while True:
-            try:
-                line = lines.pop(0)
-            except:
-                break
-            if line.startswith(" STA NET COM L CR DIST AZM"):
-                break
-
-        oq.used_phase_count = 0
-        oq.extra = AttribDict()
-        oq.extra.usedPhaseCountP = {'value': 0, 'namespace': NAMESPACE}
-        oq.extra.usedPhaseCountS = {'value': 0, 'namespace': NAMESPACE}
-        used_stations = set()
-        #XXX caution: we sometimes access the prior element!
-        for i in range(len(lines)):
-            # check which type of phase
-            if lines[i][32] == "P":
-                type = "P"
-            elif lines[i][32] == "S":
-                type = "S"
-            else:
-                continue
-            # get values from line
-            station = lines[i][0:6].strip()
-            if station == "":
-                station = sta_map_reverse[lines[i-1][0:6].strip()]
-                distance = float(lines[i-1][18:23])
-                azimuth = int(lines[i-1][23:26])
-                #XXX TODO check, if incident is correct!!
-                incident = int(lines[i-1][27:30])
-            else:
-                station = sta_map_reverse[station]
-                distance = float(lines[i][18:23])
-                azimuth = int(lines[i][23:26])
-                #XXX TODO check, if incident is correct!!
-                incident = int(lines[i][27:30])
-            used_stations.add(station)
-            if lines[i][31] == "I":
-                onset = "impulsive"
-            elif lines[i][31] == "E":
-                onset = "emergent"
-            else:
-                onset = None
-            if lines[i][33] == "U":
-                polarity = "positive"
-            elif lines[i][33] == "D":
-                polarity = "negative"
-            else:
-                polarity = None
-            res = float(lines[i][61:66])
-            weight = float(lines[i][68:72])
-
-            # assign synthetic phase info
-            pick = self.getPick(station=station, phase_hint=type)
-            if pick is None:
-                msg = "This should not happen! Location output was read and a corresponding pick is missing!"
-                warnings.warn(msg)
-            arrival = Arrival(origin=o, pick=pick)
-            # residual is defined as P-Psynth by NLLOC!
-            # XXX does this also hold for hyp2000???
-            arrival.time_residual = res
-            arrival.azimuth = azimuth
-            arrival.distance = kilometer2degrees(distance)
-            arrival.takeoff_angle = incident
-            if onset and not pick.onset:
-                pick.onset = onset
-            if polarity and not pick.polarity:
-                pick.polarity = polarity
-            # we use weights 0,1,2,3 but hypo2000 outputs floats...
-            arrival.time_weight = weight
-            o.quality.used_phase_count += 1
-            if type == "P":
-                o.quality.extra.usedPhaseCountP['value'] += 1
-            elif type == "S":
-                o.quality.extra.usedPhaseCountS['value'] += 1
-            else:
-                self.error("Phase '%s' not recognized as P or S. " % type +
-                           "Not incrementing P nor S phase count.")
-        o.used_station_count = len(used_stations)
-
-    def updateMagnitude(self):
-        if self.catalog[0].origins:
-            self.info("updating magnitude info...")
-            self.calculateStationMagnitudes()
-            self.updateNetworkMag()
-            self.setXMLEventID()
-        else:
-            self.critical("can not update magnitude (no origin)...")
-
-    def updateNetworkMag(self):
-        self.info("updating network magnitude...")
-        event = self.catalog[0]
-
-        if not event.origins:
-            event.magnitudes = []
-            self.critical("no origin information for magnitude...")
-            return
-
-        origin = event.origins[0]
-
-        used_stamags = []
-        for sm in event.station_magnitudes:
-            if sm.origin_id != origin.resource_id:
-                msg = ("Skipping station magnitude with non-matching origin "
-                       "ID (%s; Current origin: %s)" % (sm.origin_id,
-                                                        origin.resource_id))
-                self.error(msg)
-                continue
-            if not sm.get("used", True):
-                msg = ("Skipping manually deselected station magnitude for "
-                       "station %s." % sm.waveform_id.station_code)
-                self.error(msg)
-                continue
-            used_stamags.append(sm)
-
-        if not used_stamags:
-            event.magnitudes = []
-            self.critical("no station magnitudes (or all deselected), nothing to do...")
-            return
-
-        m = Magnitude()
-        event.magnitudes = [m]
-        m.method_id = "/".join([ID_ROOT, "magnitude_method", "obspyck", "2"])
-        m.origin_id = origin.resource_id
-        m.type = "ML"
-
-        mag_values = [sm_.mag for sm_ in used_stamags]
-        m.mag = np.mean(mag_values)
-        m.mag_errors.uncertainty = np.std(mag_values)
-        m.mag_errors.confidence_level = ONE_SIGMA
-        m.station_count = len(mag_values)
-        single_weights = 1.0 / len(mag_values)
-
-        m.station_magnitude_contributions = []
-        for sm in used_stamags:
-            contrib = StationMagnitudeContribution()
-            contrib.station_magnitude_id = sm.resource_id
-            contrib.weight = single_weights
-            m.station_magnitude_contributions.append(contrib)
-
-        self.critical("new network magnitude: %.2f (Std: %.2f)" % (
-            m.mag, m.mag_errors.uncertainty))
-
-        # XXX TODO: do we need to updat colors here?
-        if self.widgets.qToolButton_showMap.isChecked():
-            return
-
-    # XXX TODO Hypo distances needed?? where??
-    def calculateEpiHypoDists(self):
-        o = self.catalog[0].origins[0]
-        if not o.longitude or not o.latitude:
-            err = "Error: No coordinates for origin!"
-            self.error(err)
-        # XXX TODO need to check that distances are stored with arrival upon
-        # creation
-        epidists = [a.distance for a in o.arrivals]
-        if not o.quality:
-            o.quality = OriginQuality()
-        o.quality.maximum_distance = max(epidists)
-        o.quality.minimum_distance = min(epidists)
-        o.quality.median_distance = np.median(epidists)
-
-    def epidist_for_stream(self, stream):
-        """
-        Return epicentral distance for given stream (in kilometers), return
-        None if epicentral distance can not be computed (no origin, no
-        station coordinates, ..).
-        """
-        if not self.catalog or not self.catalog[0].origins:
-            err = 'Can not compute epicentral distance, no origin information.'
-            self.error(err)
-            return None
-        o = self.catalog[0].origins[0]
-        if not o.longitude or not o.latitude:
-            err = ('Can not compute epicentral distance, origin is missing '
-                   'latitude and/or longitude.')
-            self.error(err)
-            return None
-        tr = stream[0]
-        try:
-            sta_lon = tr.stats.coordinates['longitude']
-            sta_lat = tr.stats.coordinates['latitude']
-        except:
-            err = ('Can not compute epicentral distance, stream ({}) metadata '
-                   'is missing latitude and/or longitude.').format(tr.id)
-            self.error(err)
-            return None
-        epi_dist, _, _ = gps2dist_azimuth(o.latitude, o.longitude,
-                                          sta_lat, sta_lon)
-        return epi_dist / 1e3
-
-    def hypoDist(self, coords):
-        o = self.catalog[0].origins[0]
-        epi_dist, _, _ = gps2dist_azimuth(o.latitude, o.longitude,
-                                          coords['latitude'],
-                                          coords['longitude'])
-        # origin depth is in m positive down,
-        # station elevation is in m positive up
-        if abs(o.depth) < 800:
-            msg = ("Calculating hypocentral distance for origin "
-                   "depth '%s' meters." % o.depth)
-            self.error(msg)
-            warnings.warn(msg)
-        if abs(coords['elevation']) < 8:
-            msg = ("Calculating hypocentral distance for station "
-                   "elevation '%s' meters." % coords['elevation'])
-            self.error(msg)
-        # if sensor is buried or downhole, account for the specified sensor
-        # depth
-        z_dist = o.depth + coords['elevation'] - coords.get('local_depth', 0)
-        return np.sqrt(epi_dist ** 2 + z_dist ** 2) / 1e3
-
-    # XXX TODO maybe rename to "updateStationMagnitude"
-    # XXX TODO automatically update magnitude on setting amplitude picks!
-    def calculateStationMagnitudes(self):
-        event = self.catalog[0]
-        origin = event.origins[0]
-        event.station_magnitudes = []
-
-        netstaloc = set([(amp.waveform_id.network_code,
-                          amp.waveform_id.station_code,
-                          amp.waveform_id.location_code)
-                         for amp in event.amplitudes])
-
-        for net, sta, loc in netstaloc:
-            amplitudes = []
-            timedeltas = []
-            pazs = []
-            channels = []
-            p2ps = []
-            for amplitude in self.getAmplitudes(net, sta, loc):
-                self.debug(str(amplitude))
-                timedelta = amplitude.get_timedelta()
-                self.debug("Timedelta: " + str(timedelta))
-                if timedelta is None:
-                    continue
-                tr = self.getTrace(
-                    seed_string=amplitude.waveform_id.get_seed_string())
-                # either use attached PAZ or response..
-                if "parser" in tr.stats:
-                    paz = tr.stats["parser"].get_paz(tr.id, tr.stats.starttime)
-                elif "response" in tr.stats:
-                    paz = tr.stats["response"]
-                else:
-                    paz = None
-                self.debug("PAZ/response: " + str(paz))
-                if paz is None:
-                    # XXX TODO we could fetch the metadata from seishub if we
-                    # don't have a trace with PAZ and still use the stored info
-                    msg = ("Skipping amplitude for station "
-                           "'%s': Missing PAZ/response metadata" % sta)
-                    self.error(msg)
-                    continue
-                amplitudes.append(amplitude)
-                p2ps.append(amplitude.get_p2p())
-                timedeltas.append(timedelta)
-                pazs.append(paz)
-                channels.append(tr.stats.channel)
-
-            if not amplitudes:
-                continue
-
-            dist = self.hypoDist(tr.stats.coordinates)
-            mag = estimate_magnitude(pazs, p2ps, timedeltas, dist)
-            sm = StationMagnitude()
-            event.station_magnitudes.append(sm)
-            sm.origin_id = origin.resource_id
-            sm.method_id = "/".join(
-                [ID_ROOT, "station_magnitude_method", "obspyck", "2"])
-            sm.mag = mag
-            sm.type = "ML"
-            sm.waveform_id = WaveformStreamID()
-            sm.waveform_id.network_code = net
-            sm.waveform_id.station_code = sta
-            sm.waveform_id.location_code = loc
-            extra = sm.setdefault("extra", AttribDict())
-            extra.channels = {'value': ",".join(channels),
-                              'namespace': NAMESPACE}
-            extra.amplitudeIDs = {'value': ",".join([str(a.resource_id)
-                                                     for a in amplitudes]),
-                                  'namespace': NAMESPACE}
-            self.critical('calculated new magnitude for %s: %0.2f (channels: %s)' % (
-                sta, mag, ",".join(channels)))
-
-    #see http://www.scipy.org/Cookbook/LinearRegression for alternative routine
-    #XXX replace with drawWadati()
-    def drawWadati(self):
-        """
-        Shows a Wadati diagram plotting P time in (truncated) Julian seconds
-        against S-P time for every station and doing a linear regression
-        using rpy. An estimate of Vp/Vs is given by the slope + 1.
-        """
-        try:
-            import rpy
-        except:
-            err = "Error: Package rpy could not be imported!\n" + \
-                  "(We should switch to scipy polyfit, anyway!)"
-            self.error(err)
-            return
-        pTimes = []
-        spTimes = []
-        stations = []
-        for st in self.streams:
-            net = st[0].stats.network
-            sta = st[0].stats.station
-            pick_p = self.getPick(network=net, station=sta, phase_hint='P')
-            pick_s = self.getPick(network=net, station=sta, phase_hint='S')
-            if pick_p and pick_s:
-                p = pick_p.time
-                p = "%.3f" % p.timestamp
-                p = float(p[-7:])
-                pTimes.append(p)
-                sp = pick_s.time - pick_p.time
-                spTimes.append(sp)
-                stations.append(st[0].stats.station)
-            else:
-                continue
-        if len(pTimes) < 2:
-            err = "Error: Less than 2 P-S Pairs!"
+        pTimes = []
+        spTimes = []
+        stations = []
+        for st in self.streams:
+            net = st[0].stats.network
+            sta = st[0].stats.station
+            pick_p = self.getPick(network=net, station=sta, phase_hint='P')
+            pick_s = self.getPick(network=net, station=sta, phase_hint='S')
+            if pick_p and pick_s:
+                p = pick_p.time
+                p = "%.3f" % p.timestamp
+                p = float(p[-7:])
+                pTimes.append(p)
+                sp = pick_s.time - pick_p.time
+                spTimes.append(sp)
+                stations.append(st[0].stats.station)
+            else:
+                continue
+        if len(pTimes) < 2:
+            err = "Error: Less than 2 P-S Pairs!"
             self.error(err)
             return
         my_lsfit = rpy.r.lsfit(pTimes, spTimes)
@@ -3164,9 +2814,15 @@ class ObsPyck(QtGui.QMainWindow):
         t = []
         alphas = {'Z': 1.0, 'L': 1.0,
                   'N': 0.4, 'Q': 0.4, 'R': 0.4, 'E': 0.4, 'T': 0.4}
+        # original data only gets copied if it is going to be modified
+        modify = self.config.getboolean("base", "normalization") and \
+            not self.config.getboolean("base", "no_metadata") and (
+                self.widgets.qToolButton_physical_units.isChecked() or
+                self.widgets.qToolButton_filter.isChecked())
         for i, st in enumerate(self.streams_bkp):
-            st = st.copy()
             for j, tr in enumerate(st):
+                if modify:
+                    tr = tr.copy()
                 net, sta, loc, cha = tr.id.split(".")
                 color = COMPONENT_COLORS.get(cha[-1], "gray")
                 alpha = alphas.get(cha[-1], 0.4)
@@ -3470,7 +3126,7 @@ class ObsPyck(QtGui.QMainWindow):
 
             # hide ticklabels on XY plot
             for ax in [axEMiXY.xaxis, axEMiXY.yaxis]:
-                plt.setp(ax.get_ticklabels(), visible=False)
+                setp(ax.get_ticklabels(), visible=False)
 
 
     def delEventMap(self):
@@ -3512,349 +3168,6 @@ class ObsPyck(QtGui.QMainWindow):
         self.updateNetworkMag()
         self.canv.draw()
 
-    # XXX TODO rename method
-    def dicts2hypo71Stations(self):
-        """
-        Returns the station location information in hypo71
-        stations file format as a string. This string can then be written to
-        a file.
-        """
-        sta_map = self._4_letter_sta_map
-        fmt = "%6s%02i%05.2f%1s%03i%05.2f%1s%4i\n"
-        hypo71_string = ""
-
-        for st in self.streams:
-            stats = st[0].stats
-            sta = stats.station
-            lon = stats.coordinates.longitude
-            lon_deg = int(abs(lon))
-            lon_min = (abs(lon) - abs(lon_deg)) * 60.
-            lat = stats.coordinates.latitude
-            lat_deg = int(abs(lat))
-            lat_min = (abs(lat) - abs(lat_deg)) * 60.
-            hem_NS = 'N'
-            hem_EW = 'E'
-            if lat < 0:
-                hem_NS = 'S'
-            if lon < 0:
-                hem_EW = 'W'
-            # hypo 71 format uses elevation in meters not kilometers
-            ele = stats.coordinates.elevation
-            # if sensor is buried or downhole, account for the specified sensor
-            # depth
-            depth = stats.coordinates.get('local_depth')
-            if depth:
-                ele -= depth
-            hypo71_string += fmt % (sta_map[sta], lat_deg, lat_min, hem_NS,
-                                    lon_deg, lon_min, hem_EW, ele)
-
-        return hypo71_string
-
-    def dicts2hypo71Phases(self):
-        """
-        Returns the pick information in hypo71 phase file format
-        as a string. This string can then be written to a file.
-
-        Information on the file formats can be found at:
-        http://geopubs.wr.usgs.gov/open-file/of02-171/of02-171.pdf p.30
-
-        Quote:
-        The traditional USGS phase data input format (not Y2000 compatible)
-        Some fields were added after the original HYPO71 phase format
-        definition.
-
-        Col. Len. Format Data
-         1    4  A4       4-letter station site code. Also see col 78.
-         5    2  A2       P remark such as "IP". If blank, any P time is
-                          ignored.
-         7    1  A1       P first motion such as U, D, +, -, C, D.
-         8    1  I1       Assigned P weight code.
-         9    1  A1       Optional 1-letter station component.
-        10   10  5I2      Year, month, day, hour and minute.
-        20    5  F5.2     Second of P arrival.
-        25    1  1X       Presently unused.
-        26    6  6X       Reserved remark field. This field is not copied to
-                          output files.
-        32    5  F5.2     Second of S arrival. The S time will be used if this
-                          field is nonblank.
-        37    2  A2, 1X   S remark such as "ES".
-        40    1  I1       Assigned weight code for S.
-        41    1  A1, 3X   Data source code. This is copied to the archive
-                          output.
-        45    3  F3.0     Peak-to-peak amplitude in mm on Develocorder viewer
-                          screen or paper record.
-        48    3  F3.2     Optional period in seconds of amplitude read on the
-                          seismogram. If blank, use the standard period from
-                          station file.
-        51    1  I1       Amplitude magnitude weight code. Same codes as P & S.
-        52    3  3X       Amplitude magnitude remark (presently unused).
-        55    4  I4       Optional event sequence or ID number. This number may
-                          be replaced by an ID number on the terminator line.
-        59    4  F4.1     Optional calibration factor to use for amplitude
-                          magnitudes. If blank, the standard cal factor from
-                          the station file is used.
-        63    3  A3       Optional event remark. Certain event remarks are
-                          translated into 1-letter codes to save in output.
-        66    5  F5.2     Clock correction to be added to both P and S times.
-        71    1  A1       Station seismogram remark. Unused except as a label
-                          on output.
-        72    4  F4.0     Coda duration in seconds.
-        76    1  I1       Duration magnitude weight code. Same codes as P & S.
-        77    1  1X       Reserved.
-        78    1  A1       Optional 5th letter of station site code.
-        79    3  A3       Station component code.
-        82    2  A2       Station network code.
-        84-85 2  A2     2-letter station location code (component extension).
-        """
-        sta_map = self._4_letter_sta_map
-
-        fmtP = "%4s%1sP%1s%1i %15s"
-        fmtS = "%12s%1sS%1s%1i\n"
-        hypo71_string = ""
-
-        for st in self.streams:
-            net = st[0].stats.network
-            sta = st[0].stats.station
-            pick_p = self.getPick(network=net, station=sta, phase_hint='P')
-            pick_s = self.getPick(network=net, station=sta, phase_hint='S')
-            if not pick_p and not pick_s:
-                continue
-            if not pick_p:
-                msg = ("Hypo2000 phase file format does not support S pick "
-                       "without P pick. Skipping station: %s") % sta
-                self.error(msg)
-                continue
-
-            # P Pick
-            pick = pick_p
-            t = pick.time
-            hundredth = int(round(t.microsecond / 1e4))
-            if hundredth == 100:  # XXX check!!
-                t_p = t + 1
-                hundredth = 0
-            else:
-                t_p = t
-            date = t_p.strftime("%y%m%d%H%M%S") + ".%02d" % hundredth
-            if pick.onset == 'impulsive':
-                onset = 'I'
-            elif pick.onset == 'emergent':
-                onset = 'E'
-            else:
-                onset = '?'
-            if pick.polarity == "positive":
-                polarity = "U"
-            elif pick.polarity == "negative":
-                polarity = "D"
-            else:
-                polarity = "?"
-            try:
-                weight = int(pick.extra.weight.value)
-            except:
-                weight = 0
-            hypo71_string += fmtP % (sta_map[sta], onset, polarity, weight, date)
-
-            # S Pick
-            if pick_s:
-                if not pick_p:
-                    err = "Warning: Trying to print a Hypo2000 phase file " + \
-                          "with an S phase without P phase.\n" + \
-                          "This case might not be covered correctly and " + \
-                          "could screw our file up!"
-                    self.error(err)
-                pick = pick_s
-                t2 = pick.time
-                # if the S time's absolute minute is higher than that of the
-                # P pick, we have to add 60 to the S second count for the
-                # hypo 2000 output file
-                # +60 %60 is necessary if t.min = 57, t2.min = 2 e.g.
-                mindiff = (t2.minute - t.minute + 60) % 60
-                abs_sec = t2.second + (mindiff * 60)
-                if abs_sec > 99:
-                    err = "Warning: S phase seconds are greater than 99 " + \
-                          "which is not covered by the hypo phase file " + \
-                          "format! Omitting S phase of station %s!" % sta
-                    self.error(err)
-                    hypo71_string += "\n"
-                    continue
-                hundredth = int(round(t2.microsecond / 1e4))
-                if hundredth == 100:
-                    abs_sec += 1
-                    hundredth = 0
-                date2 = "%s.%02d" % (abs_sec, hundredth)
-                if pick.onset == 'impulsive':
-                    onset2 = 'I'
-                elif pick.onset == 'emergent':
-                    onset2 = 'E'
-                else:
-                    onset2 = '?'
-                if pick.polarity == "positive":
-                    polarity2 = "U"
-                elif pick.polarity == "negative":
-                    polarity2 = "D"
-                else:
-                    polarity2 = "?"
-                try:
-                    weight2 = int(pick.extra.weight.value)
-                except:
-                    weight2 = 0
-                hypo71_string += fmtS % (date2, onset2, polarity2, weight2)
-            else:
-                hypo71_string += "\n"
-
-        return hypo71_string
-
-    def dicts2NLLocPhases(self):
-        """
-        Returns the pick information in NonLinLoc's own phase
-        file format as a string. This string can then be written to a file.
-        Currently only those fields really needed in location are actually used
-        in assembling the phase information string.
-
-        Information on the file formats can be found at:
-        http://alomax.free.fr/nlloc/soft6.00/formats.html#_phase_
-
-        Quote:
-        NonLinLoc Phase file format (ASCII, NLLoc obsFileType = NLLOC_OBS)
-
-        The NonLinLoc Phase file format is intended to give a comprehensive
-        phase time-pick description that is easy to write and read.
-
-        For each event to be located, this file contains one set of records. In
-        each set there is one "arrival-time" record for each phase at each seismic
-        station. The final record of each set is a blank. As many events as desired can
-        be included in one file.
-
-        Each record has a fixed format, with a blank space between fields. A
-        field should never be left blank - use a "?" for unused characther fields and a
-        zero or invalid numeric value for numeric fields.
-
-        The NonLinLoc Phase file record is identical to the first part of each
-        phase record in the NLLoc Hypocenter-Phase file output by the program NLLoc.
-        Thus the phase list output by NLLoc can be used without modification as time
-        pick observations for other runs of NLLoc.
-
-        NonLinLoc phase record:
-        Fields:
-        Station name (char*6)
-            station name or code
-        Instrument (char*4)
-            instument identification for the trace for which the time pick
-            corresponds (i.e. SP, BRB, VBB)
-        Component (char*4)
-            component identification for the trace for which the time pick
-            corresponds (i.e. Z, N, E, H)
-        P phase onset (char*1)
-            description of P phase arrival onset; i, e
-        Phase descriptor (char*6)
-            Phase identification (i.e. P, S, PmP)
-        First Motion (char*1)
-            first motion direction of P arrival; c, C, u, U = compression;
-            d, D = dilatation; +, -, Z, N; . or ? = not readable.
-        Date (yyyymmdd) (int*6)
-            year (with century), month, day
-        Hour/minute (hhmm) (int*4)
-            Hour, min
-        Seconds (float*7.4)
-            seconds of phase arrival
-        Err (char*3)
-            Error/uncertainty type; GAU
-        ErrMag (expFloat*9.2)
-            Error/uncertainty magnitude in seconds
-        Coda duration (expFloat*9.2)
-            coda duration reading
-        Amplitude (expFloat*9.2)
-            Maxumim peak-to-peak amplitude
-        Period (expFloat*9.2)
-            Period of amplitude reading
-        PriorWt (expFloat*9.2)
-
-        A-priori phase weight Currently can be 0 (do not use reading) or
-        1 (use reading). (NLL_FORMAT_VER_2 - WARNING: under development)
-
-        Example:
-
-        GRX    ?    ?    ? P      U 19940217 2216   44.9200 GAU  2.00e-02 -1.00e+00 -1.00e+00 -1.00e+00
-        GRX    ?    ?    ? S      ? 19940217 2216   48.6900 GAU  4.00e-02 -1.00e+00 -1.00e+00 -1.00e+00
-        CAD    ?    ?    ? P      D 19940217 2216   46.3500 GAU  2.00e-02 -1.00e+00 -1.00e+00 -1.00e+00
-        CAD    ?    ?    ? S      ? 19940217 2216   50.4000 GAU  4.00e-02 -1.00e+00 -1.00e+00 -1.00e+00
-        BMT    ?    ?    ? P      U 19940217 2216   47.3500 GAU  2.00e-02 -1.00e+00 -1.00e+00 -1.00e+00
-        """
-        nlloc_str = ""
-
-        for pick in self.catalog[0].picks:
-            sta = pick.waveform_id.station_code.ljust(6)
-            inst = "?".ljust(4)
-            comp = "?".ljust(4)
-            onset = "?"
-            phase = pick.phase_hint.ljust(6)
-            pol = "?"
-            t = pick.time
-            date = t.strftime("%Y%m%d")
-            hour_min = t.strftime("%H%M")
-            sec = "%7.4f" % (t.second + t.microsecond / 1e6)
-            error_type = "GAU"
-            error = None
-            # XXX check: should we take only half of the complete left-to-right error?!?
-            if pick.time_errors.upper_uncertainty and pick.time_errors.lower_uncertainty:
-                error = pick.time_errors.upper_uncertainty + pick.time_errors.lower_uncertainty
-            elif pick.time_errors.uncertainty:
-                error = 2 * pick.time_errors.uncertainty
-            if error is None:
-                error = self.config.getfloat("nonlinloc",
-                                             "default_pick_uncertainty")
-                err = ("Warning: Missing pick error. Using a default error "
-                       "of {}s for {} phase of station {}. Please set pick "
-                       "errors.").format(error, phase.strip(), sta.strip())
-                self.error(err)
-            error = "%9.2e" % error
-            coda_dur = "-1.00e+00"
-            ampl = "-1.00e+00"
-            period = "-1.00e+00"
-            fields = [sta, inst, comp, onset, phase, pol, date, hour_min,
-                      sec, error_type, error, coda_dur, ampl, period]
-            phase_str = " ".join(fields)
-            nlloc_str += phase_str + "\n"
-        return nlloc_str
-
-    def get_QUAKEML_string(self):
-        """
-        Returns all information as xml file (type string)
-        """
-        cat = self.catalog
-        cat.creation_info.creation_time = UTCDateTime()
-        cat.creation_info.version = VERSION_INFO
-        e = cat[0]
-        extra = e.setdefault("extra", AttribDict())
-        public = self.widgets.qCheckBox_public.isChecked()
-
-        extra.evaluationMode = {'value': "manual", 'namespace': NAMESPACE}
-        extra.public = {'value': public, 'namespace': NAMESPACE}
-
-        # check if an quakeML event type should be set
-        event_quakeml_type = str(self.widgets.qComboBox_eventType.currentText())
-        if event_quakeml_type != '<event type>':
-            e.event_type = event_quakeml_type
-
-        # XXX TODO change handling of resource ids. never change id set at
-        # creation and make sure that only wanted arrivals/picks get
-        # saved/stored.
-
-        with NamedTemporaryFile() as tf:
-            tmp = tf.name
-            cat.write(tmp, "QUAKEML", nsmap=NSMAP)
-            with open(tmp) as fh:
-                xml = fh.read()
-
-        return xml
-
-    def setXMLEventID(self, event_id=None):
-        #XXX TODO: is problematic if two people create an event at exactly the same second!
-        # then one event is overwritten with the other during submission.
-        if event_id is None:
-            event_id = UTCDateTime().strftime('%Y%m%d%H%M%S')
-        self.catalog[0].resource_id = "/".join([ID_ROOT, "event", event_id])
-        self.catalog.resource_id = "/".join([ID_ROOT, "catalog", event_id])
-
     def save_event_locally(self):
         """
         Save event locally as QuakeML file
@@ -3876,9 +3189,16 @@ class ObsPyck(QtGui.QMainWindow):
         self.critical(msg % name)
         open(name, "wt").write(data)
 
-    def upload_event(self):
+    def upload_event(self, callback=None):
         """
         Upload event to SeisHub and/or Jane
+
+        The QuakeML document and all other information needed for the upload
+        are gathered right away, the actual upload is done in a background
+        job.
+
+        :param callback: Called (without arguments, on the GUI thread) after
+            the upload jobs are finished.
         """
         if not self.event_server:
             msg = "'event_server' not set in config, section [base]"
@@ -3897,54 +3217,148 @@ class ObsPyck(QtGui.QMainWindow):
         name = "obspyck_" + name
         if not name.endswith(".xml"):
             name += ".xml"
-        tmpfile = os.path.join(self.tmp_dir, name)
-        tmpfile2 = os.path.join(tempfile.gettempdir(), name)
+        # temporary directory gets removed on exit, so better store the copy
+        # in system's temp dir
+        tmpfile = os.path.join(tempfile.gettempdir(), name)
         self.info("creating xml...")
         data = self.get_QUAKEML_string()
-        self.update_qml_text(data)
-        msg = "writing xml as %s and %s (for debugging purposes and in " + \
+        self.update_qml_text()
+        msg = "writing xml as %s (for debugging purposes and in " + \
               "case of upload errors)"
-        self.critical(msg % (tmpfile, tmpfile2))
-        for fname in [tmpfile, tmpfile2]:
-            open(fname, "wt").write(data)
+        self.critical(msg % tmpfile)
+        with open(tmpfile, "wt") as fh:
+            fh.write(data)
+
+        # NonLinLoc scatter gets uploaded as an attachment to Jane
+        nlloc_scatter = None
+        origin_id = None
+        if self.catalog[0].origins:
+            origin = self.catalog[0].origins[0]
+            nlloc_scatter = origin.get("nonlinloc_scatter")
+            origin_id = str(origin.resource_id)
 
+        jobs = []
         if self.event_server_type == "seishub":
-            self.uploadSeisHub(name, data)
+            client, seishub_account = self._get_seishub_upload_client()
+            jobs.append(("upload of %s to SeisHub" % name, self.uploadSeisHub,
+                         (name, data, client, seishub_account)))
         elif self.event_server_type == "jane":
-            conf = self.config
-            server_key = conf.get("base", "event_server")
-            client = self.event_server
-            base_url = client.base_url
-            user = conf.get(server_key, "user")
-            password = conf.get(server_key, "password")
-            self.upload_event_jane(name, data, base_url, user, password)
+            base_url, user, password = self._get_jane_credentials(
+                self.config.get("base", "event_server"), self.event_server)
+            jobs.append(("upload of %s to Jane" % name, self.upload_event_jane,
+                         (name, data, base_url, user, password, nlloc_scatter,
+                          origin_id)))
         else:
             raise ValueError()
         # XXX for transition to Jane, temporarily do both
         if self.test_event_server:
-            self.upload_event_jane_test(name, data)
-
-    def upload_event_jane_test(self, name, data):
-        """
-        Should be deleted again.. when Jane upload is properly tested and we
-        drop parallel upload to Seishub+Jane again
+            base_url, user, password = self._get_jane_credentials(
+                self.config.get("base", "test_event_server_jane"),
+                self.test_event_server)
+            jobs.append(("upload of %s to test Jane" % name,
+                         self.upload_event_jane,
+                         (name, data, base_url, user, password, nlloc_scatter,
+                          origin_id)))
+        for i, (description, func, args) in enumerate(jobs):
+            # callback only after the last job
+            callback_ = (i == len(jobs) - 1) and callback or None
+            self.upload_queue.submit(description, func, args=args,
+                                     callback=callback_)
+        self._update_upload_status()
+
+    def _get_jane_credentials(self, server_key, client):
+        """
+        Returns base url, user and password for given Jane server.
         """
         conf = self.config
-        server_key = conf.get("base", "test_event_server_jane")
-        client = self.test_event_server
         base_url = client.base_url
         user = conf.get(server_key, "user")
         password = conf.get(server_key, "password")
-        self.upload_event_jane(name, data, base_url, user, password)
+        return base_url, user, password
 
-    def upload_event_jane(self, name, data, base_url, user, password):
+    def _get_seishub_upload_client(self):
+        """
+        Returns SeisHub client and account name to use for upload/deletion.
+        """
+        # check, if the event should be uploaded/deleted as sysop. in this
+        # case we use the sysop client instance for the upload (and also set
+        # user_account in the xml to "sysop").
+        # the correctness of the sysop password is tested when checking the
+        # sysop box and entering the password immediately.
+        if self.widgets.qCheckBox_public.isChecked():
+            seishub_account = "sysop"
+            client = self.clients['__SeisHub-sysop__']
+        else:
+            seishub_account = "obspyck"
+            client = self.event_server
+        return client, seishub_account
+
+    def _on_event_uploaded(self):
+        """
+        Refresh event list after an upload finished (this also checks for
+        duplicate public events).
+        """
+        self.on_qToolButton_updateEventList_clicked()
+
+    def _poll_upload_queue(self, run_callbacks=True):
+        """
+        Report finished upload/deletion jobs. Called periodically on the GUI
+        thread.
+        """
+        for description, callback, result, error in self.upload_queue.poll():
+            # any upload/deletion (even a failed one) might have changed
+            # what's on the server
+            self._invalidate_event_list()
+            if error is not None:
+                msg = "Error: %s failed: %s" % (description, error)
+                self.error(msg)
+                self.statusBar().showMessage(msg, 10000)
+            else:
+                self.critical(result)
+                self.statusBar().showMessage(
+                    "Finished %s" % description, 5000)
+            if run_callbacks and callback is not None:
+                callback()
+        self._update_upload_status()
+
+    def _update_upload_status(self):
+        """
+        Show number of pending uploads/deletions in status bar.
+        """
+        pending = self.upload_queue.pending
+        if pending:
+            msg = "%i upload/deletion job(s) pending, current: %s" % (
+                len(pending), pending[0])
+        else:
+            msg = ""
+        self.qLabel_uploadStatus.setText(msg)
+
+    def _get_http_session(self):
+        """
+        HTTP session used for all uploads/deletions (keeps connections
+        alive), created on first use.
+        """
+        if self.http_session is None:
+            import requests
+            self.http_session = requests.Session()
+        return self.http_session
+
+    def upload_event_jane(self, name, data, base_url, user, password,
+                          nlloc_scatter=None, origin_id=None):
+        """
+        Upload quakeml file to Jane (and NonLinLoc scatter as attachment, if
+        present). Runs in background thread, so no GUI elements may be used
+        here.
+
+        :returns: Message string about the successful upload.
+        """
+        session = self._get_http_session()
         url = base_url + "/rest/documents/quakeml/%s" % name
-        r = requests.put(url=url, data=data, auth=(user, password))
+        r = session.put(url=url, data=data, auth=(user, password))
         if not r.ok:
             msg = 'Something went wrong during upload to JANE! ({!s})'.format(
                 r.status_code)
-            self.error(msg)
-            return
+            raise HTTPStatusError(msg, r.status_code)
 
         msg = "Uploading Event!"
         msg += "\nJane Account: %s" % user
@@ -3952,64 +3366,51 @@ class ObsPyck(QtGui.QMainWindow):
         msg += "\nName: %s" % name
         msg += "\nJane Server: %s" % base_url
         msg += "\nResponse: %s %s" % (r.status_code, r.text)
-        self.critical(msg)
 
-        if not self.catalog[0].origins:
-            return
-
-        origin = self.catalog[0].origins[0]
-        nlloc_scatter = origin.get("nonlinloc_scatter")
-        if nlloc_scatter is not None:
-            sio = StringIO()
-            header = "\n".join([
-                "NonLinLoc Scatter",
-                "Origin ID: {}".format(str(origin.resource_id)),
-                "Longitude, Latitude, Z (km below sea level), PDF value",
-                ])
-            np.savetxt(sio, nlloc_scatter, fmt="%.6f %.6f %.4f %.2f",
-                       header=header)
-            sio.seek(0)
-            data = sio.read()
-            sio.close()
-            url = "{}/rest/documents/quakeml/{}?format=json".format(
-                base_url, name)
-            r = requests.get(url, auth=(user, password))
-            if not r.ok:
-                msg = ('Something went wrong during NonLinLoc scatter upload '
-                       'to JANE! ({!s})').format(r.status_code)
-                self.error(msg)
-            jane_id = r.json()["indices"][0]["id"]
-            url = "{}/rest/document_indices/quakeml/{}/attachments".format(
-                base_url, jane_id)
-            headers = {"content-type": "text/plain",
-                       "category": "nonlinloc_scatter"}
-            r = requests.post(url=url, auth=(user, password), headers=headers,
-                              data=data)
-            if not r.ok:
-                msg = ('Something went wrong during NonLinLoc scatter upload '
-                       'to JANE! ({!s})').format(r.status_code)
-                self.error(msg)
+        if nlloc_scatter is None:
+            return msg
+
+        sio = StringIO()
+        header = "\n".join([
+            "NonLinLoc Scatter",
+            "Origin ID: {}".format(origin_id),
+            "Longitude, Latitude, Z (km below sea level), PDF value",
+            ])
+        np.savetxt(sio, nlloc_scatter, fmt="%.6f %.6f %.4f %.2f",
+                   header=header)
+        sio.seek(0)
+        data = sio.read()
+        sio.close()
+        url = "{}/rest/documents/quakeml/{}?format=json".format(
+            base_url, name)
+        r = session.get(url, auth=(user, password))
+        if not r.ok:
+            msg = ('Something went wrong during NonLinLoc scatter upload '
+                   'to JANE! ({!s})').format(r.status_code)
+            raise HTTPStatusError(msg, r.status_code)
+        jane_id = r.json()["indices"][0]["id"]
+        url = "{}/rest/document_indices/quakeml/{}/attachments".format(
+            base_url, jane_id)
+        headers = {"content-type": "text/plain",
+                   "category": "nonlinloc_scatter"}
+        r = session.post(url=url, auth=(user, password), headers=headers,
+                         data=data)
+        if not r.ok:
+            msg = ('Something went wrong during NonLinLoc scatter upload '
+                   'to JANE! ({!s})').format(r.status_code)
+            raise HTTPStatusError(msg, r.status_code)
 
-        msg = "Uploaded NonLinLoc Scatter as attachment"
+        msg += "\nUploaded NonLinLoc Scatter as attachment"
         msg += "\nResponse: %s %s" % (r.status_code, r.text)
-        self.critical(msg)
+        return msg
 
-    def uploadSeisHub(self, name, data):
-        """
-        Upload quakeml file to SeisHub
+    def uploadSeisHub(self, name, data, client, seishub_account):
         """
-        # check, if the event should be uploaded as sysop. in this case we use
-        # the sysop client instance for the upload (and also set
-        # user_account in the xml to "sysop").
-        # the correctness of the sysop password is tested when checking the
-        # sysop box and entering the password immediately.
-        if self.widgets.qCheckBox_public.isChecked():
-            seishub_account = "sysop"
-            client = self.clients['__SeisHub-sysop__']
-        else:
-            seishub_account = "obspyck"
-            client = self.event_server
+        Upload quakeml file to SeisHub. Runs in background thread, so no GUI
+        elements may be used here.
 
+        :returns: Message string about the upload.
+        """
         headers = {}
         try:
             host = socket.gethostname()
@@ -4027,51 +3428,63 @@ class ObsPyck(QtGui.QMainWindow):
         msg += "\nName: %s" % name
         msg += "\nServer: %s" % self.config.get("base", "event_server")
         msg += "\nResponse: %s %s" % (code, message)
-        self.critical(msg)
+        return msg
 
-    def delete_event(self, resource_name):
+    def delete_event(self, resource_name, callback=None):
         """
-        Delete event from SeisHub and/or Jane
+        Delete event from SeisHub and/or Jane (in a background job).
+
+        :param callback: Called (without arguments, on the GUI thread) after
+            the deletion jobs are finished.
         """
         if not self.event_server:
             msg = "'event_server' not set in config, section [base]"
             self.error(msg)
             return
 
+        jobs = []
         if self.event_server_type == "seishub":
-            self.deleteEventInSeisHub(resource_name)
+            client, seishub_account = self._get_seishub_upload_client()
+            jobs.append(("deletion of %s on SeisHub" % resource_name,
+                         self.deleteEventInSeisHub,
+                         (resource_name, client, seishub_account)))
         elif self.event_server_type == "jane":
-            conf = self.config
-            server_key = conf.get("base", "event_server")
-            client = self.event_server
-            base_url = client.base_url
-            user = conf.get(server_key, "user")
-            password = conf.get(server_key, "password")
-            self.delete_event_jane(resource_name, base_url, user, password)
+            base_url, user, password = self._get_jane_credentials(
+                self.config.get("base", "event_server"), self.event_server)
+            jobs.append(("deletion of %s on Jane" % resource_name,
+                         self.delete_event_jane,
+                         (resource_name, base_url, user, password)))
         else:
             raise ValueError()
         # for transition to Jane, temporarily do both
         if self.test_event_server:
-            self.delete_event_jane_test(resource_name)
-
-    def delete_event_jane_test(self, resource_name):
-        conf = self.config
-        server_key = conf.get("base", "test_event_server_jane")
-        client = self.test_event_server
-        base_url = client.base_url
-        user = conf.get(server_key, "user")
-        password = conf.get(server_key, "password")
-        self.delete_event_jane(resource_name, base_url, user, password)
+            base_url, user, password = self._get_jane_credentials(
+                self.config.get("base", "test_event_server_jane"),
+                self.test_event_server)
+            jobs.append(("deletion of %s on test Jane" % resource_name,
+                         self.delete_event_jane,
+                         (resource_name, base_url, user, password)))
+        for i, (description, func, args) in enumerate(jobs):
+            # callback only after the last job
+            callback_ = (i == len(jobs) - 1) and callback or None
+            self.upload_queue.submit(description, func, args=args,
+                                     callback=callback_)
+        self._update_upload_status()
 
     def delete_event_jane(self, resource_name, base_url, user, password):
-        r = requests.delete(
+        """
+        Delete quakeml file on Jane. Runs in background thread, so no GUI
+        elements may be used here.
+
+        :returns: Message string about the successful deletion.
+        """
+        r = self._get_http_session().delete(
             url=base_url + "/rest/documents/quakeml/%s" % resource_name,
             auth=(user, password))
         if not r.ok:
             msg = 'Something went wrong during deletion on JANE! ({!s})'.format(
                 r.status_code)
-            self.error(msg)
-            return
+            raise HTTPStatusError(msg, r.status_code)
 
         msg = "Deleting Event!"
         msg += "\nJane Account: %s" % user
@@ -4079,27 +3492,19 @@ class ObsPyck(QtGui.QMainWindow):
         msg += "\nName: %s" % resource_name
         msg += "\nJane Server: %s" % base_url
         msg += "\nResponse: %s %s" % (r.status_code, r.text)
-        self.critical(msg)
+        return msg
 
-    def deleteEventInSeisHub(self, resource_name):
+    def deleteEventInSeisHub(self, resource_name, client, seishub_account):
         """
         Delete xml file from SeisHub.
         (Move to SeisHubs trash folder if this option is activated)
+        Runs in background thread, so no GUI elements may be used here.
+
+        :returns: Message string about the deletion.
         """
-        # check, if the event should be deleted as sysop. in this case we
-        # use the sysop client instance for the DELETE request.
         # sysop may delete resources from any user.
         # at the moment deleted resources go to SeisHubs trash folder (and can
         # easily be resubmitted using the http interface).
-        # the correctness of the sysop password is tested when checking the
-        # sysop box and entering the password immediately.
-        if self.widgets.qCheckBox_public.isChecked():
-            seishub_account = "sysop"
-            client = self.clients['__SeisHub-sysop__']
-        else:
-            seishub_account = "obspyck"
-            client = self.event_server
-
         headers = {}
         try:
             host = socket.gethostname()
@@ -4115,25 +3520,13 @@ class ObsPyck(QtGui.QMainWindow):
         msg += "\nName: %s" % resource_name
         msg += "\nServer: %s" % self.config.get("base", "event_server")
         msg += "\nResponse: %s %s" % (code, message)
-        self.critical(msg)
-
-    def clearEvent(self):
-        self.info("Clearing previous event data.")
-        self.catalog = Catalog()
-        event = Event()
-        event.set_creation_info_username(self.username)
-        self.catalog.events = [event]
-
-    def clearOriginMagnitude(self):
-        self.info("Clearing previous origin and magnitude data.")
-        self.catalog[0].origins = []
-        self.catalog[0].magnitudes = []
-        self.catalog[0].station_magnitudes = []
+        return msg
 
     def clearFocmec(self):
         self.info("Clearing previous focal mechanism data.")
         self.catalog[0].focal_mechanisms = []
         self.focMechCurrent = None
+        self._catalog_changed()
 
     def updateAllItems(self):
         st = self.getCurrentStream()
@@ -4294,279 +3687,35 @@ class ObsPyck(QtGui.QMainWindow):
             ax.axvspan(x[0], x[1], color=color, alpha=0.2)
             ax.axhspan(y[0], y[1], color=color, alpha=0.1)
 
-    def delPick(self, pick):
-        event = self.catalog[0]
-        if pick in event.picks:
-            event.picks.remove(pick)
-
-    def delAmplitude(self, amplitude):
-        event = self.catalog[0]
-        if amplitude in event.amplitudes:
-            event.amplitudes.remove(amplitude)
-
-    def getPick(self, network=None, station=None, phase_hint=None, waveform_id=None, axes=None, setdefault=False, seed_string=None):
+    def getPick(self, axes=None, **kwargs):
         """
-        returns first matching pick, does NOT ensure there is only one!
-        if setdefault is True then if no pick is found an empty one is returned and inserted into self.picks.
+        See :meth:`ObsPyckCore.getPick`. If axes is given, only a pick of the
+        currently selected phase type on the trace shown in the axes matches.
         """
-        picks = self.catalog[0].picks
-        for p in picks:
-            if network is not None and network != p.waveform_id.network_code:
-                continue
-            if station is not None and station != p.waveform_id.station_code:
-                continue
-            if phase_hint is not None and phase_hint != p.phase_hint:
-                continue
-            if waveform_id is not None and waveform_id != p.waveform_id:
-                continue
-            if seed_string is not None and seed_string != p.waveform_id.get_seed_string():
-                continue
-            if axes is not None:
-                _i = self.axs.index(axes)
-                _id = self.getCurrentStream()[_i].id
-                phase_hint = self.getCurrentPhase()
-                if p.waveform_id.get_seed_string() != _id:
-                    continue
-                if p.phase_hint != phase_hint:
-                    continue
-            return p
-        if setdefault:
-            # XXX TODO check if handling of picks/arrivals with regard to
-            # resource ids is safe (overwritten picks, arrivals get deleted
-            # etc., association of picks/arrivals is ok)
-            # also check if setup of resource id strings make sense in general
-            # (make versioning of methods possible, etc)
-            if seed_string is None:
-                raise Exception("Pick setdefault needs seed_string and phase_hint kwargs")
-            p = Pick(seed_string=seed_string, phase_hint=phase_hint)
-            picks.append(p)
-            return p
-        else:
-            return None
+        if axes is not None:
+            _i = self.axs.index(axes)
+            kwargs['seed_string'] = self.getCurrentStream()[_i].id
+            kwargs['phase_hint'] = self.getCurrentPhase()
+        return ObsPyckCore.getPick(self, **kwargs)
 
-    def getPicks(self, network, station, location=None):
+    def getAmplitude(self, axes=None, **kwargs):
         """
-        returns all matching picks as list.
+        See :meth:`ObsPyckCore.getAmplitude`. If axes is given, only an
+        amplitude on the trace shown in the axes matches.
         """
-        picks = self.catalog[0].picks
-        ret = []
-        for p in picks:
-            if network != p.waveform_id.network_code:
-                continue
-            if station != p.waveform_id.station_code:
-                continue
-            if location is not None:
-                if location != p.waveform_id.location_code:
-                    continue
-            ret.append(p)
-        return ret
-
-    def getAmplitude(self, network=None, station=None, waveform_id=None, axes=None, setdefault=False, seed_string=None):
-        """
-        returns first matching amplitude, does NOT ensure there is only one!
-        if setdefault is True then if no arrival is found an empty one is returned and inserted into self.arrivals.
-        """
-        amplitudes = self.catalog[0].amplitudes
-        for a in amplitudes:
-            if network is not None and network != a.waveform_id.network_code:
-                continue
-            if station is not None and station != a.waveform_id.station_code:
-                continue
-            if waveform_id is not None and waveform_id != a.waveform_id:
-                continue
-            if seed_string is not None and seed_string != a.waveform_id.get_seed_string():
-                continue
-            if axes is not None:
-                _i = self.axs.index(axes)
-                _id = self.getCurrentStream()[_i].id
-                if a.waveform_id.get_seed_string() != _id:
-                    continue
-            return a
-        if setdefault:
-            # XXX TODO check if handling of picks/arrivals with regard to
-            # resource ids is safe (overwritten picks, arrivals get deleted
-            # etc., association of picks/arrivals is ok)
-            # also check if setup of resource id strings make sense in general
-            # (make versioning of methods possible, etc)
-            if seed_string is None:
-                raise Exception("Arrival setdefault needs seed_string kwarg")
-            self.debug(seed_string)
-            a = Amplitude(seed_string=seed_string)
-            amplitudes.append(a)
-            return a
-        else:
-            return None
-
-    def getAmplitudes(self, network, station, location):
-        """
-        returns all matching amplitudes as list.
-        """
-        amplitudes = self.catalog[0].amplitudes
-        ret = []
-        for a in amplitudes:
-            if network != a.waveform_id.network_code:
-                continue
-            if station != a.waveform_id.station_code:
-                continue
-            if location != a.waveform_id.location_code:
-                continue
-            ret.append(a)
-        return ret
-
-    def getTrace(self, seed_string):
-        """
-        returns matching trace, does NOT ensure there is only one!
-        """
-        network, station, location, channel = seed_string.split(".")
-        st = self.getStream(network, station, location)
-        self.debug("seed_string: %s" % seed_string)
-        self.debug(str(st))
-        if st is None:
-            return None
-        st = st.select(channel=channel)
-        self.debug(str(st))
-        if not st:
-            return None
-        #if len(st) > 1:
-        #    err = ("Warning: More than one trace matching:\n%s\n"
-        #           "This should not happen. Using first Trace.") % str(st)
-        #    self.error(err)
-        return st[0]
-
-    def getStream(self, network=None, station=None, location=None):
-        """
-        returns matching stream, does NOT ensure there is only one!
-        """
-        self.debug("net: %s, sta: %s,loc: %s" % (network, station, location))
-        st = Stream()
-        for st_ in self.streams:
-            st += st_
-        for st_ in self.streams_bkp:
-            st += st_.copy()
-        self.debug(str(st))
-        st = st.select(network=network, station=station,
-                       location=location)
-        self.debug(str(st))
-        st.merge(-1)
-        self.debug(str(st))
-        if st:
-            return st
-        return None
-
-    def getStationMagnitude(self, network, station, location):
-        """
-        returns matching station magnitude, does NOT ensure there is only one!
-        """
-        try:
-            stamags = self.catalog[0].station_magnitudes
-        except:
-            return None
-        for stamag in stamags:
-            wid = stamag.waveform_id
-            if network != wid.network_code:
-                continue
-            if station != wid.station_code:
-                continue
-            if location != wid.location_code:
-                continue
-            return stamag
-        return None
-
-    def update_origin_azimuthal_gap(self):
-        origin = self.catalog[0].origins[0]
-        arrivals = origin.arrivals
-        picks = self.catalog[0].picks
-        azims = {}
-        for a in arrivals:
-            p = getPickForArrival(picks, a)
-            if p is None:
-                msg = ("Could not find pick for arrival. Aborting calculation "
-                       "of azimuthal gap.")
-                self.error(msg)
-                return
-            netsta = ".".join([p.waveform_id.network_code, p.waveform_id.station_code])
-            azim = a.azimuth
-            if azim is None:
-                msg = ("Arrival's azimuth is 'None'. "
-                       "Calculated azimuthal gap might be wrong")
-                self.error(msg)
-            else:
-                azims.setdefault(netsta, []).append(azim)
-        self.debug("Arrival azimuths: %s" % azims)
-        azim_list = []
-        for netsta in azims:
-            tmp_list = azims.get(netsta, [])
-            if not tmp_list:
-                msg = ("No azimuth information for station %s. "
-                       "Aborting calculation of azimuthal gap.")
-                self.error(msg)
-                return
-            azim_list.append((np.median(tmp_list), netsta))
-        azim_list = sorted(azim_list)
-        azims = np.array([azim for azim, netsta in azim_list])
-        azims.sort()
-        # calculate azimuthal gap
-        gaps = azims - np.roll(azims, 1)
-        gaps[0] += 360.0
-        gap = gaps.max()
-        i_ = gaps.argmax()
-        netstas = (azim_list[i_][1], azim_list[i_-1][1])
-        if origin.quality is None:
-            origin.quality = OriginQuality()
-        origin.quality.azimuthal_gap = gap
-        self.info("Azimuthal gap of %s between stations %s" % (gap, netstas))
-        # calculate secondary azimuthal gap
-        gaps = azims - np.roll(azims, 2)
-        gaps[0] += 360.0
-        gaps[1] += 360.0
-        gap = gaps.max()
-        i_ = gaps.argmax()
-        netstas = (azim_list[i_][1], azim_list[i_-2][1])
-        origin.quality.secondary_azimuthal_gap = gap
-        self.info(("Secondary azimuthal gap of "
-                   "%s between stations %s" % (gap, netstas)))
-
-    def removeDuplicatePicks(self):
-        """
-        Makes sure that any waveform_id/phase_hint combination is unique in
-        picks. Leave first occurence, remove all others and warn.
-
-        XXX should be called when fetching an event.
-        """
-        picks = self.catalog[0].picks
-        _ids = [p.waveform_id for p in picks]
-        _phase_hints = [p.phase_hint for p in picks]
-        msg = "For picks, any waveform_id / phase_hint combination must " + \
-              "be unique. Some non-unique picks were removed:"
-        for _id in _ids:
-            for _phase_hint in _phase_hints:
-                picks = [p for p in picks
-                         if p.phase_hint == _phase_hint
-                         and p.waveform_id == _id]
-                if len(picks) > 1:
-                    self.critical(msg)
-                    for p in picks[1:]:
-                        self.critical(str(p))
-                        self.catalog[0].picks.remove(p)
-
-    def setPick(self, pick):
-        """
-        Replace stored pick with given pick object.
-        """
-        picks = self.catalog[0].picks
-        old = self.getPick(waveform_id=pick.waveform_id, phase_hint=pick.phase_hint)
-        picks.remove(old)
-        picks.append(pick)
+        if axes is not None:
+            _i = self.axs.index(axes)
+            kwargs['seed_string'] = self.getCurrentStream()[_i].id
+        return ObsPyckCore.getAmplitude(self, **kwargs)
 
     def getEventFromSeisHub(self, resource_name):
         """
         Fetch a Resource XML from SeisHub
         """
-        client = self.event_server
-        resource_xml = client.event.get_resource(resource_name)
-
-        # parse quakeml
-        catalog = readQuakeML(StringIO(resource_xml))
+        # start fetching the next few events in the background, the current
+        # one is likely prefetched already
+        self._prefetch_events()
+        catalog = self.event_prefetch.pop(resource_name)
         self.setEventFromCatalog(catalog)
         ev = catalog[0]
         self.critical("Fetched event %i of %i: %s (public: %s, user: %s)"% \
@@ -4574,6 +3723,29 @@ class ObsPyck(QtGui.QMainWindow):
                resource_name, self.widgets.qCheckBox_public.isChecked(),
                ev.creation_info.author))
 
+    def _fetch_event_from_seishub(self, resource_name):
+        """
+        Download and parse a Resource XML from SeisHub. Used in background
+        threads, so no GUI elements may be used here.
+        """
+        client = self.event_server
+        resource_xml = client.event.get_resource(resource_name)
+        # parse quakeml
+        return readQuakeML(StringIO(resource_xml))
+
+    def _prefetch_events(self):
+        """
+        Start background prefetching of the current event and the next few
+        events in the event list.
+        """
+        count = min(self.seishub_prefetch + 1, self.seishubEventCount)
+        resource_names = []
+        for i in range(count):
+            index = (self.seishubEventCurrent + i) % self.seishubEventCount
+            event = self.seishubEventList[index]
+            resource_names.append(str(event.get('resource_name')))
+        self.event_prefetch.prefetch(resource_names)
+
     def setEventFromFilename(self, filename):
         """
         Set the currently active Event/Catalog from a filename of a QuakeML
@@ -4599,11 +3771,7 @@ class ObsPyck(QtGui.QMainWindow):
             self.error(msg)
             merge_events_in_catalog(self.catalog)
 
-        string_io = StringIO()
-        catalog.write(string_io, format="QUAKEML")
-        string_io.seek(0)
-
-        self.update_qml_text(string_io.read())
+        self._catalog_changed()
         ev = self.catalog[0]
 
         public = ev.get("extra", {}).get('public', {}).get('value', "false")
@@ -4674,6 +3842,8 @@ class ObsPyck(QtGui.QMainWindow):
         else:
             self.focMechCurrent = None
 
+        self.update_qml_text()
+
     def updateEventListFromSeisHub(self, starttime, endtime):
         """
         Searches for events in the database and stores a list of resource
@@ -4685,9 +3855,10 @@ class ObsPyck(QtGui.QMainWindow):
         """
         self.checkForSysopEventDuplicates(self.T0, self.T1)
 
-        events = self.event_server.event.get_list(min_last_pick=starttime,
-                                                  max_first_pick=endtime)
+        events = self._get_event_list(starttime, endtime)
         events.sort(key=lambda x: x['resource_name'])
+        # events might have changed on the server, so drop prefetched ones
+        self.event_prefetch.clear()
         self.seishubEventList = events
         self.seishubEventCount = len(events)
         # we set the current event-pointer to the last list element, because we
@@ -4702,6 +3873,29 @@ class ObsPyck(QtGui.QMainWindow):
                                                           public, author)
         self.critical(msg)
 
+    def _get_event_list(self, starttime, endtime):
+        """
+        Returns list of events on the event server with picks in between
+        start- and endtime. The server response is reused for a short time
+        (config option `event_list_cache_ttl`), the cache gets invalidated
+        after uploads/deletions and on explicit refresh of the event list.
+
+        :returns: list of dicts (a new list on every call, so it can be
+            sorted in place)
+        """
+        key = (starttime, endtime)
+        now = time.time()
+        cached = self._event_list_cache.get(key)
+        if cached is not None and now - cached[0] < self.event_list_cache_ttl:
+            return list(cached[1])
+        events = self.event_server.event.get_list(min_last_pick=starttime,
+                                                  max_first_pick=endtime)
+        self._event_list_cache[key] = (now, events)
+        return list(events)
+
+    def _invalidate_event_list(self):
+        self._event_list_cache = {}
+
     def checkForSysopEventDuplicates(self, starttime, endtime):
         """
         checks if there is more than one public event with picks in between
@@ -4711,8 +3905,7 @@ class ObsPyck(QtGui.QMainWindow):
         at the moment this check is conducted for the current timewindow when
         submitting a sysop event.
         """
-        events = self.event_server.event.get_list(min_last_pick=starttime,
-                                                  max_first_pick=endtime)
+        events = self._get_event_list(starttime, endtime)
         # XXX TODO: we don't have sysop as author anymore!
         # all controlled by public tag now.
         sysop_events = []
@@ -4800,9 +3993,16 @@ def main():
     """
     Gets executed when the program starts.
     """
+    # automatic processing without GUI
+    if sys.argv[1:2] == ["batch"]:
+        batch_main(sys.argv[2:],
+                   prog="%s batch" % os.path.basename(sys.argv[0]))
+        return
     usage = (
         "\n %prog -t 2010-08-01T12:00:00 -d 30 "
         "[local waveform or station metadata files]"
+        "\n %prog batch -t 2010-08-01T12:00:00 [-t ...] "
+        "[local waveform or station metadata files]"
         "\n\nGet all available options with: %prog -h")
     parser = optparse.OptionParser(usage)
     for opt_args, opt_kwargs in COMMANDLINE_OPTIONS:
@@ -4810,15 +4010,7 @@ def main():
     (options, args) = parser.parse_args()
 
     # read config file
-    if options.config_file:
-        config_file = os.path.expanduser(options.config_file)
-    else:
-        config_file = os.path.join(os.path.expanduser("~"), ".obspyckrc")
-        if not os.path.exists(config_file):
-            src = os.path.join(
-                os.path.dirname(__file__), "example.cfg")
-            shutil.copy(src, config_file)
-            print "created example config file: {}".format(config_file)
+    config_file, config = read_config(options.config_file)
 
     if options.time is None:
         msg = 'Time option ("-t", "--time") must be specified.'
@@ -4826,10 +4018,6 @@ def main():
     print "Running ObsPyck version {} (location: {})".format(__version__,
                                                              __file__)
     print "using config file: {}".format(config_file)
-    config = SafeConfigParser(allow_no_value=True)
-    # make all config keys case sensitive
-    config.optionxform = str
-    config.read(config_file)
 
     # set matplotlibrc changes specified in config (if any)
     set_matplotlib_defaults(config)
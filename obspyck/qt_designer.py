@@ -149,7 +149,25 @@ class Ui_qMainWindow_obsPyck(object):
         self.qComboBox_nllocModel.addItem(_fromUtf8(""))
         self.qComboBox_nllocModel.addItem(_fromUtf8(""))
         self.horizontalLayout_3.addWidget(self.qComboBox_nllocModel)
+        self.qToolButton_doNllocAllModels = QtGui.QToolButton(self.layoutWidgetxx)
+        sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.qToolButton_doNllocAllModels.sizePolicy().hasHeightForWidth())
+        self.qToolButton_doNllocAllModels.setSizePolicy(sizePolicy)
+        self.qToolButton_doNllocAllModels.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.qToolButton_doNllocAllModels.setObjectName(_fromUtf8("qToolButton_doNllocAllModels"))
+        self.horizontalLayout_3.addWidget(self.qToolButton_doNllocAllModels)
         self.leftVerticalLayout.addLayout(self.horizontalLayout_3)
+        self.qToolButton_resampleLocation = QtGui.QToolButton(self.layoutWidgetxx)
+        sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Minimum)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.qToolButton_resampleLocation.sizePolicy().hasHeightForWidth())
+        self.qToolButton_resampleLocation.setSizePolicy(sizePolicy)
+        self.qToolButton_resampleLocation.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.qToolButton_resampleLocation.setObjectName(_fromUtf8("qToolButton_resampleLocation"))
+        self.leftVerticalLayout.addWidget(self.qToolButton_resampleLocation)
         self.qToolButton_doFocMec = QtGui.QToolButton(self.layoutWidgetxx)
         sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Minimum)
         sizePolicy.setHorizontalStretch(0)
@@ -626,6 +644,15 @@ class Ui_qMainWindow_obsPyck(object):
         self.qToolButton_arpicker.setArrowType(QtCore.Qt.NoArrow)
         self.qToolButton_arpicker.setObjectName(_fromUtf8("qToolButton_arpicker"))
         self.horizontalLayout_15.addWidget(self.qToolButton_arpicker)
+        self.qToolButton_coincidence = QtGui.QToolButton(self.xxx)
+        sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.qToolButton_coincidence.sizePolicy().hasHeightForWidth())
+        self.qToolButton_coincidence.setSizePolicy(sizePolicy)
+        self.qToolButton_coincidence.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.qToolButton_coincidence.setObjectName(_fromUtf8("qToolButton_coincidence"))
+        self.horizontalLayout_15.addWidget(self.qToolButton_coincidence)
         self.verticalLayout_8.addLayout(self.horizontalLayout_15)
         self.horizontalLayout_12.addLayout(self.verticalLayout_8)
         spacerItem5 = QtGui.QSpacerItem(1, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
@@ -787,24 +814,24 @@ class Ui_qMainWindow_obsPyck(object):
         self.rightVerticalLayout.setSizeConstraint(QtGui.QLayout.SetDefaultConstraint)
         self.rightVerticalLayout.setSpacing(0)
         self.rightVerticalLayout.setObjectName(_fromUtf8("rightVerticalLayout"))
-        self.qTextEdit_qml = QtGui.QTextEdit(self.verticalLayoutWidget)
-        self.qTextEdit_qml.setEnabled(True)
+        self.qPlainTextEdit_qml = QtGui.QPlainTextEdit(self.verticalLayoutWidget)
+        self.qPlainTextEdit_qml.setEnabled(True)
         sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Expanding)
         sizePolicy.setHorizontalStretch(0)
         sizePolicy.setVerticalStretch(0)
-        sizePolicy.setHeightForWidth(self.qTextEdit_qml.sizePolicy().hasHeightForWidth())
-        self.qTextEdit_qml.setSizePolicy(sizePolicy)
-        self.qTextEdit_qml.setMaximumSize(QtCore.QSize(16777215, 16777215))
+        sizePolicy.setHeightForWidth(self.qPlainTextEdit_qml.sizePolicy().hasHeightForWidth())
+        self.qPlainTextEdit_qml.setSizePolicy(sizePolicy)
+        self.qPlainTextEdit_qml.setMaximumSize(QtCore.QSize(16777215, 16777215))
         font = QtGui.QFont()
         font.setFamily(_fromUtf8("Monospace"))
         font.setPointSize(10)
-        self.qTextEdit_qml.setFont(font)
-        self.qTextEdit_qml.setFocusPolicy(QtCore.Qt.NoFocus)
-        self.qTextEdit_qml.setAcceptDrops(False)
-        self.qTextEdit_qml.setLineWrapMode(QtGui.QTextEdit.NoWrap)
-        self.qTextEdit_qml.setReadOnly(True)
-        self.qTextEdit_qml.setObjectName(_fromUtf8("qTextEdit_qml"))
-        self.rightVerticalLayout.addWidget(self.qTextEdit_qml)
+        self.qPlainTextEdit_qml.setFont(font)
+        self.qPlainTextEdit_qml.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.qPlainTextEdit_qml.setAcceptDrops(False)
+        self.qPlainTextEdit_qml.setLineWrapMode(QtGui.QPlainTextEdit.NoWrap)
+        self.qPlainTextEdit_qml.setReadOnly(True)
+        self.qPlainTextEdit_qml.setObjectName(_fromUtf8("qPlainTextEdit_qml"))
+        self.rightVerticalLayout.addWidget(self.qPlainTextEdit_qml)
         self.qPushButton_qml_update = QtGui.QPushButton(self.verticalLayoutWidget)
         self.qPushButton_qml_update.setFocusPolicy(QtCore.Qt.NoFocus)
         self.qPushButton_qml_update.setObjectName(_fromUtf8("qPushButton_qml_update"))
@@ -880,6 +907,10 @@ class Ui_qMainWindow_obsPyck(object):
         self.qComboBox_nllocModel.setItemText(0, _translate("qMainWindow_obsPyck", "BY", None))
         self.qComboBox_nllocModel.setItemText(1, _translate("qMainWindow_obsPyck", "RH", None))
         self.qComboBox_nllocModel.setItemText(2, _translate("qMainWindow_obsPyck", "UH", None))
+        self.qToolButton_doNllocAllModels.setToolTip(_translate("qMainWindow_obsPyck", "run NLLoc with all velocity models and compare results", None))
+        self.qToolButton_doNllocAllModels.setText(_translate("qMainWindow_obsPyck", "all", None))
+        self.qToolButton_resampleLocation.setToolTip(_translate("qMainWindow_obsPyck", "estimate location uncertainty by relocating with resampled stations (jackknife/bootstrap)", None))
+        self.qToolButton_resampleLocation.setText(_translate("qMainWindow_obsPyck", "resample loc.", None))
         self.qToolButton_doFocMec.setText(_translate("qMainWindow_obsPyck", "do focmec", None))
         self.qToolButton_showMap.setText(_translate("qMainWindow_obsPyck", "show Map", None))
         self.qToolButton_showFocMec.setText(_translate("qMainWindow_obsPyck", "show FocMec", None))
@@ -961,6 +992,8 @@ class Ui_qMainWindow_obsPyck(object):
         self.qToolButton_rotateZRT.setText(_translate("qMainWindow_obsPyck", "ZRT", None))
         self.qToolButton_trigger.setText(_translate("qMainWindow_obsPyck", "recSTALTA", None))
         self.qToolButton_arpicker.setText(_translate("qMainWindow_obsPyck", "arPicker", None))
+        self.qToolButton_coincidence.setToolTip(_translate("qMainWindow_obsPyck", "network coincidence trigger (recSTALTA on all stations), jump to a triggered time window", None))
+        self.qToolButton_coincidence.setText(_translate("qMainWindow_obsPyck", "coincidence", None))
         self.qLabel_sta.setText(_translate("qMainWindow_obsPyck", "STA", None))
         self.qLabel_lta.setText(_translate("qMainWindow_obsPyck", "LTA", None))
         self.qComboBox_filterType.setItemText(0, _translate("qMainWindow_obsPyck", "Bandpass", None))
@@ -978,4 +1011,4 @@ class Ui_qMainWindow_obsPyck(object):
         self.qLabel_perlap.setText(_translate("qMainWindow_obsPyck", "%lap", None))
         self.qPushButton_qml_update.setText(_translate("qMainWindow_obsPyck", "update QuakeML text", None))
 
-from util import QMplCanvas
+from qt_widgets import QMplCanvas
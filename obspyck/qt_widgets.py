@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------
+# Filename: qt_widgets.py
+#  Purpose: Custom Qt widgets used in the GUI
+#   Author: Tobias Megies, Lion Krischer
+#    Email: megies@geophysik.uni-muenchen.de
+#  License: GPLv2
+#
+# Copyright (C) 2010 Tobias Megies, Lion Krischer
+# -------------------------------------------------------------------
+"""
+Custom Qt widgets used in the GUI (see ``qt_designer.ui``).
+
+Kept separate from :mod:`obspyck.util` so that everything but the GUI can be
+used without Qt.
+"""
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as QFigureCanvas
+
+
+class QMplCanvas(QFigureCanvas):
+    """
+    Class to represent the FigureCanvas widget.
+    """
+    def __init__(self, parent=None):
+        # Standard Matplotlib code to generate the plot
+        self.fig = Figure()
+        # initialize the canvas where the Figure renders into
+        QFigureCanvas.__init__(self, self.fig)
+        self.setParent(parent)
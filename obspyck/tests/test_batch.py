@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import glob
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from obspy import read, read_events, read_inventory
+
+from obspyck.batch import (
+    main, process_event, CHECKPOINT_FILENAME, BATCH_COMMANDLINE_OPTIONS,
+    COMMANDLINE_OPTIONS)
+from obspyck.util import read_config, PROGRAMS
+
+
+EXAMPLE_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              os.pardir, "example.cfg")
+# time of obspy example waveforms (see obspy.read())
+EVENT_TIME = "2009-08-24T00:20:03"
+
+
+class BatchTestCase(unittest.TestCase):
+    """
+    Batch processing of obspy's example waveforms and metadata from local
+    files, without locating events (no external programs needed).
+    """
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="obspyck-test-")
+        pluginpath = os.path.join(self.tmp_dir, "plugins")
+        for name in PROGRAMS:
+            os.makedirs(os.path.join(pluginpath, name))
+        _, config = read_config(EXAMPLE_CONFIG)
+        config.set("base", "pluginpath", pluginpath)
+        config.set("batch", "locator", "")
+        self.config_file = os.path.join(self.tmp_dir, "obspyck.cfg")
+        with open(self.config_file, "wt") as fh:
+            config.write(fh)
+        self.files = [os.path.join(self.tmp_dir, "waveforms.mseed"),
+                      os.path.join(self.tmp_dir, "inventory.xml")]
+        read().write(self.files[0], format="MSEED")
+        read_inventory().write(self.files[1], format="STATIONXML")
+        self.output_dir = os.path.join(self.tmp_dir, "output")
+        self._stdout, self._stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO(), StringIO()
+
+    def tearDown(self):
+        sys.stdout, sys.stderr = self._stdout, self._stderr
+        shutil.rmtree(self.tmp_dir)
+
+    def _main(self, times):
+        argv = ["-c", self.config_file, "--output-dir", self.output_dir,
+                "-j", "1", "-o", "0", "-d", "30"]
+        for time in times:
+            argv += ["-t", time]
+        main(argv + self.files)
+
+    def test_process_event(self):
+        parser = optparse.OptionParser()
+        for opt_args, opt_kwargs in COMMANDLINE_OPTIONS:
+            if "--time" in opt_args or "--event" in opt_args:
+                continue
+            parser.add_option(*opt_args, **opt_kwargs)
+        for opt_args, opt_kwargs in BATCH_COMMANDLINE_OPTIONS:
+            parser.add_option(*opt_args, **opt_kwargs)
+        options, args = parser.parse_args(
+            ["-c", self.config_file, "--output-dir", self.tmp_dir, "-j", "1",
+             "-o", "0", "-d", "30"] + self.files)
+        _, config = read_config(self.config_file)
+        filename, located = process_event(EVENT_TIME, options, args, config)
+        self.assertFalse(located)
+        event = read_events(filename)[0]
+        self.assertFalse(event.origins)
+        self.assertEqual(
+            sorted(set(p.waveform_id.station_code for p in event.picks)),
+            ["RJOB"])
+        self.assertTrue(set(p.phase_hint for p in event.picks) <=
+                        set(["P", "S"]))
+        # amplitudes on both horizontal components
+        self.assertEqual(
+            sorted(a.waveform_id.channel_code for a in event.amplitudes),
+            ["EHE", "EHN"])
+        for amplitude in event.amplitudes:
+            self.assertGreater(amplitude.generic_amplitude, 0)
+
+    def test_main_skips_processed_events(self):
+        os.makedirs(self.output_dir)
+        checkpoint_file = os.path.join(self.output_dir, CHECKPOINT_FILENAME)
+        with open(checkpoint_file, "wt") as fh:
+            fh.write("2009-08-24T00:20:00.000000Z\n")
+        self._main(["2009-08-24T00:20:00", EVENT_TIME])
+        self.assertIn("skipping 1 already processed events",
+                      sys.stdout.getvalue())
+        # only the new event got processed and recorded
+        self.assertEqual(
+            len(glob.glob(os.path.join(self.output_dir, "*.xml"))), 1)
+        with open(checkpoint_file, "rt") as fh:
+            self.assertEqual(fh.read().split(),
+                             ["2009-08-24T00:20:00.000000Z",
+                              "2009-08-24T00:20:03.000000Z"])
+        # nothing left to do when running again
+        self._main(["2009-08-24T00:20:00", EVENT_TIME])
+        self.assertEqual(
+            len(glob.glob(os.path.join(self.output_dir, "*.xml"))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
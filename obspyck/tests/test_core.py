@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import optparse
+import os
+import unittest
+
+import numpy as np
+
+from obspyck.core import ObsPyckCore
+from obspyck.event_helper import Origin, StationMagnitude, WaveformStreamID
+from obspyck.util import read_config, COMMANDLINE_OPTIONS
+
+
+EXAMPLE_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              os.pardir, "example.cfg")
+
+
+class NetworkMagnitudeTestCase(unittest.TestCase):
+    def setUp(self):
+        parser = optparse.OptionParser()
+        for opt_args, opt_kwargs in COMMANDLINE_OPTIONS:
+            parser.add_option(*opt_args, **opt_kwargs)
+        options, _ = parser.parse_args(["-t", "2009-08-24T00:20:03"])
+        _, config = read_config(EXAMPLE_CONFIG)
+        config.set("base", "verbosity", "quiet")
+        self.core = ObsPyckCore({}, [], options, config)
+        self.event = self.core.catalog[0]
+        self.origin = Origin()
+        self.event.origins = [self.origin]
+
+    def _add_station_magnitudes(self, mags):
+        sms = []
+        for i, mag in enumerate(mags):
+            sm = StationMagnitude()
+            sm.origin_id = self.origin.resource_id
+            sm.waveform_id = WaveformStreamID(
+                network_code="XX", station_code="S%02i" % i)
+            sm.mag = mag
+            sms.append(sm)
+        self.event.station_magnitudes.extend(sms)
+        return sms
+
+    def _check(self, mags):
+        m, = self.event.magnitudes
+        self.assertAlmostEqual(m.mag, np.mean(mags))
+        self.assertAlmostEqual(m.mag_errors.uncertainty, np.std(mags))
+        self.assertEqual(m.station_count, len(mags))
+        self.assertEqual(len(m.station_magnitude_contributions), len(mags))
+        for contrib in m.station_magnitude_contributions:
+            self.assertEqual(contrib.weight, 1.0 / len(mags))
+        return m
+
+    def test_incremental_update(self):
+        sms = self._add_station_magnitudes([1.2, 1.5, 0.9, 1.1])
+        self.core.updateNetworkMag()
+        m = self._check([1.2, 1.5, 0.9, 1.1])
+        contribs = list(m.station_magnitude_contributions)
+        # deselecting keeps magnitude and the other contributions
+        sms[1].used = False
+        self.core.updateNetworkMag()
+        self.assertIs(self._check([1.2, 0.9, 1.1]), m)
+        self.assertEqual(m.station_magnitude_contributions,
+                         [contribs[0], contribs[2], contribs[3]])
+        self.assertIs(m.station_magnitude_contributions[0], contribs[0])
+        # recalculated and added station magnitudes
+        sms[2].mag = 1.3
+        self._add_station_magnitudes([1.0])
+        self.core.updateNetworkMag()
+        self.assertIs(self._check([1.2, 1.3, 1.1, 1.0]), m)
+        for sm in sms:
+            sm.used = False
+        self.core.updateNetworkMag()
+        self.assertIs(self._check([1.0]), m)
+        self.assertEqual(m.mag_errors.uncertainty, 0.0)
+
+    def test_precision(self):
+        # running sum of squares would lose all digits of the spread here
+        mags = [1e8 + x for x in (0.1, 0.2, 0.3, 0.4)]
+        sms = self._add_station_magnitudes(mags)
+        self.core.updateNetworkMag()
+        sms[0].used = False
+        self.core.updateNetworkMag()
+        m, = self.event.magnitudes
+        self.assertAlmostEqual(m.mag_errors.uncertainty, np.std(mags[1:]),
+                               places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
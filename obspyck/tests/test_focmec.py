@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+
+from obspyck.focmec import radiation_pattern, grid_search
+
+
+def moment_tensor(strike, dip, rake):
+    """
+    Moment tensor of a double couple (Aki & Richards, box 4.4, x north, y
+    east, z down).
+    """
+    s, d, r = np.radians([strike, dip, rake])
+    m = np.empty((3, 3))
+    m[0, 0] = -(np.sin(d) * np.cos(r) * np.sin(2 * s) +
+                np.sin(2 * d) * np.sin(r) * np.sin(s) ** 2)
+    m[0, 1] = (np.sin(d) * np.cos(r) * np.cos(2 * s) +
+               0.5 * np.sin(2 * d) * np.sin(r) * np.sin(2 * s))
+    m[0, 2] = -(np.cos(d) * np.cos(r) * np.cos(s) +
+                np.cos(2 * d) * np.sin(r) * np.sin(s))
+    m[1, 1] = (np.sin(d) * np.cos(r) * np.sin(2 * s) -
+               np.sin(2 * d) * np.sin(r) * np.cos(s) ** 2)
+    m[1, 2] = -(np.cos(d) * np.cos(r) * np.sin(s) -
+                np.cos(2 * d) * np.sin(r) * np.cos(s))
+    m[2, 2] = np.sin(2 * d) * np.sin(r)
+    m[1, 0] = m[0, 1]
+    m[2, 0] = m[0, 2]
+    m[2, 1] = m[1, 2]
+    return m
+
+
+class FocmecTestCase(unittest.TestCase):
+    def setUp(self):
+        azimuths, takeoffs = np.meshgrid(np.arange(0, 360, 15.0),
+                                         np.arange(0, 181, 10.0))
+        self.azimuths = azimuths.ravel()
+        self.takeoffs = takeoffs.ravel()
+
+    def test_radiation_pattern_against_moment_tensor(self):
+        """
+        P, SV and SH amplitudes have to match far field radiation of the
+        moment tensor, projected on ray direction and directions of
+        increasing takeoff angle and clockwise azimuth.
+        """
+        az = np.radians(self.azimuths)
+        inc = np.radians(self.takeoffs)
+        ray = np.array([np.sin(inc) * np.cos(az), np.sin(inc) * np.sin(az),
+                        np.cos(inc)])
+        sv_direction = np.array([np.cos(inc) * np.cos(az),
+                                 np.cos(inc) * np.sin(az), -np.sin(inc)])
+        sh_direction = np.array([-np.sin(az), np.cos(az),
+                                 np.zeros_like(az)])
+        for strike, dip, rake in [(30, 60, 90), (123, 37, -45),
+                                  (300, 80, 170), (10, 20, 5),
+                                  (200, 45, -100)]:
+            m = moment_tensor(strike, dip, rake)
+            got = radiation_pattern(strike, dip, rake, self.azimuths,
+                                    self.takeoffs)
+            for direction, amplitudes in zip(
+                    (ray, sv_direction, sh_direction), got):
+                expected = np.einsum("in,ij,jn->n", direction, m, ray)
+                np.testing.assert_allclose(amplitudes, expected, rtol=0,
+                                           atol=1e-12)
+
+    def test_grid_search_finds_source(self):
+        """
+        Grid search on P polarities of a moment tensor source has to find
+        one of the two nodal planes of the source.
+        """
+        # no observations on the vertical axis (azimuth undefined)
+        valid = (self.takeoffs > 0) & (self.takeoffs < 180)
+        takeoffs = self.takeoffs[valid]
+        azimuths = self.azimuths[valid]
+        az = np.radians(azimuths)
+        inc = np.radians(takeoffs)
+        ray = np.array([np.sin(inc) * np.cos(az), np.sin(inc) * np.sin(az),
+                        np.cos(inc)])
+        p = np.einsum("in,ij,jn->n", ray, moment_tensor(30, 60, 90), ray)
+        polarities = ["U" if amplitude > 0 else "D" for amplitude in p]
+        solutions = grid_search(azimuths, takeoffs, polarities)
+        self.assertTrue(solutions)
+        dip, strike, rake, p_errors, sv_errors, sh_errors = solutions[0]
+        self.assertEqual((p_errors, sv_errors, sh_errors), (0, 0, 0))
+        planes = [(30, 60, 90), (210, 30, 90)]
+        self.assertTrue(any(
+            abs((strike - strike_ + 180) % 360 - 180) <= 10 and
+            abs(dip - dip_) <= 10 and abs(rake - rake_) <= 10
+            for strike_, dip_, rake_ in planes), solutions[0])
+
+    def test_grid_search_inconsistent_polarities(self):
+        """
+        With some wrong polarities there is no solution without errors, the
+        solutions with fewest errors have to be found anyway (like the focmec
+        wrapper script does).
+        """
+        rng = np.random.RandomState(42)
+        azimuths = rng.uniform(0, 360, 30)
+        takeoffs = rng.uniform(10, 170, 30)
+        az = np.radians(azimuths)
+        inc = np.radians(takeoffs)
+        ray = np.array([np.sin(inc) * np.cos(az), np.sin(inc) * np.sin(az),
+                        np.cos(inc)])
+        p = np.einsum("in,ij,jn->n", ray, moment_tensor(30, 60, 90), ray)
+        polarities = ["U" if amplitude > 0 else "D" for amplitude in p]
+        for i in (0, 7, 15, 22):
+            polarities[i] = {"U": "D", "D": "U"}[polarities[i]]
+        solutions = grid_search(azimuths, takeoffs, polarities)
+        self.assertTrue(solutions)
+        errors = [sum(solution[3:]) for solution in solutions]
+        self.assertTrue(0 < errors[0] <= 4)
+        self.assertEqual(max(errors), errors[0])
+        # more errors allowed on top of the fewest errors found
+        solutions2 = grid_search(azimuths, takeoffs, polarities, max_errors=1,
+                                 max_solutions=None)
+        errors2 = [sum(solution[3:]) for solution in solutions2]
+        self.assertEqual(min(errors2), errors[0])
+        self.assertEqual(max(errors2), errors[0] + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
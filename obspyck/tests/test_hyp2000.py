@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+from StringIO import StringIO
+
+from obspy import UTCDateTime
+
+from obspyck.hyp2000 import read_hyp2000_prt, Hyp2000Arrival
+
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+class Hyp2000TestCase(unittest.TestCase):
+    def test_read_hyp2000_prt(self):
+        locations = read_hyp2000_prt(os.path.join(DATA, "hypo.prt"))
+        self.assertEqual(len(locations), 1)
+        location = locations[0]
+        self.assertTrue(location.is_complete())
+        self.assertEqual(location.time,
+                         UTCDateTime(2009, 8, 24, 0, 20, 4.44))
+        self.assertAlmostEqual(location.latitude, 48 + 5.6 / 60)
+        self.assertAlmostEqual(location.longitude, 11 + 38.86 / 60)
+        self.assertEqual(location.depth, 8.41)
+        self.assertEqual(location.rms, 0.06)
+        self.assertEqual(location.error_horizontal, 0.57)
+        self.assertEqual(location.error_depth, 1.09)
+        self.assertEqual(location.gap, 156)
+        self.assertEqual(location.model, "BAYERN")
+        self.assertEqual(location.arrivals, [
+            Hyp2000Arrival("RJOB", "I", "P", "U", 14.0, 247, 113, 0.03, 1.0),
+            # S phases get station information of the preceding line
+            Hyp2000Arrival("RJOB", "E", "S", " ", 14.0, 247, 113, -0.05,
+                           0.5),
+            Hyp2000Arrival("FUR", "I", "P", "D", 37.6, 12, 100, 0.1, 1.0),
+            Hyp2000Arrival("WET", "E", "P", " ", 98.2, 48, 95, -0.08, 0.25),
+            Hyp2000Arrival("WET", "E", "S", " ", 98.2, 48, 95, 0.06, 0.25),
+            Hyp2000Arrival("MANZ", "I", "P", "U", 52.9, 311, 98, 0.0, 1.0),
+            Hyp2000Arrival("MANZ", "E", "S", " ", 52.9, 311, 98, -0.02,
+                           0.5)])
+
+    def test_southern_western_hemisphere(self):
+        with open(os.path.join(DATA, "hypo.prt"), "rt") as fh:
+            lines = fh.readlines()
+        lines[2] = lines[2][:27] + "S" + lines[2][28:38] + "W" + \
+            lines[2][39:]
+        # incomplete output, e.g. of a failed location
+        location, = read_hyp2000_prt(StringIO("".join(lines[:4])))
+        self.assertFalse(location.is_complete())
+        self.assertAlmostEqual(location.latitude, -(48 + 5.6 / 60))
+        self.assertAlmostEqual(location.longitude, -(11 + 38.86 / 60))
+        self.assertIsNone(location.gap)
+        self.assertEqual(location.arrivals, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+
+# modules that are only imported when first used
+LAZY_MODULES = ("matplotlib.pyplot", "obspy.clients", "obspy.signal.trigger")
+# time importing a module may take on top of importing obspy, relative to the
+# time a bare "import obspy" takes. can be scaled with environment variable
+# OBSPYCK_IMPORT_TIME_BUDGET (e.g. "2" on slow machines)
+IMPORT_TIME_BUDGETS = {"obspyck.core": 1.0, "obspyck.obspyck": 3.0}
+IMPORT_TIME_RUNS = 3
+
+
+def _has_module(name):
+    try:
+        __import__(name)
+    except ImportError:
+        return False
+    return True
+
+
+class ImportTestCase(unittest.TestCase):
+    def test_lazy_imports(self):
+        """
+        Importing the core (e.g. for batch processing) must not import
+        plotting, clients or triggering. Checked in a fresh interpreter, as
+        other tests might have imported these already.
+        """
+        code = ("import json, sys; import obspyck.core; "
+                "print(json.dumps(sorted(sys.modules)))")
+        output = subprocess.check_output([sys.executable, "-c", code])
+        modules = json.loads(output.decode().splitlines()[-1])
+        imported = [name for name in modules
+                    if any(name == lazy or name.startswith(lazy + ".")
+                           for lazy in LAZY_MODULES)]
+        self.assertEqual(imported, [])
+
+    def _check_import_time(self, module):
+        """
+        Times the import of module in fresh interpreters (best of a few runs)
+        against its budget (see :const:`IMPORT_TIME_BUDGETS`).
+        """
+        code = ("import time; t0 = time.time(); import obspy; "
+                "t1 = time.time(); import %s; t2 = time.time(); "
+                "print('%%f %%f' %% (t1 - t0, t2 - t1))" % module)
+        times = []
+        for _ in range(IMPORT_TIME_RUNS):
+            output = subprocess.check_output([sys.executable, "-c", code])
+            times.append([float(x)
+                          for x in output.decode().splitlines()[-1].split()])
+        baseline, duration = [min(x) for x in zip(*times)]
+        budget = IMPORT_TIME_BUDGETS[module] * baseline * float(
+            os.environ.get("OBSPYCK_IMPORT_TIME_BUDGET", 1))
+        msg = ("Importing %s takes %.3fs on top of obspy (%.3fs), budget is "
+               "%.3fs" % (module, duration, baseline, budget))
+        self.assertLessEqual(duration, budget, msg)
+
+    def test_core_import_time(self):
+        self._check_import_time("obspyck.core")
+
+    @unittest.skipIf(not _has_module("PyQt4"), "PyQt4 not available")
+    def test_gui_import_time(self):
+        self._check_import_time("obspyck.obspyck")
+
+
+if __name__ == '__main__':
+    unittest.main()
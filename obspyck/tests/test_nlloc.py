@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+from StringIO import StringIO
+
+from obspy import UTCDateTime
+
+from obspyck.nlloc import read_nlloc_hyp, read_nlloc_model
+
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+class NLLocTestCase(unittest.TestCase):
+    def test_read_nlloc_hyp(self):
+        hypocenters = read_nlloc_hyp(os.path.join(DATA, "nlloc.hyp"))
+        self.assertEqual(len(hypocenters), 1)
+        hypo = hypocenters[0]
+        self.assertTrue(hypo.is_complete())
+        self.assertEqual(hypo.status, "LOCATED")
+        self.assertEqual(hypo.signature,
+                         "Megies LMU Munich   obs:./nlloc.obs")
+        self.assertEqual(hypo.nlloc_version, "NLLoc:v6.04.02(06Nov2015)")
+        self.assertEqual(hypo.creation_time,
+                         UTCDateTime(2017, 5, 9, 11, 0, 22))
+        self.assertEqual((hypo.x, hypo.y, hypo.z),
+                         (4424.68, 5307.38, 5.5083))
+        self.assertEqual(hypo.time,
+                         UTCDateTime(2017, 3, 19, 20, 18, 31.898898))
+        self.assertEqual(hypo.rms, 0.232166)
+        self.assertEqual(hypo.gap, 112.376)
+        self.assertEqual(hypo.ellipsoid, (166.03, -12.0015, 0.463619,
+                                          250.465, 24.518, 0.577556,
+                                          1.750868))
+        self.assertEqual(
+            [(p.station, p.phase) for p in hypo.phases],
+            [("FUR", "P"), ("FUR", "S"), ("RETA", "P"), ("RETA", "S"),
+             ("MOTA", "P"), ("MOTA", "S"), ("WATA", "P"), ("WATA", "S")])
+        phase = hypo.phases[2]
+        self.assertEqual(phase.instrument, "?")
+        self.assertEqual(phase.component, "?")
+        self.assertEqual(phase.onset, "?")
+        self.assertEqual(phase.polarity, "?")
+        self.assertEqual(phase.predicted_travel_time, 9.3054)
+        self.assertEqual(phase.residual, -1.0459)
+        self.assertEqual(phase.weight, 0.0826)
+        self.assertEqual(phase.epicentral_distance, 49.0401)
+        self.assertEqual(phase.station_azimuth, 201.34)
+        self.assertEqual(phase.ray_azimuth, 201.6)
+        self.assertEqual(phase.ray_dip, 59.9)
+
+    def test_read_nlloc_hyp_file_object(self):
+        with open(os.path.join(DATA, "nlloc.hyp"), "rt") as fh:
+            lines = fh.readlines()
+        # incomplete output, e.g. of a failed location
+        hypo, = read_nlloc_hyp(StringIO("".join(lines[:7])))
+        self.assertFalse(hypo.is_complete())
+        self.assertEqual(hypo.time,
+                         UTCDateTime(2017, 3, 19, 20, 18, 31.898898))
+        self.assertIsNone(hypo.ellipsoid)
+        self.assertEqual(hypo.phases, [])
+
+    def test_read_nlloc_model(self):
+        self.assertEqual(read_nlloc_model(os.path.join(DATA, "last.in")),
+                         "BY")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+import os
+import platform
+import shutil
+import socket
+import tempfile
+import unittest
+from ConfigParser import SafeConfigParser
+
+import numpy as np
+from obspy import UTCDateTime
+from obspy.geodetics import degrees2kilometers
+
+from obspyck.util import (
+    _setup_program_dir, BackgroundJobQueue, HTTPStatusError,
+    is_transient_error, resample_stations, resampled_location_errors,
+    setup_external_programs, DiskCache, PROGRAMS)
+
+
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, os.pardir, "plugin_dir")
+
+
+class SetupProgramDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="obspyck-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @unittest.skipIf(not hasattr(os, "symlink"), "no symlinks on platform")
+    def test_dangling_links_in_plugin_dir(self):
+        """
+        Links to binaries that are not installed (yet) in the shipped plugin
+        dir are dangling and have to be recreated as they are.
+        """
+        srcdir = os.path.join(PLUGIN_DIR, "focmec")
+        if not os.path.isdir(srcdir):
+            self.skipTest("plugin_dir not available")
+        dangling = [name for name in os.listdir(srcdir)
+                    if not os.path.exists(os.path.join(srcdir, name))]
+        self.assertTrue(dangling)
+        prog_dir = os.path.join(self.tmp_dir, "focmec")
+        _setup_program_dir(srcdir, prog_dir, ["focmec.dat"])
+        self.assertEqual(sorted(os.listdir(srcdir)),
+                         sorted(os.listdir(prog_dir)))
+        for name in dangling:
+            dst = os.path.join(prog_dir, name)
+            self.assertTrue(os.path.islink(dst))
+            self.assertEqual(os.readlink(dst),
+                             os.readlink(os.path.join(srcdir, name)))
+
+    @unittest.skipIf(not hasattr(os, "symlink"), "no symlinks on platform")
+    def test_links_copies_and_outputs(self):
+        srcdir = os.path.join(self.tmp_dir, "src")
+        os.mkdir(srcdir)
+        with open(os.path.join(srcdir, "model.txt"), "w") as fh:
+            fh.write("small input file")
+        with open(os.path.join(srcdir, "prog.out"), "w") as fh:
+            fh.write("old output")
+        os.symlink("missing_binary", os.path.join(srcdir, "prog"))
+        os.symlink("model.txt", os.path.join(srcdir, "model2.txt"))
+        prog_dir = os.path.join(self.tmp_dir, "prog")
+        _setup_program_dir(srcdir, prog_dir, ["*.out"])
+        self.assertEqual(sorted(os.listdir(prog_dir)),
+                         ["model.txt", "model2.txt", "prog"])
+        # small files are copied, links stay relative links
+        self.assertFalse(os.path.islink(os.path.join(prog_dir, "model.txt")))
+        self.assertEqual(os.readlink(os.path.join(prog_dir, "model2.txt")),
+                         "model.txt")
+        self.assertEqual(os.readlink(os.path.join(prog_dir, "prog")),
+                         "missing_binary")
+
+
+class FocmecProgramTestCase(unittest.TestCase):
+    # stands in for the focmec binary: echoes stdin and writes the output
+    # file named in the first line of stdin
+    FAKE_FOCMEC = "\n".join([
+        "#!/bin/sh",
+        "cat > focmec.stdin.used",
+        "out=`head -n 1 focmec.stdin.used`",
+        "echo 'Dip Strike Rake Pol:P Pol:SV Pol:SH' > $out",
+        "echo '  40.00  120.00  -90.00   1.00   0.00   0.00' >> $out",
+        "echo '    nan  120.00  -90.00   1.00   0.00   0.00' >> $out",
+        ""])
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="obspyck-test-")
+        self.prog_tmp_dir = None
+        for name in PROGRAMS:
+            os.makedirs(os.path.join(self.tmp_dir, name))
+        srcdir = os.path.join(self.tmp_dir, "focmec")
+        with open(os.path.join(srcdir, "focmec.P_SH.stdin"), "wt") as fh:
+            fh.write("focmec.out.all\nXXX errors max\nfocmec.dat\n"
+                     "XXX\ttotal number of errors (integer)..\n")
+        exe = os.path.join(srcdir, "focmec__%s__%s" % (
+            platform.system(), platform.architecture()[0]))
+        with open(exe, "wt") as fh:
+            fh.write(self.FAKE_FOCMEC)
+        os.chmod(exe, 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        if self.prog_tmp_dir is not None:
+            shutil.rmtree(self.prog_tmp_dir)
+
+    @unittest.skipIf(platform.system() == "Windows", "needs a shell script")
+    def test_errors_in_stdin_template_and_solutions(self):
+        config = SafeConfigParser()
+        config.add_section("base")
+        config.set("base", "pluginpath", self.tmp_dir)
+        self.prog_tmp_dir = setup_external_programs(None, config)
+        prog_dict = PROGRAMS['focmec']
+        run = prog_dict['Start'](prog_dict, "P+SH", 3)
+        run.wait()
+        self.assertEqual(run.returncode, 0)
+        prog_dict['PostCall'](prog_dict)
+        with open(os.path.join(prog_dict['dir'], "focmec.stdin.used")) as fh:
+            self.assertEqual(fh.read(), "focmec.out.all\n3 errors max\n"
+                             "focmec.dat\n3\ttotal number of errors "
+                             "(integer)..\n")
+        with open(prog_dict['files']['summary']) as fh:
+            self.assertEqual(
+                fh.read(), "  40.00  120.00  -90.00   1.00   0.00   0.00\n")
+
+
+class BackgroundJobQueueTestCase(unittest.TestCase):
+    def _run(self, error):
+        attempts = []
+
+        def job():
+            attempts.append(1)
+            raise error
+
+        queue = BackgroundJobQueue(retries=2, backoff=0.001,
+                                   retry_if=is_transient_error)
+        queue.submit("job", job)
+        queue.join()
+        (_, _, result, error_), = queue.poll()
+        self.assertIs(error_, error)
+        return len(attempts)
+
+    def test_retry_transient_errors_only(self):
+        self.assertEqual(self._run(HTTPStatusError("server error", 503)), 3)
+        self.assertEqual(self._run(socket.timeout("timed out")), 3)
+        self.assertEqual(self._run(HTTPStatusError("unauthorized", 401)), 1)
+        self.assertEqual(self._run(HTTPStatusError("not found", 404)), 1)
+        self.assertEqual(self._run(ValueError("bug")), 1)
+
+
+class ResamplingTestCase(unittest.TestCase):
+    stations = ["A", "B", "C", "D", "E"]
+
+    def test_jackknife_leaves_out_every_station_once(self):
+        sets = resample_stations(self.stations, "jackknife")
+        self.assertEqual(len(sets), len(self.stations))
+        for station, stations in zip(self.stations, sets):
+            self.assertEqual(len(stations), len(self.stations) - 1)
+            self.assertNotIn(station, stations)
+            self.assertEqual(sorted(stations + [station]), self.stations)
+
+    def test_bootstrap_draws_with_replacement(self):
+        np.random.seed(42)
+        sets = resample_stations(self.stations, "bootstrap", count=50)
+        self.assertEqual(len(sets), 50)
+        for stations in sets:
+            self.assertEqual(len(stations), len(self.stations))
+            self.assertTrue(set(stations) <= set(self.stations))
+        # some sets contain stations more than once
+        self.assertTrue(any(len(set(stations)) < len(stations)
+                            for stations in sets))
+
+    def test_unknown_method(self):
+        self.assertRaises(ValueError, resample_stations, self.stations,
+                          "fooknife")
+
+    def test_location_errors(self):
+        t = UTCDateTime(2020, 1, 1)
+        longitudes = [10.0, 10.1, 10.2]
+        latitudes = [0.0, 0.0, 0.3]
+        depths = [1.0, 2.0, 3.0]
+        times = [t, t + 0.5, t + 1.0]
+        x = np.array([-0.1, 0.0, 0.1]) * degrees2kilometers(1) * \
+            np.cos(np.radians(0.1))
+        y = np.array([-0.1, -0.1, 0.2]) * degrees2kilometers(1)
+        expected = [x, y, np.array(depths), np.array([0.0, 0.5, 1.0])]
+        # jackknife: spread of the relocations is scaled up by (n - 1)
+        errors = resampled_location_errors(longitudes, latitudes, depths,
+                                           times, "jackknife")
+        for error, values in zip(errors, expected):
+            self.assertAlmostEqual(error, np.sqrt(2 * np.var(values)))
+        # bootstrap: sample standard deviation of the relocations
+        errors = resampled_location_errors(longitudes, latitudes, depths,
+                                           times, "bootstrap")
+        for error, values in zip(errors, expected):
+            self.assertAlmostEqual(error, np.std(values, ddof=1))
+        self.assertAlmostEqual(errors[2], 1.0)
+        self.assertAlmostEqual(errors[3], 0.5)
+
+
+class DiskCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="obspyck-test-")
+        # directory gets created if needed
+        self.cache = DiskCache(os.path.join(self.tmp_dir, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_put_get(self):
+        self.assertNotIn("a", self.cache)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("a", default=1), 1)
+        self.cache.put("a", {"x": [1, 2, 3]})
+        self.assertIn("a", self.cache)
+        self.assertEqual(self.cache.get("a"), {"x": [1, 2, 3]})
+        # shared with other instances (e.g. in other processes)
+        other = DiskCache(self.cache.directory)
+        self.assertEqual(other.get("a"), {"x": [1, 2, 3]})
+        self.assertIsNone(other.get("b"))
+
+    def test_atomic_overwrite(self):
+        self.cache.put("a", 1)
+        self.cache.put("a", 2)
+        self.assertEqual(self.cache.get("a"), 2)
+        # a failing write leaves the old value and no partial files behind
+        self.assertRaises(Exception, self.cache.put, "a", lambda: None)
+        self.assertEqual(self.cache.get("a"), 2)
+        self.assertEqual(len(os.listdir(self.cache.directory)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,45 +9,52 @@
 # Copyright (C) 2010 Tobias Megies, Lion Krischer
 # -------------------------------------------------------------------
 import copy
+import cPickle
+import ctypes
+import fnmatch
 import glob
+import gzip
+import hashlib
+import importlib
 import io
 import math
+import multiprocessing
 import os
 import platform
+import Queue
+import re
 import shutil
+import socket
 import subprocess
 import sys
 import tempfile
+import threading
+import time
+import urllib2
 import warnings
+from collections import OrderedDict
+from ConfigParser import SafeConfigParser
+from multiprocessing.pool import ThreadPool
 from StringIO import StringIO
 
-import PyQt4
 import numpy as np
+import scipy.signal
 import matplotlib as mpl
 from matplotlib.colors import ColorConverter
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as QFigureCanvas
 from matplotlib.widgets import MultiCursor as MplMultiCursor
 
 import obspy
 from obspy import Trace, Inventory
-import obspy.clients.arclink
 from obspy import UTCDateTime, read_inventory, read, Stream
-from obspy.clients.arclink import Client as ArcLinkClient
-from obspy.clients.fdsn import Client as FDSNClient
-from obspy.clients.filesystem.sds import Client as SDSClient
-from obspy.clients.seedlink import Client as SeedlinkClient
-from obspy.clients.seishub import Client as SeisHubClient
-from obspy.geodetics.base import gps2dist_azimuth
-from obspy.io.xseed import Parser
+from obspy.core.inventory.response import Response
+from obspy.geodetics.base import gps2dist_azimuth, degrees2kilometers
+from obspy.signal.invsim import WOODANDERSON
 
 from . import __version__
 from .rotate_to_zne import (
     _rotate_specific_channels_to_zne, get_orientation_from_parser,
     get_orientation)
 
-obspy.clients.arclink.client.MAX_REQUESTS = 200
-
 mpl.rc('figure.subplot', left=0.05, right=0.98, bottom=0.10, top=0.92,
        hspace=0.28)
 mpl.rcParams['font.size'] = 10
@@ -117,21 +124,72 @@ COMMANDLINE_OPTIONS = (
             'default': '',
             'help': "Filename (or path) of event file to load."}),
         )
+# options of batch processing without GUI ("obspyck batch"), in addition to
+# the ones above (except "--time" and "--event")
+BATCH_COMMANDLINE_OPTIONS = (
+        (("-t", "--time"), {
+            'dest': "times", "action": "append", "default": [],
+            'help': "Time of an event to process (used same as the time "
+                    "option of the GUI, see '--starttime-offset'). Can be "
+                    "specified multiple times."}),
+        (("--catalog",), {
+            'dest': "catalog", 'type': "str", 'default': None,
+            'help': "Event file (e.g. QuakeML) with events to process. Origin "
+                    "times of all events are used as event times (see "
+                    "'--time')."}),
+        (("--output-dir",), {
+            'dest': "output_dir", 'type': "str", 'default': ".",
+            'help': "Directory to write QuakeML files of processed events "
+                    "to. Processed events are recorded in file "
+                    "'obspyck_batch_done.txt' in this directory and are "
+                    "skipped when running again (remove that file to process "
+                    "all events again)."}),
+        (("-j", "--processes"), {
+            'dest': "processes", 'type': "int", 'default': None,
+            'help': "Number of events to process in parallel (separate "
+                    "processes). Defaults to the number of CPUs."}),
+        (("--waveform-cache",), {
+            'dest': "waveform_cache", 'type': "str", 'default': None,
+            'help': "Directory to store fetched waveforms and metadata of "
+                    "each event in. Data in this directory is used instead of "
+                    "fetching it again (e.g. when processing the same events "
+                    "again with different settings). Can be shared by "
+                    "several batch runs."}),
+        )
+# client class (module and class name) for every server type, clients are
+# only imported when first connecting to a server of that type (see
+# connect_to_server())
+CLIENT_CLASSES = {
+        "arclink": ("obspy.clients.arclink", "Client"),
+        "fdsn": ("obspy.clients.fdsn", "Client"),
+        "jane": ("obspy.clients.fdsn", "Client"),
+        "seishub": ("obspy.clients.seishub", "Client"),
+        "seedlink": ("obspy.clients.seedlink", "Client"),
+        "sds": ("obspy.clients.filesystem.sds", "Client"),
+        }
 PROGRAMS = {
         'nlloc': {'filenames': {'exe': "NLLoc", 'phases': "nlloc.obs",
                                 'summary': "nlloc.hyp",
-                                'scatter': "nlloc.scat"}},
+                                'scatter': "nlloc.scat"},
+                  'outputs': ["nlloc*", "last.*"]},
         'hyp_2000': {'filenames': {'exe': "hyp2000",'control': "bay2000.inp",
                                    'phases': "hyp2000.pha",
                                    'stations': "stations.dat",
-                                   'summary': "hypo.prt"}},
-        'focmec': {'filenames': {'exe': "rfocmec", 'phases': "focmec.dat",
-                                 'stdout': "focmec.stdout",
-                                 'summary': "focmec.out"}}}
+                                   'summary': "hypo.prt"},
+                     'outputs': ["hyp2000.pha", "stations.dat", "hypo.prt"]},
+        'focmec': {'filenames': {'exe': "focmec", 'phases': "focmec.dat",
+                                 'all': "focmec.out.all",
+                                 'summary': "focmec.out"},
+                   'outputs': ["focmec.dat", "focmec.stdout", "focmec.out*",
+                               "focmec.lst"]}}
+# files in program directories larger than this (in bytes, e.g. travel time
+# grids) get linked into the working directories instead of copied
+PROGRAM_LINK_MIN_SIZE = 64 * 1024
 COMPONENT_COLORS = {'Z': "k", 'N': "b", 'E': "r"}
 WIDGET_NAMES = ("qToolButton_clearAll", "qToolButton_clearOrigMag",
         "qToolButton_clearFocMec", "qToolButton_doHyp2000",
         "qToolButton_doNlloc", "qComboBox_nllocModel",
+        "qToolButton_doNllocAllModels", "qToolButton_resampleLocation",
         "qToolButton_doFocMec", "qToolButton_showMap",
         "qToolButton_showFocMec", "qToolButton_nextFocMec",
         "qToolButton_showWadati", "qToolButton_getNextEvent",
@@ -145,11 +203,12 @@ WIDGET_NAMES = ("qToolButton_clearAll", "qToolButton_clearOrigMag",
         "qToolButton_overview", "qComboBox_phaseType", "qToolButton_rotateLQT",
         "qToolButton_rotateZRT", "qToolButton_filter", "qToolButton_trigger",
         "qToolButton_physical_units", "qDoubleSpinBox_waterlevel",
-        "qToolButton_arpicker", "qComboBox_filterType", "qCheckBox_zerophase",
+        "qToolButton_arpicker", "qToolButton_coincidence",
+        "qComboBox_filterType", "qCheckBox_zerophase",
         "qLabel_highpass", "qDoubleSpinBox_highpass", "qLabel_lowpass",
         "qDoubleSpinBox_lowpass",
         "qDoubleSpinBox_corners", "qLabel_corners", "qCheckBox_50Hz",
-        "qTextEdit_qml", "qPushButton_qml_update",
+        "qPlainTextEdit_qml", "qPushButton_qml_update",
         "qLabel_sta", "qDoubleSpinBox_sta",
         "qLabel_lta", "qDoubleSpinBox_lta", "qToolButton_spectrogram",
         "qCheckBox_spectrogramLog", "qLabel_wlen", "qDoubleSpinBox_wlen",
@@ -177,6 +236,13 @@ S_POL_PHASE_TYPE = {'R': "SV", 'T': "SH"}
 POLARITY_2_FOCMEC = {'Z': {'positive': "U", 'negative': "D"},
                      'R': {'positive': "F", 'negative': "B"},
                      'T': {'positive': "R", 'negative': "L"}}
+# phase sets focmec gets run with (in parallel), with the FOCMEC polarity
+# identifiers used by each set
+FOCMEC_PHASE_SETS = OrderedDict([("P", "UD"), ("P+SH", "UDRL"),
+                                 ("P+SV", "UDFB"), ("P+SH+SV", "UDRLFB")])
+# solution lines in complete focmec output (dip, strike, rake and numbers of
+# polarity errors), see focmec stdin templates in plugin directory
+FOCMEC_SOLUTION_PATTERN = re.compile(r"^\s*([\d.-]+\s+){5}[\d.-]+\s*$")
 
 # only strings involved, so shallow copy is fine
 POLARITY_CHARS = {'positive': "+", 'negative': "-", 'undecidable': "?",
@@ -192,16 +258,27 @@ TWO_SIGMA = 95.4
 NOT_REIMPLEMENTED_MSG = ("Feature was not reimplemented after major "
                          "change to QuakeML.")
 
-class QMplCanvas(QFigureCanvas):
+def read_config(config_file=None):
     """
-    Class to represent the FigureCanvas widget.
+    Reads the config file, by default '~/.obspyckrc' (an example configuration
+    is created if it does not exist).
+
+    :returns: Name of the config file and the config.
     """
-    def __init__(self, parent=None):
-        # Standard Matplotlib code to generate the plot
-        self.fig = Figure()
-        # initialize the canvas where the Figure renders into
-        QFigureCanvas.__init__(self, self.fig)
-        self.setParent(parent)
+    if config_file:
+        config_file = os.path.expanduser(config_file)
+    else:
+        config_file = os.path.join(os.path.expanduser("~"), ".obspyckrc")
+        if not os.path.exists(config_file):
+            src = os.path.join(
+                os.path.dirname(__file__), "example.cfg")
+            shutil.copy(src, config_file)
+            print "created example config file: {}".format(config_file)
+    config = SafeConfigParser(allow_no_value=True)
+    # make all config keys case sensitive
+    config.optionxform = str
+    config.read(config_file)
+    return config_file, config
 
 def matplotlib_color_to_rgb(color):
     """
@@ -323,12 +400,14 @@ def _attach_metadata(st, inventories):
         tr.stats.response = response
 
 
-def fetch_waveforms_with_metadata(options, args, config):
+def fetch_waveforms_with_metadata(options, args, config, clients=None):
     """
     Sets up obspy clients and fetches waveforms and metadata according to
     command line options.
     Now also fetches data via arclink if --arclink-ids is used.
     Args are tried to read as local waveform files or metadata files.
+    Already connected clients can be passed in as a dictionary (see
+    connect_to_server()), newly connected clients are added to it.
 
     XXX Notes: XXX
      - there is a problem in the arclink client with duplicate traces in
@@ -391,7 +470,8 @@ def fetch_waveforms_with_metadata(options, args, config):
         elif net in seed_id_lookup_keys:
             seed_id_lookup[seed_id] = config.get("seed_id_lookup", net)
 
-    clients = {}
+    if clients is None:
+        clients = {}
 
     streams = []
     sta_fetched = set()
@@ -668,19 +748,8 @@ def connect_to_server(server_name, config, clients):
         return clients[server_name]
 
     server_type = config.get(server_name, "type")
-    # # doesnt work on obspy <1.0, so set it above on module level:
-    # ArcLinkClient.max_status_requests = 2000
-
-    client_classes = {
-        "arclink": ArcLinkClient,
-        "fdsn": FDSNClient,
-        "jane": FDSNClient,
-        "seishub": SeisHubClient,
-        "seedlink": SeedlinkClient,
-        "sds": SDSClient,
-        }
 
-    if server_type not in client_classes.keys():
+    if server_type not in CLIENT_CLASSES:
         msg = ("Unknown server type '{}' in server definition section "
                "'{}' in config file.").format(server_type, server_name)
         raise NotImplementedError(msg)
@@ -715,7 +784,11 @@ def connect_to_server(server_name, config, clients):
         if value is not None:
             kwargs[key] = value
 
-    client = client_classes[server_type](**kwargs)
+    module_name, class_name = CLIENT_CLASSES[server_type]
+    module = importlib.import_module(module_name)
+    if server_type == "arclink":
+        module.client.MAX_REQUESTS = 200
+    client = getattr(module, class_name)(**kwargs)
     clients[server_name] = client
     return client
 
@@ -790,6 +863,12 @@ def merge_check_and_cleanup_streams(streams, options, config):
     # demean traces if not explicitly deactivated on command line
     if config.getboolean("base", "zero_mean"):
         for st in streams:
+            # detrending works in place on floating point data, but input
+            # data might still be shared (e.g. being saved in the
+            # background), integer data gets converted to new arrays anyway
+            for tr in st:
+                if tr.data.dtype.kind == "f":
+                    tr.data = tr.data.copy()
             try:
                 st.detrend('simple')
                 st.detrend('constant')
@@ -827,10 +906,56 @@ def cleanup_streams_without_metadata(streams):
                 break
     return streams
 
+def _call_program(prog_dict, *args):
+    """
+    Runs an external program (set up in :func:`setup_external_programs`) and
+    waits for it to finish.
+
+    :returns: stdout, stderr and return code of the program.
+    """
+    run = prog_dict['Start'](prog_dict, *args)
+    run.wait()
+    postcall = prog_dict.get('PostCall')
+    if postcall is not None:
+        postcall(prog_dict)
+    return (run.stdout, run.stderr, run.returncode)
+
+
+def _setup_program_dir(srcdir, prog_dir, outputs):
+    """
+    Sets up a working directory for an external program from the program's
+    directory in the plugin path.
+
+    Subdirectories, executables and large files (see
+    :const:`PROGRAM_LINK_MIN_SIZE`) are symlinked, other files are copied.
+    Files matching any of the glob patterns in `outputs` (files written by
+    the program or by us) are left out, so that a program run can never write
+    through a link into the plugin path. Symlinks in the program's directory
+    are recreated as they are (they may be dangling, e.g. binaries that are
+    not installed). Everything is copied on platforms without symlinks.
+    """
+    os.mkdir(prog_dir)
+    for name in os.listdir(srcdir):
+        if any(fnmatch.fnmatch(name, pattern) for pattern in outputs):
+            continue
+        src = os.path.join(srcdir, name)
+        dst = os.path.join(prog_dir, name)
+        if hasattr(os, "symlink") and os.path.islink(src):
+            os.symlink(os.readlink(src), dst)
+        elif hasattr(os, "symlink") and (
+                os.path.isdir(src) or os.access(src, os.X_OK) or
+                os.path.getsize(src) >= PROGRAM_LINK_MIN_SIZE):
+            os.symlink(os.path.abspath(src), dst)
+        elif os.path.isdir(src):
+            shutil.copytree(src, dst, symlinks=True)
+        else:
+            shutil.copy2(src, dst)
+
+
 def setup_external_programs(options, config):
     """
-    Sets up temdir, copies program files, fills in PROGRAMS dict, sets up
-    system calls for programs.
+    Sets up temdir, links/copies program files (see _setup_program_dir()),
+    fills in PROGRAMS dict, sets up system calls for programs.
     Depends on command line options, returns temporary directory.
 
     :param options: Command line options of ObsPyck
@@ -861,8 +986,9 @@ def setup_external_programs(options, config):
     for prog_basename, prog_dict in PROGRAMS.iteritems():
         prog_srcpath = os.path.join(pluginpath, prog_basename)
         prog_tmpdir = os.path.join(tmp_dir, prog_basename)
+        prog_dict['srcdir'] = prog_srcpath
         prog_dict['dir'] = prog_tmpdir
-        shutil.copytree(prog_srcpath, prog_tmpdir, symlinks=True)
+        _setup_program_dir(prog_srcpath, prog_tmpdir, prog_dict['outputs'])
         prog_dict['files'] = {}
         for key, filename in prog_dict['filenames'].iteritems():
             prog_dict['files'][key] = os.path.join(prog_tmpdir, filename)
@@ -883,19 +1009,13 @@ def setup_external_programs(options, config):
                 os.remove(file)
         return
     prog_dict['PreCall'] = tmp
-    def tmp(prog_dict):
-        sub = subprocess.Popen(prog_dict['files']['exe'], shell=SHELL,
-                cwd=prog_dict['dir'], env=prog_dict['env'],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    def tmp(prog_dict, timeout=None):
         input = open(prog_dict['files']['control'], "rt").read()
-        (msg, err) = sub.communicate(input)
-        if system == "Darwin":
-            returncode = sub.returncode
-        else:
-            returncode = sub.wait()
-        return (msg, err, returncode)
-    prog_dict['Call'] = tmp
+        return ProgramRun(prog_dict['files']['exe'], cwd=prog_dict['dir'],
+                          env=prog_dict['env'], input=input, timeout=timeout,
+                          shell=SHELL)
+    prog_dict['Start'] = tmp
+    prog_dict['Call'] = _call_program
     # NLLoc ###############################################################
     prog_dict = PROGRAMS['nlloc']
     def tmp(prog_dict):
@@ -905,41 +1025,85 @@ def setup_external_programs(options, config):
             os.remove(file)
         return
     prog_dict['PreCall'] = tmp
-    def tmp(prog_dict, controlfilename):
-        sub = subprocess.Popen([prog_dict['files']['exe'], controlfilename],
-                cwd=prog_dict['dir'], env=prog_dict['env'], shell=SHELL,
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if system == "Darwin":
-            returncode = sub.returncode
-        else:
-            returncode = sub.wait()
-        msg = "".join(sub.stdout.readlines())
-        err = "".join(sub.stderr.readlines())
+    def tmp(prog_dict, controlfilename, timeout=None):
+        return ProgramRun([prog_dict['files']['exe'], controlfilename],
+                          cwd=prog_dict['dir'], env=prog_dict['env'],
+                          timeout=timeout, shell=SHELL)
+    prog_dict['Start'] = tmp
+    def tmp(prog_dict):
         for pattern, key in [("nlloc.*.*.*.loc.scat", 'scatter'),
                              ("nlloc.*.*.*.loc.hyp", 'summary')]:
             pattern = os.path.join(prog_dict['dir'], pattern)
             newname = os.path.join(prog_dict['dir'], prog_dict['files'][key])
             for file in glob.glob(pattern):
                 os.rename(file, newname)
-        return (msg, err, returncode)
-    prog_dict['Call'] = tmp
+        return
+    prog_dict['PostCall'] = tmp
+    prog_dict['Call'] = _call_program
     # focmec ##############################################################
     prog_dict = PROGRAMS['focmec']
+    def tmp(prog_dict, phase_set, errors, timeout=None):
+        files = prog_dict['files']
+        for file in [files['all'], files['summary']]:
+            if os.path.isfile(file):
+                os.remove(file)
+        # stdin template of the phase set, with the allowed number of
+        # polarity errors filled in
+        template = os.path.join(prog_dict['dir'], "focmec.%s.stdin" %
+                                phase_set.replace("+", "_"))
+        input = open(template, "rt").read().replace("XXX", str(errors))
+        return ProgramRun(files['exe'], cwd=prog_dict['dir'],
+                          env=prog_dict['env'], input=input, timeout=timeout,
+                          shell=SHELL)
+    prog_dict['Start'] = tmp
     def tmp(prog_dict):
-        sub = subprocess.Popen(prog_dict['files']['exe'], shell=SHELL,
-                cwd=prog_dict['dir'], env=prog_dict['env'],
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if system == "Darwin":
-            returncode = sub.returncode
-        else:
-            returncode = sub.wait()
-        msg = "".join(sub.stdout.readlines())
-        err = "".join(sub.stderr.readlines())
-        return (msg, err, returncode)
-    prog_dict['Call'] = tmp
+        files = prog_dict['files']
+        lines = []
+        if os.path.isfile(files['all']):
+            lines = [line for line in open(files['all'], "rt")
+                     if "nan" not in line and
+                     FOCMEC_SOLUTION_PATTERN.match(line)]
+        with open(files['summary'], "wt") as fh:
+            fh.writelines(lines)
+        return
+    prog_dict['PostCall'] = tmp
+    prog_dict['Call'] = _call_program
     #######################################################################
     return tmp_dir
 
+
+def clone_program_dir(prog_dict, name):
+    """
+    Sets up a separate working directory for an external program (next to
+    the program's main directory in the temporary directory, so relative paths
+    in control files still resolve) so that several instances of the program
+    can run at the same time.
+
+    :type prog_dict: dict
+    :param prog_dict: Entry of :const:`PROGRAMS` to clone.
+    :type name: str
+    :param name: Name of the new directory.
+    :returns: New program dictionary (same PreCall/Call) pointing to the new
+        directory.
+    """
+    prog_dir = os.path.join(os.path.dirname(prog_dict['dir']), name)
+    if os.path.isdir(prog_dir):
+        shutil.rmtree(prog_dir)
+    _setup_program_dir(prog_dict['srcdir'], prog_dir, prog_dict['outputs'])
+    new_dict = dict(prog_dict)
+    new_dict['dir'] = prog_dir
+    new_dict['files'] = {}
+    for key, filename in prog_dict['filenames'].iteritems():
+        new_dict['files'][key] = os.path.join(prog_dir, filename)
+    new_dict['files']['exe'] = prog_dict['files']['exe']
+    # point environment variables (PATH, HYP2000_DATA) to the new directory
+    new_dict['env'] = {}
+    for key, value in prog_dict['env'].iteritems():
+        if value.startswith(prog_dict['dir']):
+            value = prog_dir + value[len(prog_dict['dir']):]
+        new_dict['env'][key] = value
+    return new_dict
+
 #Monkey patch (need to remember the ids of the mpl_connect-statements to remove them later)
 #See source: http://matplotlib.sourcearchive.com/documentation/0.98.1/widgets_8py-source.html
 class MultiCursor(MplMultiCursor):
@@ -978,6 +1142,35 @@ class MultiCursor(MplMultiCursor):
             self.vlines = value
 
 
+# coordinate transformation objects only get set up once and are reused
+_GK4_TO_WGS84 = {}
+_GEOD = {}
+
+
+def _get_gk4_to_wgs84():
+    """
+    Returns a (cached) function that transforms Gauss-Krueger (zone 4) X/Y
+    coordinates in meters to WGS84 longitude/latitude.
+    """
+    transform = _GK4_TO_WGS84.get("transform")
+    if transform is None:
+        import pyproj
+        try:
+            Transformer = pyproj.Transformer
+        except AttributeError:
+            # pyproj < 2.1
+            proj_wgs84 = pyproj.Proj(init="epsg:4326")
+            proj_gk4 = pyproj.Proj(init="epsg:31468")
+
+            def transform(x, y):
+                return pyproj.transform(proj_gk4, proj_wgs84, x, y)
+        else:
+            transform = Transformer.from_crs(
+                "epsg:31468", "epsg:4326", always_xy=True).transform
+        _GK4_TO_WGS84["transform"] = transform
+    return transform
+
+
 def gk2lonlat(x, y, m_to_km=True):
     """
     This function converts X/Y Gauss-Krueger coordinates (zone 4, central
@@ -991,18 +1184,16 @@ def gk2lonlat(x, y, m_to_km=True):
     http://trac.osgeo.org/proj/
     http://www.epsg-registry.org/
     """
-    import pyproj
-
-    proj_wgs84 = pyproj.Proj(init="epsg:4326")
-    proj_gk4 = pyproj.Proj(init="epsg:31468")
+    transform = _get_gk4_to_wgs84()
     # convert to meters first
     if m_to_km:
         x = x * 1000.
         y = y * 1000.
-    lon, lat = pyproj.transform(proj_gk4, proj_wgs84, x, y)
+    lon, lat = transform(x, y)
     return (lon, lat)
 
-def readNLLocScatter(scat_filename, textviewStdErrImproved):
+def readNLLocScatter(scat_filename, textviewStdErrImproved, max_samples=None,
+                     chunk_size=100000):
     """
     This function reads location and values of pdf scatter samples from the
     specified NLLoc *.scat binary file (type "<f4", 4 header values, then 4
@@ -1011,12 +1202,307 @@ def readNLLocScatter(scat_filename, textviewStdErrImproved):
     WGS84 reference ellipsoid.
     Messages on stderr are written to specified GUI textview.
     Returns an array of xy pairs.
+
+    The file is memory mapped and converted in chunks of `chunk_size`
+    samples, so only the returned array is held in memory. If `max_samples`
+    is given, at most that many (evenly spaced) samples are returned.
+    """
+    # omit the first 4 values (header information)
+    offset = 4 * 4
+    dtype = np.dtype([("x", "<f4"), ("y", "<f4"), ("z", "<f4"),
+                      ("pdf", "<f4")])
+    num_samples = max(os.path.getsize(scat_filename) - offset, 0) // \
+        dtype.itemsize
+    if not num_samples:
+        return np.empty((0, 4), dtype=np.float64)
+    samples = np.memmap(scat_filename, dtype=dtype, mode="r", offset=offset,
+                        shape=(num_samples,))
+    if max_samples and num_samples > max_samples:
+        step = int(math.ceil(num_samples / float(max_samples)))
+        samples = samples[::step]
+    data = np.empty((len(samples), 4), dtype=np.float64)
+    transform = _get_gk4_to_wgs84()
+    for start in range(0, len(samples), chunk_size):
+        chunk = samples[start:start + chunk_size]
+        out = data[start:start + chunk_size]
+        # coordinates are in kilometers
+        out[:, 0], out[:, 1] = transform(chunk["x"].astype(np.float64) * 1e3,
+                                         chunk["y"].astype(np.float64) * 1e3)
+        out[:, 2] = chunk["z"]
+        out[:, 3] = chunk["pdf"]
+    del samples
+    return data
+
+
+def split_phases_by_station(phases, station_width=None):
+    """
+    Groups the lines of a phase file (as a string) by station.
+
+    :type station_width: int
+    :param station_width: Number of leading characters holding the station
+        code (fixed column formats like hypo71). If not given, the first
+        whitespace separated field is used (e.g. NonLinLoc phase format).
+    :returns: Ordered dictionary mapping station codes to lists of lines.
+    """
+    groups = OrderedDict()
+    for line in phases.splitlines(True):
+        if not line.strip():
+            continue
+        if station_width is None:
+            station = line.split()[0]
+        else:
+            station = line[:station_width].strip()
+        groups.setdefault(station, []).append(line)
+    return groups
+
+
+def resample_stations(stations, method, count=100):
     """
-    # read data, omit the first 4 values (header information) and reshape
-    data = np.fromfile(scat_filename, dtype="<f4").astype("float")[4:]
-    data = data.reshape((len(data)/4, 4)).swapaxes(0, 1)
-    data[0], data[1] = gk2lonlat(data[0], data[1])
-    return data.T
+    Returns station sets for relocations with resampled stations.
+
+    :type method: str
+    :param method: ``"jackknife"`` (leave out one station at a time) or
+        ``"bootstrap"`` (`count` times as many stations drawn randomly with
+        replacement).
+    :rtype: list of lists
+    """
+    stations = list(stations)
+    if method == "jackknife":
+        return [stations[:i] + stations[i + 1:] for i in range(len(stations))]
+    elif method == "bootstrap":
+        return [[stations[j] for j in
+                 np.random.randint(0, len(stations), len(stations))]
+                for _ in range(count)]
+    msg = "Unknown resampling method: %s" % method
+    raise ValueError(msg)
+
+
+def resampled_location_errors(longitudes, latitudes, depths, times, method):
+    """
+    Estimates location errors from the spread of relocations with resampled
+    stations (see :func:`resample_stations`).
+
+    :param depths: Depths in kilometers.
+    :param times: Origin times as
+        :class:`~obspy.core.utcdatetime.UTCDateTime`.
+    :returns: Standard deviations in east-west (x) and north-south (y)
+        direction and in depth (all in kilometers) and of origin time (in
+        seconds).
+    """
+    n = len(longitudes)
+    lat0 = np.mean(latitudes)
+    x = (np.array(longitudes) - np.mean(longitudes)) * \
+        degrees2kilometers(1) * np.cos(np.radians(lat0))
+    y = (np.array(latitudes) - lat0) * degrees2kilometers(1)
+    t0 = times[0]
+    t = np.array([time - t0 for time in times])
+    data = np.vstack([x, y, np.array(depths, dtype=np.float64), t])
+    variance = np.var(data, axis=1)
+    if method == "jackknife":
+        # jackknife estimate of variance
+        variance *= n - 1
+    else:
+        variance *= n / (n - 1.0)
+    return tuple(np.sqrt(variance))
+
+
+def paz_amplitude(paz, freqs):
+    """
+    Amplitude of the frequency response of poles and zeros (including
+    ``gain``, but not ``sensitivity``) at the given frequencies. Vectorized
+    version of :func:`obspy.signal.invsim.paz_2_amplitude_value_of_freq_resp`.
+    """
+    jw = 2j * np.pi * np.atleast_1d(np.asarray(freqs, dtype=np.float64))
+    fac = np.ones(jw.shape, dtype=np.complex128)
+    for zero in paz['zeros']:
+        fac *= jw - zero
+    for pole in paz['poles']:
+        fac /= jw - pole
+    return np.abs(fac) * paz['gain']
+
+
+def response_amplitude(paz, freq):
+    """
+    Amplitude of the instrument response to velocity in counts per m/s at the
+    given frequency, for poles and zeros (dictionary including
+    ``sensitivity``) or :class:`~obspy.core.inventory.response.Response`.
+    """
+    if isinstance(paz, Response):
+        response = paz.get_evalresp_response_for_frequencies(
+            [freq], output="VEL", start_stage=None, end_stage=None)[0]
+        return np.absolute(response)
+    return paz_amplitude(paz, freq)[0] * paz['sensitivity']
+
+
+def local_magnitudes(amplitudes, timespans, response_amplitudes, groups,
+                     hypo_dists):
+    """
+    Local magnitudes for several stations at once, same as
+    :func:`obspy.signal.invsim.estimate_magnitude` for every station.
+
+    :param amplitudes: Peak to peak amplitudes [counts] of all readings.
+    :param timespans: Timespans of the peak to peak amplitudes [s].
+    :param response_amplitudes: Instrument response amplitudes [counts per
+        m/s] of the readings at their frequency (see
+        :func:`response_amplitude`).
+    :param groups: Index of the station of every reading, readings of a
+        station are averaged (as Wood-Anderson amplitudes).
+    :param hypo_dists: Hypocentral distances [km] of the stations.
+    :returns: Array of local magnitudes of the stations.
+    """
+    amplitudes = np.asarray(amplitudes, dtype=np.float64)
+    freqs = 1.0 / (2 * np.asarray(timespans, dtype=np.float64))
+    # zero to peak Wood-Anderson amplitudes in mm
+    wa_ampl = amplitudes / 2.0 / np.asarray(response_amplitudes)
+    wa_ampl *= paz_amplitude(WOODANDERSON, freqs) * \
+        WOODANDERSON['sensitivity'] * 1000
+    hypo_dists = np.asarray(hypo_dists, dtype=np.float64)
+    groups = np.asarray(groups)
+    wa_ampl_mean = np.bincount(groups, weights=wa_ampl,
+                               minlength=len(hypo_dists)) / \
+        np.bincount(groups, minlength=len(hypo_dists))
+    return np.log10(wa_ampl_mean) + np.log10(hypo_dists / 100.0) + \
+        0.00301 * (hypo_dists - 100.0) + 3.0
+
+
+def ar_pick_prepare(z, n, e):
+    """
+    Preprocessing of the input data of the AR picker (linear detrend,
+    conversion to float32 and scaling of low amplitudes, same as in
+    :func:`obspy.signal.trigger.ar_pick`) for several stations at once.
+
+    :type z: :class:`numpy.ndarray`
+    :param z: Vertical component data, one row per station (all rows of the
+        same length).
+    :type n: :class:`numpy.ndarray`
+    :param n: North component data (see `z`).
+    :type e: :class:`numpy.ndarray`
+    :param e: East component data (see `z`).
+    :returns: Preprocessed data of the three components, rows can be passed
+        to :func:`ar_pick_prepared`.
+    """
+    a, b, c = [
+        np.require(scipy.signal.detrend(data, axis=-1, type='linear'),
+                   dtype=np.float32, requirements=['C_CONTIGUOUS'])
+        for data in (z, n, e)]
+    # scale amplitudes to avoid precision issues in case of low amplitudes,
+    # horizontal components are scaled with a common factor per station
+    data_max = np.abs(a).max(axis=-1)
+    low = data_max < 100
+    if low.any():
+        a[low] *= 1e6
+        a[low] /= data_max[low, np.newaxis]
+    data_max = np.maximum(np.abs(b).max(axis=-1), np.abs(c).max(axis=-1))
+    low = data_max < 100
+    if low.any():
+        for data in (b, c):
+            data[low] *= 1e6
+            data[low] /= data_max[low, np.newaxis]
+    return a, b, c
+
+
+def ar_pick_prepared(a, b, c, samp_rate, f1, f2, lta_p, sta_p, lta_s, sta_s,
+                     m_p, m_s, l_p, l_s):
+    """
+    AR picker (see :func:`obspy.signal.trigger.ar_pick`) on the data of one
+    station preprocessed with :func:`ar_pick_prepare`. The global interpreter
+    lock is released while picking, so that several stations can be picked
+    in parallel in threads.
+
+    :returns: P and S pick time relative to start of data.
+    """
+    from obspy.signal.headers import clibsignal
+    ptime = ctypes.c_float()
+    stime = ctypes.c_float()
+    errcode = clibsignal.ar_picker(
+        a, b, c, len(a), samp_rate, f1, f2, lta_p, sta_p, lta_s, sta_s, m_p,
+        m_s, ctypes.byref(ptime), ctypes.byref(stime), l_p, l_s, 1)
+    if errcode != 0:
+        msg = "AR picker failed with error code %s." % errcode
+        raise Exception(msg)
+    return ptime.value, stime.value
+
+
+def coincidence_windows(triggers, thr_coincidence_sum):
+    """
+    Time windows in which at least `thr_coincidence_sum` stations are
+    triggered at the same time.
+
+    :type triggers: dict
+    :param triggers: Trigger on/off times (as
+        :class:`~obspy.core.utcdatetime.UTCDateTime`) for every station, e.g.
+        ``{"BW.RJOB": [(on, off), ...], ...}``.
+    :returns: List of dictionaries with start ``time``, ``duration`` (in
+        seconds), maximum ``coincidence_sum`` and ``stations`` triggered
+        during each window, sorted by time.
+    """
+    changes = []
+    for station, windows in triggers.iteritems():
+        for on, off in windows:
+            changes.append((on, 1, station))
+            changes.append((off, -1, station))
+    # at the same time, triggers switching off are handled first
+    changes.sort(key=lambda x: (x[0], x[1]))
+    active = {}
+    windows = []
+    current = None
+    for time_, change, station in changes:
+        active[station] = active.get(station, 0) + change
+        if not active[station]:
+            del active[station]
+        if len(active) >= thr_coincidence_sum:
+            if current is None:
+                current = {"time": time_, "stations": set(),
+                           "coincidence_sum": 0}
+            current["stations"].update(active)
+            current["coincidence_sum"] = max(current["coincidence_sum"],
+                                             len(active))
+        elif current is not None:
+            current["duration"] = time_ - current["time"]
+            current["stations"] = sorted(current["stations"])
+            windows.append(current)
+            current = None
+    return windows
+
+
+def adjacent_peaks(data):
+    """
+    Finds the largest absolute amplitude in data and the largest amplitude of
+    opposite sign in the neighbouring half cycle (the one before or after,
+    whichever is larger), e.g. for automatic amplitude readings.
+
+    :type data: :class:`numpy.ndarray`
+    :param data: Data with zero mean.
+    :returns: Indices of minimum and maximum, or None if there is no
+        neighbouring half cycle.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    i_peak = int(np.abs(data).argmax())
+    sign = np.sign(data[i_peak])
+    if not sign:
+        return None
+    opposite = np.sign(data) == -sign
+    candidates = []
+    # half cycle before the peak
+    before = np.flatnonzero(opposite[:i_peak])
+    if len(before):
+        end = before[-1] + 1
+        start = np.flatnonzero(~opposite[:end])
+        start = start[-1] + 1 if len(start) else 0
+        candidates.append(start + int(np.argmax(-sign * data[start:end])))
+    # half cycle after the peak
+    after = np.flatnonzero(opposite[i_peak:])
+    if len(after):
+        start = i_peak + after[0]
+        end = np.flatnonzero(~opposite[start:])
+        end = start + end[0] if len(end) else len(data)
+        candidates.append(start + int(np.argmax(-sign * data[start:end])))
+    if not candidates:
+        return None
+    i_other = max(candidates, key=lambda i: -sign * data[i])
+    if sign > 0:
+        return i_other, i_peak
+    return i_peak, i_other
 
 
 def errorEllipsoid2CartesianErrors(azimuth1, dip1, len1, azimuth2, dip2, len2,
@@ -1097,9 +1583,93 @@ def coords2azbazinc(stream, origin):
     inci = math.atan2(dist, elev_diff) * 180.0 / math.pi
     return azim, bazim, inci
 
+def geodesic_inverse(latitude, longitude, latitudes, longitudes):
+    """
+    Distances in meters, azimuths and backazimuths in degrees between one
+    point and many points on the WGS84 ellipsoid, same as
+    :func:`~obspy.geodetics.base.gps2dist_azimuth` for many points at once.
+    Uses pyproj (vectorized) if it is installed.
+
+    :returns: Arrays of distances, azimuths (from the point to the other
+        points) and backazimuths (from the other points to the point).
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    try:
+        import pyproj
+    except ImportError:
+        results = [gps2dist_azimuth(latitude, longitude, lat, lon)
+                   for lat, lon in zip(latitudes, longitudes)]
+        if not results:
+            return np.empty(0), np.empty(0), np.empty(0)
+        return [np.array(x, dtype=np.float64) for x in zip(*results)]
+    geod = _GEOD.get("WGS84")
+    if geod is None:
+        geod = _GEOD["WGS84"] = pyproj.Geod(ellps="WGS84")
+    azimuths, backazimuths, distances = geod.inv(
+        np.full(longitudes.shape, longitude),
+        np.full(latitudes.shape, latitude), longitudes, latitudes)
+    return (np.asarray(distances), np.asarray(azimuths) % 360.0,
+            np.asarray(backazimuths) % 360.0)
+
+
+class StationGeometry(object):
+    """
+    Geometry of stations relative to an origin, calculated for all stations
+    at once.
+
+    Arrays ``epicentral_distance`` and ``hypocentral_distance`` (in meters),
+    ``azimuth`` (origin to station), ``backazimuth`` (station to origin) and
+    ``incidence`` (see :func:`coords2azbazinc`, in degrees) hold the values
+    for the stations in order of ``keys``.
+    """
+    def __init__(self, latitude, longitude, depth, coordinates):
+        """
+        :param depth: Origin depth in meters (positive down).
+        :type coordinates: dict
+        :param coordinates: Station coordinates (``latitude``, ``longitude``,
+            ``elevation`` and optionally ``local_depth``) by station key, e.g.
+            (network, station, location).
+        """
+        self.keys = list(coordinates)
+        self._index = dict((key, i) for i, key in enumerate(self.keys))
+        coords = [coordinates[key] for key in self.keys]
+        latitudes = [c['latitude'] for c in coords]
+        longitudes = [c['longitude'] for c in coords]
+        elevations = np.array([c['elevation'] for c in coords],
+                              dtype=np.float64)
+        # if sensor is buried or downhole, account for the specified sensor
+        # depth
+        local_depths = np.array([c.get('local_depth') or 0 for c in coords],
+                                dtype=np.float64)
+        if depth is None:
+            depth = np.nan
+        self.epicentral_distance, self.azimuth, self.backazimuth = \
+            geodesic_inverse(latitude, longitude, latitudes, longitudes)
+        self.hypocentral_distance = np.sqrt(
+            self.epicentral_distance ** 2 +
+            (depth + elevations - local_depths) ** 2)
+        self.incidence = np.degrees(np.arctan2(self.epicentral_distance,
+                                               elevations - depth))
+
+    def get(self, key):
+        """
+        Returns index of the station in the arrays or None if the station is
+        not known.
+        """
+        return self._index.get(key)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self.keys)
+
+
 class SplitWriter():
     """
     Implements a write method that writes a given message on all children
+    (file-like objects or Qt text views).
     """
     def __init__(self, *objects):
         """
@@ -1112,7 +1682,7 @@ class SplitWriter():
         Sends msg to all childrens write method.
         """
         for obj in self.children:
-            if isinstance(obj, PyQt4.QtGui.QPlainTextEdit):
+            if hasattr(obj, "appendPlainText"):
                 if msg == '\n':
                     return
                 if msg.endswith('\n'):
@@ -1205,6 +1775,18 @@ def apply_gse2_calib(tr):
         print msg
 
 
+def gse2_calibrated_amplitude(tr, value):
+    """
+    Applies GSE2 specific calibration to an amplitude measured on raw data of
+    the trace. Calibration of GSE2 data can not be applied to the overall
+    sensitivity (see apply_gse2_calib()), so it is applied to amplitudes
+    instead, other data is returned unchanged.
+    """
+    if tr.stats.get("_format") == "GSE2":
+        value = value / (tr.stats.calib * 2 * np.pi / tr.stats.gse2.calper)
+    return value
+
+
 def map_rotated_channel_code(channel, rotation):
     """
     Modifies a channel code according to given rotation (e.g. EHN -> EHR)
@@ -1298,11 +1880,18 @@ def set_matplotlib_defaults(config):
             mpl.rcParams[key] = value
 
 
-def _save_input_data(streams, inventories, directory):
+def _save_input_data(streams, inventories, directory, compression=None):
     """
+    Writes raw waveforms (``waveforms.mseed``) and station metadata
+    (``inventory.xml``) to given directory. Traces are written one after
+    another, without combining all data in memory first.
+
     :type streams: list of Stream
     :type inventories: list of Inventory
     :type directory: str
+    :type compression: str
+    :param compression: ``"gzip"`` to write gzip compressed files (with
+        additional ``.gz`` file ending) or None.
     """
     if not os.path.isdir(directory):
         raise OSError('Not a directory: ' + str(directory))
@@ -1312,13 +1901,482 @@ def _save_input_data(streams, inventories, directory):
         streams = [streams]
     else:
         raise TypeError
+    if compression == "gzip":
+        open_ = gzip.open
+        suffix = ".gz"
+    elif compression:
+        msg = "Unknown compression: %s" % compression
+        raise ValueError(msg)
+    else:
+        open_ = open
+        suffix = ""
     # write raw waveforms
-    st = Stream()
-    for st_ in streams:
-        st += st_
-    st.write(os.path.join(directory, 'waveforms.mseed'), format='MSEED')
+    with open_(os.path.join(directory, 'waveforms.mseed' + suffix),
+               'wb') as fh:
+        for st in streams:
+            for tr in st:
+                tr.write(fh, format='MSEED')
     # write inventories
-    inv = Inventory(networks=[], source='')
-    for inv_ in inventories:
-        inv += inv_
-    inv.write(os.path.join(directory, 'inventory.xml'), format='STATIONXML')
+    inv = Inventory(networks=[net for inv_ in inventories for net in inv_],
+                    source='')
+    with open_(os.path.join(directory, 'inventory.xml' + suffix),
+               'wb') as fh:
+        inv.write(fh, format='STATIONXML')
+
+
+class HTTPStatusError(Exception):
+    """
+    Raised for unsuccessful HTTP responses, keeps the HTTP status code.
+    """
+    def __init__(self, msg, status_code):
+        Exception.__init__(self, msg)
+        self.status_code = status_code
+
+
+def is_transient_error(error):
+    """
+    Whether a failed request is worth retrying: connection errors, timeouts
+    and server errors (HTTP 5xx) are, client errors (HTTP 4xx, e.g. failed
+    authentication) and anything else are not.
+    """
+    if isinstance(error, HTTPStatusError):
+        return error.status_code >= 500
+    if isinstance(error, urllib2.HTTPError):
+        return error.code >= 500
+    if isinstance(error, (urllib2.URLError, socket.error)):
+        return True
+    # requests is only imported when used for uploads
+    requests = sys.modules.get("requests")
+    if requests is not None and isinstance(
+            error, (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout)):
+        return True
+    return False
+
+
+class BackgroundJobQueue(object):
+    """
+    Runs jobs (e.g. event uploads) one after another in a background worker
+    thread.
+
+    Jobs are executed in the order they were submitted, failing jobs are
+    retried with exponential backoff (see `retry_if`). Results are not handed to any callbacks
+    from the worker thread but are collected and have to be fetched with
+    :meth:`poll` from the GUI thread (e.g. using a QTimer), so that widgets
+    are never touched from the worker thread.
+
+    :type retries: int
+    :param retries: Number of times a failing job is retried.
+    :type backoff: float
+    :param backoff: Seconds to wait before the first retry, the waiting time
+        doubles with every further retry.
+    :param retry_if: Callable that decides whether a job is retried, given
+        the exception it failed with (e.g. :func:`is_transient_error`). By
+        default all failing jobs are retried.
+    """
+    def __init__(self, retries=0, backoff=1.0, retry_if=None):
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_if = retry_if
+        self._jobs = Queue.Queue()
+        self._results = Queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._thread = threading.Thread(target=self._work)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, description, func, args=(), kwargs=None, callback=None):
+        """
+        Queue a job for execution in the background.
+
+        :type description: str
+        :param description: Short description of the job, used in status and
+            error messages.
+        :param func: Callable to run in the worker thread. Must not touch any
+            GUI elements.
+        :param callback: Optional callable that gets handed back (together
+            with the job's result) by :meth:`poll`.
+        """
+        with self._lock:
+            self._pending.append(description)
+        self._jobs.put((description, func, args, kwargs or {}, callback))
+
+    @property
+    def pending(self):
+        """
+        Descriptions of all jobs that are queued or running right now.
+        """
+        with self._lock:
+            return list(self._pending)
+
+    def poll(self):
+        """
+        Return all jobs finished since last call as a list of tuples
+        ``(description, callback, result, error)``. ``error`` is ``None``
+        if the job was successful.
+        """
+        finished = []
+        while True:
+            try:
+                finished.append(self._results.get_nowait())
+            except Queue.Empty:
+                break
+        return finished
+
+    def join(self):
+        """
+        Block until all queued jobs are finished.
+        """
+        self._jobs.join()
+
+    def _work(self):
+        while True:
+            description, func, args, kwargs, callback = self._jobs.get()
+            attempt = 0
+            while True:
+                try:
+                    result = func(*args, **kwargs)
+                    error = None
+                except Exception as e:
+                    if attempt < self.retries and (
+                            self.retry_if is None or self.retry_if(e)):
+                        time.sleep(self.backoff * 2 ** attempt)
+                        attempt += 1
+                        continue
+                    result = None
+                    error = e
+                break
+            # do not keep job arguments (e.g. data) alive until the next job
+            del func, args, kwargs
+            with self._lock:
+                self._pending.remove(description)
+            self._results.put((description, callback, result, error))
+            self._jobs.task_done()
+
+
+class ParallelMap(object):
+    """
+    Applies a function to all items in a thread pool in the background.
+    Results can be collected while work is still in progress (see poll()),
+    items that were not started yet are skipped after cancel().
+    """
+    _skipped = object()
+
+    def __init__(self, func, items, workers=None):
+        self.total = len(items)
+        self.count = 0
+        self.cancelled = False
+        self.finished = False
+        self._func = func
+        self._pool = ThreadPool(workers or multiprocessing.cpu_count())
+        self._results = self._pool.imap_unordered(self._call, items)
+        self._pool.close()
+
+    def _call(self, item):
+        if self.cancelled:
+            return self._skipped
+        return self._func(item)
+
+    def _add(self, result, results):
+        self.count += 1
+        if result is not self._skipped:
+            results.append(result)
+
+    def poll(self):
+        """
+        Return results that got available since the last call, without
+        waiting.
+        """
+        results = []
+        while not self.finished:
+            try:
+                result = self._results.next(timeout=0)
+            except multiprocessing.TimeoutError:
+                break
+            except StopIteration:
+                self.finished = True
+                self._pool.join()
+                break
+            self._add(result, results)
+        return results
+
+    def wait(self):
+        """
+        Wait for all items to be processed and return the results not
+        collected yet.
+        """
+        results = []
+        for result in self._results:
+            self._add(result, results)
+        self.finished = True
+        self._pool.join()
+        return results
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class PrefetchCache(object):
+    """
+    Bounded cache of values that get fetched ahead of time in background
+    threads (e.g. event documents from a server).
+
+    Only meant to be used from one thread (the GUI thread), just the
+    fetching itself is done in the worker threads.
+
+    :param fetch: Callable that takes a key and returns the corresponding
+        value. Gets executed in worker threads.
+    :type size: int
+    :param size: Maximum number of values to keep, oldest values are
+        discarded first.
+    :type workers: int
+    :param workers: Number of worker threads.
+    """
+    def __init__(self, fetch, size=10, workers=2):
+        self._fetch = fetch
+        self.size = size
+        self._pool = ThreadPool(workers)
+        self._cache = OrderedDict()
+
+    def prefetch(self, keys):
+        """
+        Start fetching values for given keys in the background (if not
+        already cached or in progress).
+        """
+        for key in keys:
+            if key in self._cache:
+                continue
+            self._cache[key] = self._pool.apply_async(self._fetch, (key,))
+        while len(self._cache) > self.size:
+            self._cache.popitem(last=False)
+
+    def pop(self, key):
+        """
+        Return value for given key and remove it from the cache. Waits for
+        the value if it is still being fetched and fetches it right away if
+        it was not prefetched (or if prefetching failed).
+        """
+        result = self._cache.pop(key, None)
+        if result is not None:
+            try:
+                return result.get()
+            except Exception:
+                pass
+        return self._fetch(key)
+
+    def clear(self):
+        """
+        Discard all cached values.
+        """
+        self._cache.clear()
+
+    def close(self):
+        self._cache.clear()
+        self._pool.terminate()
+
+
+class ProgramRun(object):
+    """
+    Runs an external program in the background.
+
+    Output of the program is read line by line in background threads and can
+    be fetched with :meth:`poll` (e.g. periodically from a QTimer in the GUI
+    thread) while the program is still running.
+
+    :param args: Program and arguments, as for :class:`subprocess.Popen`.
+    :type input: str
+    :param input: Data to send to the program's stdin.
+    :type timeout: float
+    :param timeout: Seconds after which the program gets killed, checked in
+        :meth:`poll` and :meth:`wait`.
+    """
+    def __init__(self, args, cwd=None, env=None, input=None, timeout=None,
+                 shell=False):
+        self.timeout = timeout
+        self.cancelled = False
+        self.timed_out = False
+        self._stdout = []
+        self._stderr = []
+        self._output = Queue.Queue()
+        self._starttime = time.time()
+        if input is None:
+            stdin = None
+        else:
+            stdin = subprocess.PIPE
+        self._process = subprocess.Popen(
+            args, cwd=cwd, env=env, shell=shell, stdin=stdin,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._threads = [
+            threading.Thread(target=self._read,
+                             args=(self._process.stdout, "stdout")),
+            threading.Thread(target=self._read,
+                             args=(self._process.stderr, "stderr"))]
+        if input is not None:
+            self._threads.append(
+                threading.Thread(target=self._write, args=(input,)))
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def _read(self, fh, name):
+        for line in iter(fh.readline, ""):
+            self._output.put((name, line))
+        fh.close()
+
+    def _write(self, input):
+        try:
+            self._process.stdin.write(input)
+            self._process.stdin.close()
+        except IOError:
+            # program exited (or was killed) before reading all input
+            pass
+
+    def _check_timeout(self):
+        if self.timeout and self._process.poll() is None and \
+                time.time() - self._starttime > self.timeout:
+            self.timed_out = True
+            self.cancel()
+
+    def poll(self):
+        """
+        Returns output lines received since last call as a list of
+        ``(stream, line)`` tuples with stream either ``"stdout"`` or
+        ``"stderr"``. Kills the program if it exceeded the timeout.
+        """
+        self._check_timeout()
+        lines = []
+        while True:
+            try:
+                name, line = self._output.get_nowait()
+            except Queue.Empty:
+                break
+            if name == "stdout":
+                self._stdout.append(line)
+            else:
+                self._stderr.append(line)
+            lines.append((name, line))
+        return lines
+
+    @property
+    def done(self):
+        """
+        Whether the program exited and all of its output was fetched.
+        """
+        if self._process.poll() is None:
+            return False
+        if any(thread.is_alive() for thread in self._threads):
+            return False
+        return self._output.empty()
+
+    def cancel(self):
+        """
+        Kill the program.
+        """
+        self.cancelled = True
+        try:
+            self._process.kill()
+        except OSError:
+            # already exited
+            pass
+
+    def wait(self):
+        """
+        Block until the program exited (or was killed after the timeout).
+        Returns the program's return code.
+        """
+        for thread in self._threads:
+            while thread.is_alive():
+                thread.join(0.1)
+                self._check_timeout()
+        self._process.wait()
+        self.poll()
+        return self.returncode
+
+    @property
+    def returncode(self):
+        return self._process.returncode
+
+    @property
+    def stdout(self):
+        return "".join(self._stdout)
+
+    @property
+    def stderr(self):
+        return "".join(self._stderr)
+
+
+class LRUCache(object):
+    """
+    Simple dictionary-like cache that holds at most `size` items, dropping
+    the least recently used ones.
+    """
+    def __init__(self, size=10):
+        self.size = size
+        self._items = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            return default
+        self._items[key] = value
+        return value
+
+    def put(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = value
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DiskCache(object):
+    """
+    Dictionary-like cache of picklable values in a directory on disk, that
+    can be shared by several processes. Values are written atomically, so
+    readers never see partially written entries.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by another process in the meantime
+                if not os.path.isdir(directory):
+                    raise
+
+    def _filename(self, key):
+        return os.path.join(self.directory,
+                            hashlib.md5(key).hexdigest() + ".pickle")
+
+    def get(self, key, default=None):
+        try:
+            with open(self._filename(key), "rb") as fh:
+                return cPickle.load(fh)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            return default
+
+    def put(self, key, value):
+        fd, tmp_filename = tempfile.mkstemp(dir=self.directory,
+                                            suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                cPickle.dump(value, fh, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_filename, self._filename(key))
+        except:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
+
+    def __contains__(self, key):
+        return os.path.isfile(self._filename(key))
@@ -15,11 +15,13 @@ INSTALL_REQUIRES = [
 ENTRY_POINTS = {
     'console_scripts': [
         'obspyck = obspyck.obspyck:main',
+        'obspyck-batch = obspyck.batch:main',
         ]
     }
 PACKAGE_DATA = {
     'obspyck': ['example.cfg', 'obspyck.gif', 'obspyck_16x16.gif',
-                'obspyck_24x24.gif', 'obspyck_32x32.gif', 'obspyck_48x48.gif']}
+                'obspyck_24x24.gif', 'obspyck_32x32.gif', 'obspyck_48x48.gif'],
+    'obspyck.tests': ['data/*']}
 
 SETUP_DIRECTORY = os.path.dirname(os.path.abspath(inspect.getfile(
     inspect.currentframe())))